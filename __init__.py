@@ -1,8 +1,7 @@
 """Code Review Evaluator - A tool for analyzing code review comments from different AI models"""
 
-from .github.api import GitHubAPI
-from .analyzers.gemini import GeminiAnalyzer
-from .visualization.visualizer import ResultsVisualizer
+import importlib
+
 from .models import ReviewComment, PRDiff, CommentAnalysis, ReviewCommentResponse
 
 __version__ = "0.1.0"
@@ -15,3 +14,24 @@ __all__ = [
     'CommentAnalysis',
     'ReviewCommentResponse'
 ]
+
+# Heavy components (aiohttp, google-generativeai, pandas/matplotlib) are only
+# imported on first attribute access so importing the package stays cheap
+_LAZY_ATTRIBUTES = {
+    'GitHubAPI': '.github.api',
+    'GeminiAnalyzer': '.analyzers.gemini',
+    'ResultsVisualizer': '.visualization.visualizer',
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRIBUTES:
+        module = importlib.import_module(_LAZY_ATTRIBUTES[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_ATTRIBUTES))
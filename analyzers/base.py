@@ -7,7 +7,7 @@ class BaseAnalyzer(ABC):
     
     @abstractmethod
     async def analyze_diff(self, diff: PRDiff) -> List[ReviewComment]:
-        """Analyze a PR diff to find potential issues"""
+        """Analyze a PR diff to find potential issues; raises if the analysis failed"""
         pass
 
     @abstractmethod
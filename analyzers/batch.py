@@ -0,0 +1,320 @@
+"""
+Offline batch submission for diff analysis and categorization.
+
+Instead of one synchronous LLM call per request, every prompt for a stage is
+written to a JSONL job file, submitted to a provider batch interface, and the
+results are ingested back by request key once the job has finished. Jobs are
+tracked in `<run_dir>/batch/`, so submitting and collecting can happen in
+separate processes (e.g. a nightly submit and a morning collect).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import logging
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, TYPE_CHECKING
+
+from .metrics import MetricsAccumulator
+
+if TYPE_CHECKING:
+    from .gemini import GeminiAnalyzer
+    from utils.run_store import RunStore
+
+logger = logging.getLogger(__name__)
+
+BATCH_STAGES = ('diffs', 'categorize')
+
+# Normalized job states
+PENDING, RUNNING, SUCCEEDED, FAILED = 'pending', 'running', 'succeeded', 'failed'
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+def _prompt_hash(prompt: str) -> str:
+    return hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+
+
+def write_job_file(path: str, requests: Iterable[Tuple[str, str]]) -> int:
+    """Write (key, prompt) pairs as Gemini batch request lines; returns the request count"""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for key, prompt in requests:
+            f.write(json.dumps({
+                'key': key,
+                'request': {
+                    'contents': [{'role': 'user', 'parts': [{'text': prompt}]}],
+                    'generation_config': {'response_mime_type': 'application/json'}
+                }
+            }) + '\n')
+            count += 1
+    return count
+
+
+def read_result_file(path: str) -> Dict[str, Optional[str]]:
+    """Map request key to response text (None for requests that failed)"""
+    results = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get('response')
+            if not response or record.get('error'):
+                logger.warning(f"Batch request {record.get('key')} failed: {record.get('error') or record.get('status')}")
+                results[record['key']] = None
+                continue
+
+            candidates = response.get('candidates') or [{}]
+            parts = (candidates[0].get('content') or {}).get('parts') or []
+            results[record['key']] = ''.join(part.get('text', '') for part in parts)
+    return results
+
+
+class BatchBackend(ABC):
+    """A provider batch interface"""
+
+    name = 'batch'
+
+    @abstractmethod
+    def submit(self, job_path: str, display_name: str) -> str:
+        """Upload a job file and start the job; returns the provider's job ID"""
+
+    @abstractmethod
+    def status(self, job_id: str) -> str:
+        """One of pending, running, succeeded, failed"""
+
+    @abstractmethod
+    def download_results(self, job_id: str, dest_path: str):
+        """Write the job's JSONL results to dest_path"""
+
+
+class GeminiBatchBackend(BatchBackend):
+    """Gemini Batch API via the google-genai SDK"""
+
+    name = 'gemini'
+
+    _STATES = {
+        'JOB_STATE_PENDING': PENDING,
+        'JOB_STATE_QUEUED': PENDING,
+        'JOB_STATE_RUNNING': RUNNING,
+        'JOB_STATE_SUCCEEDED': SUCCEEDED,
+        'JOB_STATE_FAILED': FAILED,
+        'JOB_STATE_CANCELLED': FAILED,
+        'JOB_STATE_EXPIRED': FAILED,
+    }
+
+    def __init__(self, api_key: str, model: str):
+        try:
+            from google import genai
+        except ImportError as e:
+            raise RuntimeError("The Gemini batch backend requires the google-genai package") from e
+
+        self.client = genai.Client(api_key=api_key)
+        self.model = model
+
+    def submit(self, job_path: str, display_name: str) -> str:
+        uploaded = self.client.files.upload(
+            file=job_path, config={'display_name': display_name, 'mime_type': 'jsonl'}
+        )
+        job = self.client.batches.create(model=self.model, src=uploaded.name, config={'display_name': display_name})
+        return job.name
+
+    def status(self, job_id: str) -> str:
+        state = self.client.batches.get(name=job_id).state
+        return self._STATES.get(getattr(state, 'name', str(state)), RUNNING)
+
+    def download_results(self, job_id: str, dest_path: str):
+        job = self.client.batches.get(name=job_id)
+        content = self.client.files.download(file=job.dest.file_name)
+        with open(dest_path, 'wb') as f:
+            f.write(content)
+
+
+class LocalBatchBackend(BatchBackend):
+    """Stand-in that runs each request through a synchronous `respond(prompt)` call.
+
+    The whole job runs at submit time and results are kept in `work_dir` in the
+    same format the Gemini Batch API produces, so collection and ingestion
+    behave exactly as with a real provider.
+    """
+
+    name = 'local'
+
+    def __init__(self, work_dir: str, respond: Callable[[str], str]):
+        self.work_dir = work_dir
+        self.respond = respond
+        os.makedirs(work_dir, exist_ok=True)
+
+    def submit(self, job_path: str, display_name: str) -> str:
+        job_id = f"local-{int(time.time() * 1000)}"
+        with open(job_path, 'r', encoding='utf-8') as src, \
+                open(self._output_path(job_id), 'w', encoding='utf-8') as dest:
+            for line in src:
+                record = json.loads(line)
+                prompt = ''.join(part['text'] for part in record['request']['contents'][0]['parts'])
+                try:
+                    response = {'candidates': [{'content': {'parts': [{'text': self.respond(prompt)}]}}]}
+                    dest.write(json.dumps({'key': record['key'], 'response': response}) + '\n')
+                except Exception as e:
+                    dest.write(json.dumps({'key': record['key'], 'error': {'message': str(e)}}) + '\n')
+        return job_id
+
+    def status(self, job_id: str) -> str:
+        return SUCCEEDED if os.path.exists(self._output_path(job_id)) else FAILED
+
+    def download_results(self, job_id: str, dest_path: str):
+        with open(self._output_path(job_id), 'rb') as src, open(dest_path, 'wb') as dest:
+            dest.write(src.read())
+
+    def _output_path(self, job_id: str) -> str:
+        return os.path.join(self.work_dir, f"{job_id}.results.jsonl")
+
+
+class OfflineBatchJob:
+    """Prepares, submits, polls and ingests one batch job per stage in a run directory.
+
+    `build_analyzer` is called for every planning pass: pre-classifier audit
+    sampling is seeded, so a fresh analyzer rebuilds exactly the batches that
+    were submitted and results can be matched back to them by key.
+    """
+
+    def __init__(self, store: 'RunStore', build_analyzer: Callable[[], 'GeminiAnalyzer'], backend: BatchBackend):
+        self.store = store
+        self.build_analyzer = build_analyzer
+        self.backend = backend
+        self.batch_dir = os.path.join(store.run_dir, 'batch')
+        os.makedirs(self.batch_dir, exist_ok=True)
+
+    def submit(self, stage: str) -> dict:
+        """Write the stage's prompts to a job file and submit it"""
+        requests = self._diff_requests() if stage == 'diffs' else self._categorization_requests()
+        if not requests:
+            raise ValueError(f"Nothing to submit for stage {stage!r}")
+
+        job_path = self._path(stage, 'jsonl')
+        count = write_job_file(job_path, requests)
+        job_id = self.backend.submit(job_path, f"code-review-evals-{stage}")
+
+        state = {
+            'stage': stage,
+            'backend': self.backend.name,
+            'job_id': job_id,
+            'submitted_at': time.time(),
+            'requests': {key: _prompt_hash(prompt) for key, prompt in requests},
+        }
+        self._write_state(stage, state)
+        logger.info(f"Submitted {count} {stage} requests as batch job {job_id}")
+        return state
+
+    def load_state(self, stage: str) -> Optional[dict]:
+        path = self._path(stage, 'state.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def wait(self, stage: str, poll_interval: float = 60.0, timeout: Optional[float] = None) -> str:
+        """Poll the job until it finishes (or the timeout passes); returns its last status"""
+        state = self._require_state(stage)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            status = await asyncio.to_thread(self.backend.status, state['job_id'])
+            if status in FINISHED_STATES or (deadline is not None and time.monotonic() >= deadline):
+                return status
+            logger.info(f"Batch job {state['job_id']} is {status}; checking again in {poll_interval:.0f}s")
+            await asyncio.sleep(poll_interval)
+
+    async def ingest(self, stage: str) -> Optional[Dict]:
+        """Download a finished job's results and feed them back into the run.
+
+        Diff findings are saved as 'gemini' comments; categorization returns
+        results in the same shape as `analyze_comment_quality_in_batch`.
+        """
+        state = self._require_state(stage)
+        results_path = self._path(stage, 'results.jsonl')
+        await asyncio.to_thread(self.backend.download_results, state['job_id'], results_path)
+        responses = read_result_file(results_path)
+
+        if stage == 'diffs':
+            self._ingest_diffs(state, responses)
+            return None
+        return self._ingest_categorization(state, responses)
+
+    def _diff_requests(self) -> List[Tuple[str, str]]:
+        analyzer = self.build_analyzer()
+        return [
+            (f"diff-{pr_number}", analyzer.diff_analysis_prompt(self.store.load_diff(pr_number)))
+            for pr_number in self.store.diff_pr_numbers()
+        ]
+
+    def _categorization_requests(self) -> List[Tuple[str, str]]:
+        return [(key, prompt) for key, prompt, _ in self._plan(self.build_analyzer(), MetricsAccumulator())[0]]
+
+    def _plan(self, analyzer: 'GeminiAnalyzer', accumulator: MetricsAccumulator):
+        """Rebuild the categorization batches; keys and prompts are stable for unchanged comments"""
+        entries = analyzer.index_comments(list(self.store.iter_comments()))
+        batches, audits = analyzer.plan_batches(entries, accumulator)
+
+        planned, ordinals = [], {}
+        for bot_name, pr_number, batch in batches:
+            ordinal = ordinals.get((bot_name, pr_number), 0)
+            ordinals[(bot_name, pr_number)] = ordinal + 1
+            prompt = analyzer.batch_prompt(bot_name, pr_number, batch)
+            planned.append((f"cat-{bot_name}-{pr_number}-{ordinal}", prompt, batch))
+        return planned, audits
+
+    def _ingest_diffs(self, state: dict, responses: Dict[str, Optional[str]]):
+        analyzer = self.build_analyzer()
+        saved = 0
+        for key, text in responses.items():
+            if text is None or key not in state['requests']:
+                continue
+            pr_number = int(key[len('diff-'):])
+            self.store.save_comments(pr_number, 'gemini', analyzer.parse_diff_response(text, pr_number))
+            saved += 1
+        logger.info(f"Ingested Gemini findings for {saved} of {len(state['requests'])} diffs")
+
+    def _ingest_categorization(self, state: dict, responses: Dict[str, Optional[str]]) -> Dict:
+        analyzer = self.build_analyzer()
+        accumulator = MetricsAccumulator()
+        planned, audits = self._plan(analyzer, accumulator)
+
+        for key, prompt, batch in planned:
+            text = responses.get(key)
+            if state['requests'].get(key) != _prompt_hash(prompt):
+                # Comments changed since submission; this batch no longer matches its prompt
+                accumulator.add_stat('batch', 'stale')
+                continue
+            if text is None:
+                accumulator.add_stat('batch', 'missing')
+                continue
+
+            missing = analyzer.record_batch_results(
+                accumulator, analyzer.parse_categorization_response(text), batch, audits
+            )
+            accumulator.add_stat('batch', 'ingested')
+            if missing:
+                # No follow-up requests offline; these are left for a later interactive categorize
+                accumulator.add_stat('batch', 'unclassified_comments', len(missing))
+
+        results = analyzer.collect_results(accumulator)
+        logger.info(f"Batch ingestion stats: {results.get('batch', {})}")
+        return results
+
+    def _require_state(self, stage: str) -> dict:
+        state = self.load_state(stage)
+        if state is None:
+            raise ValueError(f"No submitted {stage} batch job in {self.batch_dir}")
+        return state
+
+    def _write_state(self, stage: str, state: dict):
+        path = self._path(stage, 'state.json')
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _path(self, stage: str, suffix: str) -> str:
+        return os.path.join(self.batch_dir, f"{stage}.{suffix}")
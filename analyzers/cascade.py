@@ -0,0 +1,91 @@
+"""
+Two-tier comment categorization.
+
+A cheap, fast model classifies every comment and says how confident it is.
+Only the comments it is unsure about, plus those it labels with a category
+where mistakes are costly (CRITICAL_BUG by default), are sent again to a
+stronger model, whose answer replaces the cheap one. Most comments are
+settled by the cheap model, so the strong model's accuracy is spent where it
+changes the metrics.
+"""
+
+import logging
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+TIERS = ('cheap', 'strong')
+
+
+class ModelCascade:
+    CHEAP_MODEL = "gemini-1.5-flash-8b"
+    STRONG_MODEL = "gemini-1.5-pro-002"
+
+    def __init__(self, cheap_model: Optional[str] = None, strong_model: Optional[str] = None,
+                 confidence_threshold: float = 0.7, escalate_categories: Iterable[str] = ('CRITICAL_BUG',)):
+        if not 0.0 <= confidence_threshold <= 1.0:
+            raise ValueError(f"confidence_threshold must be between 0 and 1, got {confidence_threshold}")
+        self.cheap_model = cheap_model or self.CHEAP_MODEL
+        self.strong_model = strong_model or self.STRONG_MODEL
+        self.confidence_threshold = confidence_threshold
+        self.escalate_categories = frozenset(escalate_categories)
+
+        self._tiers = {tier: defaultdict(int) for tier in TIERS}
+        self._escalations = defaultdict(int)
+        self._outcomes = defaultdict(int)
+        self._changes = defaultdict(int)
+
+    def model_name(self, tier: str) -> str:
+        return self.cheap_model if tier == 'cheap' else self.strong_model
+
+    def escalation_reason(self, result: Dict[str, Any]) -> Optional[str]:
+        """Why a cheap-tier classification needs a second opinion, or None if it can stand"""
+        if result['category'] in self.escalate_categories:
+            return 'category'
+        try:
+            confidence = float(result.get('confidence'))
+        except (TypeError, ValueError):
+            return 'no_confidence'
+        if confidence < self.confidence_threshold:
+            return 'low_confidence'
+        return None
+
+    def record_call(self, tier: str, comments: int, response: Any):
+        stats = self._tiers[tier]
+        stats['calls'] += 1
+        stats['comments'] += comments
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            stats['prompt_tokens'] += getattr(usage, 'prompt_token_count', 0) or 0
+            stats['output_tokens'] += getattr(usage, 'candidates_token_count', 0) or 0
+
+    def record_failure(self, tier: str):
+        self._tiers[tier]['failures'] += 1
+
+    def record_escalation(self, reason: str):
+        self._escalations[reason] += 1
+
+    def record_outcome(self, cheap_category: Optional[str], strong_category: Optional[str]):
+        """Tally whether the strong model kept the cheap model's category; None means it gave no answer"""
+        if strong_category is None:
+            self._outcomes['unanswered'] += 1
+        elif strong_category == cheap_category:
+            self._outcomes['confirmed'] += 1
+        else:
+            self._outcomes['overturned'] += 1
+            self._changes[f"{cheap_category}->{strong_category}"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        classified = self._tiers['cheap']['comments']
+        escalated = sum(self._escalations.values())
+        return {
+            'models': {tier: self.model_name(tier) for tier in TIERS},
+            'confidence_threshold': self.confidence_threshold,
+            'tiers': {tier: dict(stats) for tier, stats in self._tiers.items()},
+            'escalated': escalated,
+            'escalation_ratio': escalated / classified if classified else 0.0,
+            'escalation_reasons': dict(self._escalations),
+            **{outcome: self._outcomes[outcome] for outcome in ('confirmed', 'overturned', 'unanswered')},
+            'changes': dict(self._changes),
+        }
@@ -7,6 +7,7 @@ from typing import List, Dict
 from .base import BaseReviewAnalyzer
 from ..github.api import ReviewComment, PRDiff
 from ..utils.rate_limiter import RateLimiter, make_api_call_with_backoff
+from prompts import CLAUDE_PROMPTS, PromptTemplate
 
 logger = logging.getLogger(__name__)
 
@@ -15,45 +16,22 @@ class ClaudeReviewAnalyzer(BaseReviewAnalyzer):
         self.client = anthropic.Anthropic(api_key=api_key)
         self.rate_limiter = RateLimiter(requests_per_minute)
 
-    async def analyze_diff(self, diff: PRDiff) -> List[ReviewComment]:
-        """Analyze a PR diff using Claude"""
-        prompt = """You are a senior staff principle engineer performing a security and functionality focused code review.
-        Analyze this PR diff for potential bugs and issues:
-
-        {diff}
-
-        Focus on identifying serious issues that could cause:
-        1. Runtime errors or crashes
-        2. Race conditions
-        3. Memory leaks
-        4. State management issues
-        5. Security vulnerabilities
-        6. Data loss or corruption
-        7. Performance issues
-        8. Resource leaks
-
-        For each issue found, provide detailed analysis following this structure:
-        {
-            "description": "Clear explanation of the bug and its impact",
-            "severity": "HIGH|MEDIUM|LOW",
-            "category": "SECURITY|RACE_CONDITION|MEMORY_LEAK|PERFORMANCE|CRASH",
-            "file": "affected_file.ext",
-            "lines": "line numbers",
-            "code": "relevant code snippet",
-            "fix": "suggested fix approach"
+    @staticmethod
+    def _cached_prompt_request(template: PromptTemplate, **kwargs) -> dict:
+        """Message arguments with the static prompt prefix marked for Anthropic prompt caching"""
+        return {
+            "system": [{"type": "text", "text": template.prefix, "cache_control": {"type": "ephemeral"}}],
+            "messages": [{"role": "user", "content": template.suffix.format(**kwargs)}]
         }
 
-        Only include serious technical issues that could affect runtime behavior or security."""
-
+    async def analyze_diff(self, diff: PRDiff) -> List[ReviewComment]:
+        """Analyze a PR diff using Claude"""
         try:
             def make_api_call():
                 return self.client.messages.create(
                     model="claude-3-opus-20240229",
                     max_tokens=4096,
-                    messages=[{
-                        "role": "user",
-                        "content": prompt.format(diff=diff.diff_content)
-                    }]
+                    **self._cached_prompt_request(CLAUDE_PROMPTS["diff_analysis"], diff=diff.diff_content)
                 )
 
             response = await make_api_call_with_backoff(make_api_call)
@@ -81,7 +59,7 @@ class ClaudeReviewAnalyzer(BaseReviewAnalyzer):
 
         except Exception as e:
             logger.error(f"Error analyzing diff with Claude: {str(e)}")
-            return []
+            raise
 
     async def analyze_comment_quality(self, comments: List[ReviewComment]) -> Dict[str, Dict[str, float]]:
         """Analyze the quality of bot comments using Claude"""
@@ -97,23 +75,6 @@ class ClaudeReviewAnalyzer(BaseReviewAnalyzer):
         for comment in comments:
             bot_pr_comments[comment.bot_name][comment.pr_number].append(comment)
 
-        categorization_prompt = """Analyze these code review comments and categorize each as either:
-            1. CRITICAL_BUG: Comments identifying serious technical issues
-            2. NITPICK: Minor style/formatting suggestions
-            3. OTHER: General feedback or questions
-
-            PR #{pr_number} comments from {bot_name}:
-            {comments}
-
-            Respond with a JSON array of objects:
-            [
-                {
-                    "comment_index": number,
-                    "category": "CRITICAL_BUG|NITPICK|OTHER",
-                    "reasoning": "Brief explanation"
-                }
-            ]"""
-
         for bot_name, pr_comments in bot_pr_comments.items():
             for pr_number, comment_list in pr_comments.items():
                 try:
@@ -126,14 +87,12 @@ class ClaudeReviewAnalyzer(BaseReviewAnalyzer):
                         return self.client.messages.create(
                             model="claude-3-opus-20240229",
                             max_tokens=4096,
-                            messages=[{
-                                "role": "user",
-                                "content": categorization_prompt.format(
-                                    pr_number=pr_number,
-                                    bot_name=bot_name,
-                                    comments=formatted_comments
-                                )
-                            }]
+                            **self._cached_prompt_request(
+                                CLAUDE_PROMPTS["comment_categorization"],
+                                pr_number=pr_number,
+                                bot_name=bot_name,
+                                comments=formatted_comments
+                            )
                         )
 
                     response = await make_api_call_with_backoff(make_api_call)
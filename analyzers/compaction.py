@@ -0,0 +1,220 @@
+import re
+import logging
+from typing import Dict, List, Optional, Pattern, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+_HTML_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_HUNK_HEADER = re.compile(r'^@@ -(\d+)(?:,\d+)? \+(\d+)(?:,\d+)? @@')
+_BLANK_RUNS = re.compile(r'\n{3,}')
+
+# Collapsible <details> sections that only restate the comment for other tools
+DEFAULT_BOILERPLATE_DETAILS = (
+    r'prompt for ai agents',
+    r'learnings used',
+)
+
+# Lines stripped from the end of a comment, checked repeatedly until none match
+DEFAULT_FOOTER_PATTERNS = (
+    r'^\s*(-{3,}|\*{3,}|_{3,})\s*$',
+    r'^[\s_*]*was this (comment |suggestion |review )?helpful\?.*$',
+    r'^.*\breact with 👍.*$',
+    r'^\s*<sub>.*</sub>\s*$',
+    r'^.*\breply with @[\w-]+.*$',
+    r'^[\s_*(\[]*(powered|generated|reviewed) by \[?[\w .-]+\]?(\([^)]*\))?[\s_*)\]]*$',
+)
+
+# Files whose diff body says nothing about runtime behavior
+DEFAULT_GENERATED_FILES = (
+    r'(^|/)(package-lock\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|Cargo\.lock|Gemfile\.lock|go\.sum|composer\.lock)$',
+    r'\.min\.(js|css)$',
+    r'\.map$',
+)
+
+
+def _tokens(text: str) -> int:
+    # Same ~4 characters per token approximation as the scheduler's cost estimates
+    return len(text) // 4
+
+
+class PromptCompactor:
+    """Shrinks diffs and review comments before they are embedded in prompts.
+
+    Comments lose HTML comments, boilerplate <details> sections and bot
+    footers, and their diff hunks are trimmed to `hunk_window` lines around
+    the commented lines (GitHub's hunk ends at the commented line). Diffs lose
+    trailing whitespace on unchanged lines and `index` lines, runs of
+    unchanged context longer than `diff_context` lines on either side of a
+    change are collapsed into a marker naming the line where the hunk
+    resumes, and the bodies of deleted and generated files (lockfiles,
+    minified bundles) are replaced with a one-line summary. Stored comments
+    and diffs are never modified, only the text sent to the LLM.
+    """
+
+    def __init__(self, hunk_window: int = 6, diff_context: int = 3,
+                 footer_patterns: Optional[Tuple[str, ...]] = None,
+                 boilerplate_details: Optional[Tuple[str, ...]] = None,
+                 generated_files: Optional[Tuple[str, ...]] = None):
+        self.hunk_window = hunk_window
+        self.diff_context = diff_context
+        self.footer_patterns: List[Pattern] = [
+            re.compile(pattern, re.IGNORECASE) for pattern in (footer_patterns or DEFAULT_FOOTER_PATTERNS)
+        ]
+        summaries = '|'.join(boilerplate_details or DEFAULT_BOILERPLATE_DETAILS)
+        self.boilerplate_details = re.compile(
+            rf'<details>\s*<summary>[^<]*({summaries})[^<]*</summary>.*?</details>', re.IGNORECASE | re.DOTALL
+        )
+        self.generated_files: List[Pattern] = [
+            re.compile(pattern) for pattern in (generated_files or DEFAULT_GENERATED_FILES)
+        ]
+        self._counts = {'diffs': 0, 'comments': 0, 'hunks': 0, 'tokens_before': 0, 'tokens_after': 0}
+
+    def compact_comment(self, text: str) -> str:
+        text = text or ''
+        compacted = self.boilerplate_details.sub('', _HTML_COMMENT.sub('', text))
+        lines = [line.rstrip() for line in compacted.split('\n')]
+        while lines and (not lines[-1] or any(pattern.match(lines[-1]) for pattern in self.footer_patterns)):
+            lines.pop()
+        compacted = _BLANK_RUNS.sub('\n\n', '\n'.join(lines)).strip()
+
+        self._count('comments', text, compacted)
+        return compacted
+
+    def compact_hunk(self, chunk: str, line_nums: str) -> str:
+        """Keep the hunk header and the lines within `hunk_window` of the commented lines"""
+        chunk = chunk or ''
+        lines = chunk.rstrip('\n').split('\n')
+        header = _HUNK_HEADER.match(lines[0]) if lines else None
+        body = lines[1:] if header else lines
+        if len(body) <= 2 * self.hunk_window + 1:
+            compacted = '\n'.join(self._rstrip_diff_line(line) for line in lines)
+            self._count('hunks', chunk, compacted)
+            return compacted
+
+        targets = {len(body) - 1} | self._matching_lines(body, header, line_nums)
+        keep = {
+            i for target in targets
+            for i in range(max(0, target - self.hunk_window), min(len(body), target + self.hunk_window + 1))
+        }
+        compacted_lines = [lines[0]] if header else []
+        compacted_lines.extend(self._with_omissions(body, keep, 'lines', self._new_line_numbers(body, header)))
+        compacted = '\n'.join(compacted_lines)
+
+        self._count('hunks', chunk, compacted)
+        return compacted
+
+    def compact_diff(self, diff_content: str) -> str:
+        diff_content = diff_content or ''
+        sections, current = [], []
+        for line in diff_content.split('\n'):
+            if line.startswith('diff --git ') and current:
+                sections.append(current)
+                current = []
+            current.append(line)
+        if current:
+            sections.append(current)
+
+        compacted = '\n'.join(line for section in sections for line in self._compact_file(section)).rstrip('\n')
+        self._count('diffs', diff_content, compacted)
+        return compacted
+
+    def stats(self) -> Dict[str, float]:
+        before, after = self._counts['tokens_before'], self._counts['tokens_after']
+        return {
+            **self._counts,
+            'tokens_saved': before - after,
+            'saved_ratio': (before - after) / before if before else 0.0,
+        }
+
+    def _compact_file(self, lines: List[str]) -> List[str]:
+        hunk_start = next((i for i, line in enumerate(lines) if line.startswith('@@')), len(lines))
+        header = [line.rstrip() for line in lines[:hunk_start] if not line.startswith('index ')]
+        body = lines[hunk_start:]
+        changed = sum(1 for line in body if line.startswith(('+', '-')))
+
+        path = lines[0].split(' b/', 1)[-1] if lines and lines[0].startswith('diff --git ') else ''
+        if body and any(line.startswith('deleted file mode') for line in header):
+            return header + [f"... (file deleted; {changed} removed lines omitted)"]
+        if body and path and any(pattern.search(path) for pattern in self.generated_files):
+            return header + [f"... (generated file; {changed} changed lines omitted)"]
+
+        compacted = header
+        hunk_header = None
+        hunk: List[str] = []
+        for line in body:
+            if line.startswith('@@'):
+                compacted.extend(self._compact_hunk_context(hunk, hunk_header))
+                compacted.append(line)
+                hunk_header, hunk = _HUNK_HEADER.match(line), []
+            elif not line.startswith('\\'):
+                # "\ No newline at end of file" markers carry no meaning for review
+                hunk.append(self._rstrip_diff_line(line))
+        compacted.extend(self._compact_hunk_context(hunk, hunk_header))
+        return compacted
+
+    def _compact_hunk_context(self, hunk: List[str], header) -> List[str]:
+        """Collapse unchanged lines further than diff_context from any change"""
+        changes = [i for i, line in enumerate(hunk) if line.startswith(('+', '-'))]
+        if not changes:
+            return hunk
+        keep = {
+            i for change in changes
+            for i in range(max(0, change - self.diff_context), min(len(hunk), change + self.diff_context + 1))
+        }
+        return list(self._with_omissions(hunk, keep, 'unchanged lines', self._new_line_numbers(hunk, header)))
+
+    @staticmethod
+    def _with_omissions(lines: List[str], keep: Set[int], noun: str, line_numbers: Optional[List[int]] = None):
+        """The kept lines, with a marker for each omitted run.
+
+        Given the new-file line number at each position, a marker followed by
+        more lines says where they resume, so the LLM can still report line
+        numbers without counting across the gap.
+        """
+        omitted = 0
+        for i, line in enumerate(lines):
+            if i in keep:
+                if omitted:
+                    resumes = f"; resumes at line {line_numbers[i]}" if line_numbers else ''
+                    yield f"... ({omitted} {noun} omitted{resumes})"
+                    omitted = 0
+                yield PromptCompactor._rstrip_diff_line(line)
+            else:
+                omitted += 1
+        if omitted:
+            yield f"... ({omitted} {noun} omitted)"
+
+    @staticmethod
+    def _new_line_numbers(body: List[str], header) -> Optional[List[int]]:
+        """New-file line number at each hunk line; a removed line gets the number of the line after it"""
+        if not header:
+            return None
+        numbers = []
+        new_line = int(header.group(2))
+        for line in body:
+            numbers.append(new_line)
+            if not line.startswith('-'):
+                new_line += 1
+        return numbers
+
+    @staticmethod
+    def _matching_lines(body: List[str], header, line_nums: str) -> Set[int]:
+        """Positions of hunk lines whose new-file line number appears in line_nums"""
+        numbers = {int(n) for n in re.findall(r'\d+', line_nums or '')}
+        if not header or not numbers:
+            return set()
+        line_numbers = PromptCompactor._new_line_numbers(body, header)
+        return {i for i, line in enumerate(body) if not line.startswith('-') and line_numbers[i] in numbers}
+
+    @staticmethod
+    def _rstrip_diff_line(line: str) -> str:
+        # Only unchanged context: on +/- lines trailing whitespace may be the change itself
+        if not line.startswith(' '):
+            return line
+        # Keep the space marker of whitespace-only lines
+        return ' ' + line[1:].rstrip()
+
+    def _count(self, kind: str, before: str, after: str):
+        self._counts[kind] += 1
+        self._counts['tokens_before'] += _tokens(before)
+        self._counts['tokens_after'] += _tokens(after)
@@ -0,0 +1,128 @@
+import re
+import zlib
+import hashlib
+import logging
+from collections import defaultdict
+from typing import Dict, List
+
+import numpy as np
+
+from models import ReviewComment
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime used for the universal hash family; keeps a*x+b inside uint64
+_PRIME = (1 << 31) - 1
+
+
+class CommentDeduplicator:
+    """Clusters exact and near-duplicate comments so only one per cluster is classified.
+
+    Exact duplicates are found by hashing normalized text. The remaining unique
+    texts are compared with MinHash signatures over character shingles, using
+    LSH banding to find candidate pairs which are then verified against the
+    Jaccard threshold.
+    """
+
+    def __init__(self, threshold: float = 0.85, num_perm: int = 64, bands: int = 16,
+                 shingle_size: int = 5, include_chunk: bool = False, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self.include_chunk = include_chunk
+
+        rng = np.random.RandomState(seed)
+        self._a = rng.randint(1, _PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normalize comment text so trivially different copies compare equal"""
+        text = re.sub(r'<!--.*?-->', '', text or '', flags=re.DOTALL)
+        text = text.lower()
+        text = re.sub(r'\d+', '0', text)
+        text = re.sub(r'\s+', ' ', text)
+        return text.strip()
+
+    def cluster(self, comments: List[ReviewComment]) -> List[List[int]]:
+        """Group comment indices into clusters; the first index of each cluster is its representative"""
+        exact_groups: Dict[str, List[int]] = defaultdict(list)
+        texts: Dict[str, str] = {}
+
+        for idx, comment in enumerate(comments):
+            text = comment.comment
+            if self.include_chunk:
+                text = f"{text}\n{comment.chunk}"
+            normalized = self.normalize(text)
+            key = hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+            exact_groups[key].append(idx)
+            texts.setdefault(key, normalized)
+
+        keys = list(exact_groups)
+        parent = list(range(len(keys)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        signatures = np.stack([self._signature(texts[key]) for key in keys]) if keys else None
+        min_matches = int(np.ceil(self.threshold * self.num_perm))
+
+        # LSH banding: keys sharing any band bucket become candidate pairs
+        for band in range(self.bands):
+            buckets = defaultdict(list)
+            start = band * self.rows
+            for i in range(len(keys)):
+                buckets[signatures[i, start:start + self.rows].tobytes()].append(i)
+
+            for bucket in buckets.values():
+                if len(bucket) < 2:
+                    continue
+                # Compare each member against one signature per cluster already seen in the bucket
+                reps = [bucket[0]]
+                for other in bucket[1:]:
+                    root = find(other)
+                    if any(find(rep) == root for rep in reps):
+                        continue
+                    matches = np.count_nonzero(signatures[reps] == signatures[other], axis=1)
+                    best = int(np.argmax(matches))
+                    if matches[best] >= min_matches:
+                        rep_root = find(reps[best])
+                        parent[max(root, rep_root)] = min(root, rep_root)
+                    else:
+                        reps.append(other)
+
+        clusters: Dict[int, List[int]] = defaultdict(list)
+        for i, key in enumerate(keys):
+            clusters[find(i)].extend(exact_groups[key])
+
+        result = [sorted(members) for members in clusters.values()]
+        result.sort(key=lambda members: members[0])
+
+        logger.info(
+            f"Deduplicated {len(comments)} comments into {len(result)} clusters "
+            f"({len(exact_groups)} distinct normalized texts)"
+        )
+        return result
+
+    def _signature(self, text: str) -> np.ndarray:
+        size = self.shingle_size
+        if len(text) <= size:
+            shingles = {text}
+        else:
+            shingles = {text[i:i + size] for i in range(len(text) - size + 1)}
+
+        hashes = np.fromiter(
+            (zlib.crc32(s.encode('utf-8')) & _PRIME for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME
+        return permuted.min(axis=1)
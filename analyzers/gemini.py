@@ -1,129 +1,361 @@
+import asyncio
 import json
 import logging
 from collections import defaultdict
-import google.generativeai as genai
-from typing import List, Dict, Any
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple, TYPE_CHECKING
 
 from .base import BaseAnalyzer
-from models import ReviewComment, PRDiff
-from utils.rate_limiter import RateLimiter, make_api_call_with_backoff
+from .preclassifier import RuleBasedPreClassifier, PreClassification
+from .metrics import MetricsAccumulator
+from models import ReviewComment, PRDiff, IndexedComment
+from utils.rate_limiter import RateLimiter, make_api_call_with_backoff, wait_with_timeout
+from utils.singleflight import SingleFlight, prompt_key
+from utils.json_salvage import IncrementalJSONExtractor, salvage_objects
 from prompts import GEMINI_PROMPTS
 
+if TYPE_CHECKING:
+    from .dedup import CommentDeduplicator
+    from .sampling import StratifiedSampler
+    from .prompt_cache import PromptCache
+    from .compaction import PromptCompactor
+    from utils.hedging import Hedger
+    from .cascade import ModelCascade
+
 logger = logging.getLogger(__name__)
 
+
+class StreamInterrupted(RuntimeError):
+    """A streamed response failed after some of its chunks were handed out.
+
+    Deliberately not recognized as rate limiting or a timeout by
+    make_api_call_with_backoff: replaying the stream would feed the same
+    chunks to the parser twice.
+    """
+
 class GeminiAnalyzer(BaseAnalyzer):
-    def __init__(self, api_key: str, requests_per_minute: int = 60):
+    MODEL_NAME = "gemini-1.5-flash-002"
+    BATCH_SIZE = 25
+    # Follow-up requests for comments a categorization response left out
+    MISSING_RETRIES = 1
+
+    def __init__(self, api_key: str, requests_per_minute: int = 60,
+                 pre_classifier: Optional[RuleBasedPreClassifier] = None,
+                 deduplicator: Optional['CommentDeduplicator'] = None,
+                 sampler: Optional['StratifiedSampler'] = None,
+                 stream: bool = False,
+                 prompt_cache: Optional['PromptCache'] = None,
+                 compactor: Optional['PromptCompactor'] = None,
+                 call_timeout: Optional[float] = 180.0,
+                 hedger: Optional['Hedger'] = None,
+                 model_name: Optional[str] = None,
+                 cascade: Optional['ModelCascade'] = None,
+                 on_issue: Optional[Callable[[ReviewComment], None]] = None,
+                 on_classification: Optional[Callable[[IndexedComment, str, str], None]] = None):
+        # Deferred: the SDK takes ~1s to import and is only needed once an analyzer is built
+        import google.generativeai as genai
+
         genai.configure(api_key=api_key)
-        self.model = genai.GenerativeModel("gemini-1.5-flash-002")
+        self.genai = genai
+        self.model_name = model_name or self.MODEL_NAME
+        self._models: Dict[str, Any] = {}
+        self.model = self._model(self.model_name)
         self.rate_limiter = RateLimiter(requests_per_minute)
+        # Identical prompts issued concurrently (backports, forks, repeated batches) share one call
+        self.single_flight = SingleFlight()
+        self.pre_classifier = pre_classifier
+        self.deduplicator = deduplicator
+        self.sampler = sampler
+        # With stream=True, results are parsed and emitted while the response is still being generated
+        self.stream = stream
+        self.on_issue = on_issue
+        self.on_classification = on_classification
+        # Static prompt prefixes are cached with the provider and only the per-call suffix is sent
+        self.prompt_cache = prompt_cache
+        # Trims diffs, hunks and bot boilerplate from the text embedded in prompts
+        self.compactor = compactor
+        # Seconds before a single LLM call is abandoned and retried; None waits indefinitely
+        self.call_timeout = call_timeout
+        # Duplicates JSON calls that run past the usual tail latency, within a budget
+        self.hedger = hedger
+        # Categorizes with a cheap model first and re-checks uncertain answers with a stronger one
+        self.cascade = cascade
+        if prompt_cache:
+            for template in GEMINI_PROMPTS.values():
+                prompt_cache.register(template.prefix)
 
 
     async def analyze_diff(self, diff: PRDiff) -> List[ReviewComment]:
         """Analyze a PR diff using Gemini"""
 
         try:
-            def make_api_call():
-                logger.info("Make API call")
-                generation_config = genai.GenerationConfig(
-                    response_mime_type="application/json"
-                )
+            logger.info(f"Analyzing diff for PR #{diff.pr_number}")
+            prompt = self.diff_analysis_prompt(diff)
+            logger.debug(f"Prompt: {prompt}")
 
-                print(diff.diff_content)
-                prompt = GEMINI_PROMPTS["diff_analysis"].format(diff=diff.diff_content)
-                logger.info(f"Prompt: {prompt}")
-                return self.model.generate_content(
-                    GEMINI_PROMPTS["diff_analysis"].format(diff=diff.diff_content),
-                    generation_config=generation_config
-                )
+            if self.stream:
+                comments = []
+
+                def on_object(result):
+                    comment = self._issue_to_comment(result, diff.pr_number)
+                    if comment:
+                        comments.append(comment)
+                        if self.on_issue:
+                            self.on_issue(comment)
 
-            response = await make_api_call_with_backoff(make_api_call)
+                await self._generate_objects(prompt, on_object)
+                return comments
+
+            response = await self._generate_json(prompt)
             response_text = response.text if hasattr(response, 'text') else response.parts[0].text
-            
-            # Log the raw response for debugging
-            logger.debug(f"Raw Gemini response: {response_text}")
-            
-            try:
-                parsed_response = json.loads(response_text)
-                # Check if response has 'issues' key
-                if isinstance(parsed_response, dict) and 'issues' in parsed_response:
-                    results = parsed_response['issues']
-                else:
-                    # If no 'issues' key, treat the whole response as the results
-                    results = [parsed_response] if isinstance(parsed_response, dict) else parsed_response
-
-                # Filter out any malformed results
-                valid_results = []
-                for result in results:
-                    if all(key in result for key in ['file_name', 'snippet', 'bug_description', 'line_numbers']):
-                        valid_results.append(result)
-                    else:
-                        logger.warning(f"Skipping malformed result: {result}")
-
-                return [
-                    ReviewComment(
-                        file_name=result['file_name'],
-                        chunk=result['snippet'],
-                        comment=result['bug_description'],
-                        line_nums=result['line_numbers'],
-                        bot_name='gemini',
-                        pr_number=diff.pr_number,
-                    )
-                    for result in valid_results
-                ]
-
-            except json.JSONDecodeError as e:
-                logger.error(f"Failed to parse Gemini response as JSON: {str(e)}")
-                logger.error(f"Response text: {response_text}")
-                return []
+            comments = self.parse_diff_response(response_text, diff.pr_number)
+            if self.on_issue:
+                for comment in comments:
+                    self.on_issue(comment)
+            return comments
 
         except Exception as e:
-            logger.error(f"Error analyzing diff: {str(e)}")
+            # Raised rather than returning no findings, which callers would store as a clean diff
+            logger.error(f"Error analyzing diff for PR #{diff.pr_number}: {str(e)}")
             logger.debug("Full error:", exc_info=True)
-            return []
+            raise
+
+
+    def diff_analysis_prompt(self, diff: PRDiff) -> str:
+        diff_content = self.compactor.compact_diff(diff.diff_content) if self.compactor else diff.diff_content
+        return GEMINI_PROMPTS["diff_analysis"].format(diff=diff_content)
+
+    @staticmethod
+    def parse_diff_response(response_text: str, pr_number: int) -> List[ReviewComment]:
+        """Turn a diff-analysis response into Gemini's review comments"""
+        # Log the raw response for debugging
+        logger.debug(f"Raw Gemini response: {response_text}")
+
+        try:
+            parsed_response = json.loads(response_text)
+            # Check if response has 'issues' key
+            if isinstance(parsed_response, dict) and 'issues' in parsed_response:
+                results = parsed_response['issues']
+            else:
+                # If no 'issues' key, treat the whole response as the results
+                results = [parsed_response] if isinstance(parsed_response, dict) else parsed_response
+
+        except json.JSONDecodeError as e:
+            # Keep every complete issue from a malformed or truncated response
+            results = salvage_objects(response_text)
+            logger.warning(f"Malformed Gemini response ({str(e)}); salvaged {len(results)} issues")
+            logger.debug(f"Response text: {response_text}")
+
+        comments = [GeminiAnalyzer._issue_to_comment(result, pr_number) for result in results]
+        return [comment for comment in comments if comment]
+
+    @staticmethod
+    def _issue_to_comment(result: Any, pr_number: int) -> Optional[ReviewComment]:
+        # Filter out any malformed results
+        if not (isinstance(result, dict) and all(key in result for key in ['file_name', 'snippet', 'bug_description', 'line_numbers'])):
+            logger.warning(f"Skipping malformed result: {result}")
+            return None
+
+        return ReviewComment(
+            file_name=result['file_name'],
+            chunk=result['snippet'],
+            comment=result['bug_description'],
+            line_nums=result['line_numbers'],
+            bot_name='gemini',
+            pr_number=pr_number,
+        )
 
 
     async def analyze_comment_quality_in_batch(self, comments: List[ReviewComment]) -> Dict[str, Dict]:
         """Analyze comments in batches with detailed classification"""
-        BATCH_SIZE = 25
-        
-        bot_metrics = defaultdict(lambda: {
-            'critical_bug_ratio': 0.0,
-            'nitpick_ratio': 0.0,
-            'other_ratio': 0.0,
-            'total_comments': 0
-        })
-        
-        classifications = defaultdict(lambda: defaultdict(list))
+        accumulator = MetricsAccumulator()
+        if not self.sampler:
+            await self.categorize(comments, accumulator)
+            return self.collect_results(accumulator)
+
+        # Classify a stratified sample and report population estimates instead of sample counts
+        estimates = await self.sampler.run(self, self.index_comments(comments), accumulator)
+        results = self.collect_results(accumulator)
+        results['sampling'] = estimates
+        for bot_name, bot_estimate in estimates.items():
+            if bot_name in results['metrics']:
+                for ratio_key in ('critical_bug_ratio', 'nitpick_ratio', 'other_ratio'):
+                    results['metrics'][bot_name][ratio_key] = bot_estimate[ratio_key]['estimate']
+        return results
+
+
+    async def categorize(self, comments: List[ReviewComment], accumulator: MetricsAccumulator):
+        """Classify comments and record them into a (possibly shared) accumulator.
+
+        Every comment of a given bot/PR pair must be passed in the same call so
+        that comment indices stay consistent.
+        """
+        await self.categorize_indexed(self.index_comments(comments), accumulator)
+
+    @staticmethod
+    def index_comments(comments: List[ReviewComment]) -> List[IndexedComment]:
+        """Number each comment by its position within its bot/PR group"""
+        counters = defaultdict(int)
+        indexed = []
+        for comment in comments:
+            group = (comment.bot_name, comment.pr_number)
+            indexed.append(IndexedComment(comment.bot_name, comment.pr_number, counters[group], comment))
+            counters[group] += 1
+        return indexed
+
+    async def categorize_indexed(self, entries: List[IndexedComment], accumulator: MetricsAccumulator):
+        """Classify already-indexed comments, e.g. a sample drawn from a larger population"""
+        batches, audits = self.plan_batches(entries, accumulator)
+
+        for bot_name, pr_number, batch in batches:
+            try:
+                missing = await self._classify_batch(accumulator, bot_name, pr_number, batch, audits)
+
+                # Re-request only the comments the response left out, as a smaller batch
+                for _ in range(self.MISSING_RETRIES):
+                    if not missing:
+                        break
+                    batch = [batch[position] for position in missing]
+                    logger.warning(f"Re-requesting {len(batch)} unclassified comments for {bot_name} PR #{pr_number}")
+                    accumulator.add_stat('salvage', 're_requested', len(batch))
+                    missing = await self._classify_batch(accumulator, bot_name, pr_number, batch, audits)
+
+                if missing:
+                    accumulator.add_stat('salvage', 'unclassified', len(missing))
+
+            except Exception as e:
+                logger.error(f"Error processing batch for {bot_name} PR #{pr_number}: {str(e)}")
+                continue
+
+    async def _classify_batch(
+        self,
+        accumulator: MetricsAccumulator,
+        bot_name: str,
+        pr_number: int,
+        batch: List[List[IndexedComment]],
+        audits: Dict[Tuple[str, int, int], PreClassification]
+    ) -> List[int]:
+        """Classify one batch of clusters; returns the positions left unclassified"""
+        if self.cascade:
+            # Cascaded batches aren't streamed; their results are recorded once the strong tier has answered
+            analysis_results = await self._cascade_batch(bot_name, pr_number, batch)
+            return self.record_batch_results(accumulator, analysis_results, batch, audits)
+
+        if not self.stream:
+            formatted_comments = self._format_comments_for_analysis([cluster[0].comment for cluster in batch])
+            analysis_results = await self._analyze_batch(bot_name, pr_number, formatted_comments)
+            return self.record_batch_results(accumulator, analysis_results, batch, audits)
 
+        # Record each classification as soon as its object is complete in the stream
+        recorded: Set[int] = set()
+        received = 0
+
+        def on_object(result):
+            nonlocal received
+            self._record_result(accumulator, batch, received, result, audits, recorded)
+            received += 1
+
+        await self._generate_objects(self.batch_prompt(bot_name, pr_number, batch), on_object)
+        return [position for position in range(len(batch)) if position not in recorded]
+
+    def plan_batches(
+        self,
+        entries: List[IndexedComment],
+        accumulator: MetricsAccumulator
+    ) -> Tuple[List[Tuple[str, int, List[List[IndexedComment]]]], Dict[Tuple[str, int, int], PreClassification]]:
+        """Label obvious comments and group the rest into LLM batches.
+
+        Pre-classified comments are recorded into the accumulator right away.
+        Returns (bot_name, pr_number, batch) tuples, where each batch is a list
+        of duplicate clusters whose first member is sent to the LLM, along with
+        the audit sample of pre-classified comments. Planning is deterministic,
+        so the same comments always produce the same batches.
+        """
         # Group comments by bot and PR
         bot_pr_comments = defaultdict(lambda: defaultdict(list))
-        for comment in comments:
-            bot_pr_comments[comment.bot_name][comment.pr_number].append(comment)
+        for entry in entries:
+            bot_pr_comments[entry.bot_name][entry.pr_number].append((entry.comment_index, entry.comment))
+
+        pending: List[IndexedComment] = []
+        audits: Dict[Tuple[str, int, int], PreClassification] = {}
 
         for bot_name, pr_comments in bot_pr_comments.items():
-            for pr_number, comment_list in pr_comments.items():
-                for i in range(0, len(comment_list), BATCH_SIZE):
-                    batch = comment_list[i:i + BATCH_SIZE]
-                    
-                    try:
-                        formatted_comments = self._format_comments_for_analysis(batch)
-                        analysis_results = await self._analyze_batch(
-                            bot_name, pr_number, formatted_comments
-                        )
-                        
-                        self._update_metrics_and_classifications(
-                            bot_metrics, classifications, bot_name, pr_number, 
-                            analysis_results, batch, i
-                        )
-
-                    except Exception as e:
-                        logger.error(f"Error processing batch for {bot_name} PR #{pr_number}: {str(e)}")
-                        continue
+            for pr_number, indexed in pr_comments.items():
 
-        return {
-            'metrics': self._finalize_metrics(bot_metrics),
-            'classifications': dict(classifications)
-        }
+                # Label obvious comments locally and only forward the ambiguous ones
+                if self.pre_classifier:
+                    labeled, indexed, pr_audits = self.pre_classifier.split(indexed)
+                    self._record_pre_classifications(accumulator, bot_name, pr_number, labeled)
+                    for idx, label in pr_audits.items():
+                        audits[(bot_name, pr_number, idx)] = label
+
+                pending.extend(
+                    IndexedComment(bot_name, pr_number, idx, comment) for idx, comment in indexed
+                )
+
+        # Classify one representative per cluster of (near-)duplicate comments
+        if self.deduplicator:
+            clusters = [
+                [pending[i] for i in cluster]
+                for cluster in self.deduplicator.cluster([entry.comment for entry in pending])
+            ]
+            accumulator.add_stat('deduplication', 'comments', len(pending))
+            accumulator.add_stat('deduplication', 'clusters', len(clusters))
+            accumulator.add_stat('deduplication', 'deduplicated', len(pending) - len(clusters))
+        else:
+            clusters = [[entry] for entry in pending]
+
+        bot_pr_clusters = defaultdict(list)
+        for cluster in clusters:
+            representative = cluster[0]
+            bot_pr_clusters[(representative.bot_name, representative.pr_number)].append(cluster)
+
+        batches = []
+        for (bot_name, pr_number), cluster_list in bot_pr_clusters.items():
+            for i in range(0, len(cluster_list), self.BATCH_SIZE):
+                batches.append((bot_name, pr_number, cluster_list[i:i + self.BATCH_SIZE]))
+
+        return batches, audits
+
+    def batch_prompt(self, bot_name: str, pr_number: int, batch: List[List[IndexedComment]]) -> str:
+        """The categorization prompt for a batch from plan_batches"""
+        return self.categorization_prompt(
+            bot_name, pr_number, self._format_comments_for_analysis([cluster[0].comment for cluster in batch])
+        )
+
+    def record_batch_results(
+        self,
+        accumulator: MetricsAccumulator,
+        analysis_results: List[Dict],
+        batch: List[List[IndexedComment]],
+        audits: Dict[Tuple[str, int, int], PreClassification]
+    ) -> List[int]:
+        """Record parsed results for a batch from plan_batches; returns the positions left unclassified"""
+        return self._update_metrics_and_classifications(accumulator, analysis_results, batch, audits)
+
+
+    def collect_results(self, accumulator: MetricsAccumulator) -> Dict[str, Dict]:
+        """Snapshot the accumulator's results along with pre-classifier stats"""
+        results = accumulator.results()
+        if self.pre_classifier:
+            results['pre_classification'] = self.pre_classifier.stats()
+            logger.info(f"Pre-classifier stats: {results['pre_classification']}")
+        if 'deduplication' in results:
+            logger.info(f"Deduplication stats: {results['deduplication']}")
+        results['single_flight'] = self.single_flight.stats()
+        if self.prompt_cache:
+            results['prompt_cache'] = self.prompt_cache.stats()
+            logger.info(f"Prompt cache stats: {results['prompt_cache']}")
+        if self.compactor:
+            results['compaction'] = self.compactor.stats()
+            logger.info(f"Prompt compaction stats: {results['compaction']}")
+        if self.hedger:
+            results['hedging'] = self.hedger.stats()
+            logger.info(f"Hedging stats: {results['hedging']}")
+        if self.cascade:
+            results['cascade'] = self.cascade.stats()
+            logger.info(f"Model cascade stats: {results['cascade']}")
+
+        return results
 
 
     async def analyze_comment_quality(self, comments: List[ReviewComment]) -> Dict[str, Dict[str, float]]:
@@ -133,90 +365,325 @@ class GeminiAnalyzer(BaseAnalyzer):
 
 
     def _format_comments_for_analysis(self, comments: List[ReviewComment]) -> str:
+        if self.compactor:
+            texts = [
+                (self.compactor.compact_comment(c.comment), self.compactor.compact_hunk(c.chunk, c.line_nums))
+                for c in comments
+            ]
+        else:
+            texts = [(c.comment, c.chunk) for c in comments]
+
         return "\n\n".join([
             f"Comment {i}:\nFile: {c.file_name}\nLines: {c.line_nums}\n"
-            f"Comment: {c.comment}\nCode:\n{c.chunk}"
-            for i, c in enumerate(comments)
+            f"Comment: {comment}\nCode:\n{chunk}"
+            for i, (c, (comment, chunk)) in enumerate(zip(comments, texts))
         ])
 
 
-    async def _analyze_batch(self, bot_name: str, pr_number: int, formatted_comments: str) -> List[Dict]:
+    async def _generate_json(self, prompt: str, model_name: Optional[str] = None):
+        """Request a JSON response, joining any identical request already in flight"""
+        model_name = model_name or self.model_name
+
         def make_api_call():
-            return self.model.generate_content(
-                GEMINI_PROMPTS["comment_categorization"].format(
-                    pr_number=pr_number,
-                    bot_name=bot_name,
-                    comments=formatted_comments
+            model, contents = self._model_for(prompt, self._model(model_name))
+            response = model.generate_content(
+                contents,
+                generation_config=self.genai.GenerationConfig(
+                    response_mime_type="application/json"
                 ),
-                generation_config=genai.GenerationConfig(
+                **self._request_options()
+            )
+            if self.prompt_cache:
+                self.prompt_cache.record_usage(getattr(response, 'usage_metadata', None))
+            return response
+
+        def call():
+            return make_api_call_with_backoff(make_api_call, timeout=self._attempt_timeout())
+
+        return await self.single_flight.do(prompt_key(model_name, prompt), self._hedged, model_name, call)
+
+    async def _hedged(self, model_name: str, call: Callable[[], Any]):
+        if self.hedger is None:
+            return await call()
+        # The SDK call runs in a worker thread, which cancelling can't stop, so a losing attempt is left to finish
+        return await self.hedger.run(model_name, call, cancellable=False)
+
+    def _request_options(self) -> Dict[str, Any]:
+        return {'request_options': {'timeout': self.call_timeout}} if self.call_timeout else {}
+
+    def _attempt_timeout(self) -> Optional[float]:
+        # A little longer than the SDK's own timeout, which normally fires first with a clearer error
+        return self.call_timeout + 5.0 if self.call_timeout else None
+
+    async def _generate_objects(self, prompt: str, on_object: Callable[[Dict], None]):
+        """Stream a JSON response, calling on_object for each result object as soon as it completes"""
+        seen = 0
+
+        def handle(result):
+            nonlocal seen
+            seen += 1
+            on_object(result)
+
+        objects = await self.single_flight.do(
+            prompt_key(self.model_name, 'stream', prompt), self._stream_objects, prompt, handle
+        )
+        # Callers that joined someone else's in-flight stream only get the objects at the end
+        for result in objects[seen:]:
+            on_object(result)
+
+    def _model(self, model_name: str):
+        if model_name not in self._models:
+            self._models[model_name] = self.genai.GenerativeModel(model_name)
+        return self._models[model_name]
+
+    def _model_for(self, prompt: str, model=None):
+        # The prompt cache keeps a separate cached prefix for each model
+        model = model or self.model
+        if self.prompt_cache:
+            return self.prompt_cache.model_for(model, prompt)
+        return model, prompt
+
+    async def _stream_objects(self, prompt: str, on_object: Callable[[Dict], None]) -> List[Dict]:
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+
+        def make_api_call():
+            model, contents = self._model_for(prompt)
+            response = model.generate_content(
+                contents,
+                generation_config=self.genai.GenerationConfig(
                     response_mime_type="application/json"
-                )
+                ),
+                stream=True,
+                **self._request_options()
+            )
+            emitted = 0
+            try:
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Chunks carrying only metadata (e.g. the finish reason) have no text
+                        continue
+                    loop.call_soon_threadsafe(chunks.put_nowait, text)
+                    emitted += 1
+            except Exception as e:
+                if not emitted:
+                    raise
+                raise StreamInterrupted(f"Stream failed after {emitted} chunks: {type(e).__name__}") from e
+            if self.prompt_cache:
+                self.prompt_cache.record_usage(getattr(response, 'usage_metadata', None))
+
+        # Failures before the first chunk are retried; later ones (and the overall deadline) are not,
+        # since results parsed from the handed-out chunks have already been recorded
+        call = asyncio.ensure_future(
+            wait_with_timeout(make_api_call_with_backoff(make_api_call), self._attempt_timeout())
+        )
+        # Queued after every chunk the call produced, including when it fails
+        call.add_done_callback(lambda _: chunks.put_nowait(None))
+
+        extractor = IncrementalJSONExtractor()
+        objects = []
+        try:
+            while True:
+                text = await chunks.get()
+                if text is None:
+                    break
+                for result in extractor.feed(text):
+                    objects.append(result)
+                    on_object(result)
+            await call
+        finally:
+            call.cancel()
+
+        for result in extractor.close():
+            objects.append(result)
+            on_object(result)
+        return objects
+
+    async def judge_matches(self, pairs: List[Tuple[ReviewComment, ReviewComment]]) -> List[bool]:
+        """Ask whether each (reference finding, bot comment) pair reports the same issue"""
+        verdicts = [False] * len(pairs)
+        for start in range(0, len(pairs), self.BATCH_SIZE):
+            batch = pairs[start:start + self.BATCH_SIZE]
+            formatted_pairs = "\n\n".join(
+                f"Pair {i}:\nFile: {comment.file_name}\n"
+                f"Reference finding (lines {finding.line_nums}): {finding.comment}\n"
+                f"Review comment by {comment.bot_name} (lines {comment.line_nums}): {comment.comment}"
+                for i, (finding, comment) in enumerate(batch)
+            )
+            try:
+                response = await self._generate_json(GEMINI_PROMPTS["match_judgment"].format(pairs=formatted_pairs))
+                response_text = response.text if hasattr(response, 'text') else response.parts[0].text
+                for result in self.parse_categorization_response(response_text):
+                    try:
+                        index = int(result['pair_index'])
+                    except (KeyError, TypeError, ValueError):
+                        logger.warning(f"Skipping malformed match judgment: {result}")
+                        continue
+                    if 0 <= index < len(batch):
+                        verdicts[start + index] = result.get('same_issue') is True
+            except Exception as e:
+                # Unjudged pairs count as no match
+                logger.error(f"Error judging {len(batch)} comment/finding pairs: {str(e)}")
+        return verdicts
+
+    @staticmethod
+    def categorization_prompt(bot_name: str, pr_number: int, formatted_comments: str, scored: bool = False) -> str:
+        template = "comment_categorization_scored" if scored else "comment_categorization"
+        return GEMINI_PROMPTS[template].format(
+            pr_number=pr_number,
+            bot_name=bot_name,
+            comments=formatted_comments
+        )
+
+    async def _cascade_batch(self, bot_name: str, pr_number: int, batch: List[List[IndexedComment]]) -> List[Dict]:
+        """Classify a batch with the cheap model and re-check uncertain or escalated results with the strong one.
+
+        Returns one result per classified position, with `comment_index` set
+        to its position in `batch`.
+        """
+        comments = [cluster[0].comment for cluster in batch]
+        response = await self._generate_json(
+            self.categorization_prompt(bot_name, pr_number, self._format_comments_for_analysis(comments), scored=True),
+            self.cascade.cheap_model
+        )
+        self.cascade.record_call('cheap', len(batch), response)
+        response_text = response.text if hasattr(response, 'text') else response.parts[0].text
+        results = self._index_results(self.parse_categorization_response(response_text), len(batch))
+
+        escalated = []
+        for index in sorted(results):
+            reason = self.cascade.escalation_reason(results[index])
+            if reason:
+                self.cascade.record_escalation(reason)
+                escalated.append(index)
+        if not escalated:
+            return [{**result, 'comment_index': index} for index, result in results.items()]
+
+        rechecked = {}
+        try:
+            response = await self._generate_json(
+                self.categorization_prompt(
+                    bot_name, pr_number, self._format_comments_for_analysis([comments[i] for i in escalated])
+                ),
+                self.cascade.strong_model
+            )
+            self.cascade.record_call('strong', len(escalated), response)
+            response_text = response.text if hasattr(response, 'text') else response.parts[0].text
+            strong_results = self._index_results(self.parse_categorization_response(response_text), len(escalated))
+            rechecked = {escalated[position]: result for position, result in strong_results.items()}
+        except Exception as e:
+            # The cheap model's answers stand rather than losing the whole batch
+            self.cascade.record_failure('strong')
+            logger.error(
+                f"Strong-tier check of {len(escalated)} comments for {bot_name} PR #{pr_number} failed: {str(e)}"
+            )
+
+        for index in escalated:
+            self.cascade.record_outcome(
+                results[index]['category'], rechecked[index]['category'] if index in rechecked else None
             )
+        results.update(rechecked)
+        return [{**result, 'comment_index': index} for index, result in results.items()]
 
-        response = await make_api_call_with_backoff(make_api_call)
+    @classmethod
+    def _index_results(cls, analysis_results: List[Dict], batch_size: int) -> Dict[int, Dict]:
+        """Usable results by the batch position they classify, first answer per position"""
+        indexed = {}
+        for position, result in enumerate(analysis_results):
+            index = cls._result_index(result, position, batch_size)
+            if index is not None and index not in indexed:
+                indexed[index] = result
+        return indexed
+
+    @staticmethod
+    def _result_index(result: Any, position: int, batch_size: int) -> Optional[int]:
+        """The batch position a classification object is for, or None if it is unusable"""
+        if not isinstance(result, dict) or 'category' not in result:
+            return None
+        # Trust the index the model echoed back over response order; fall back to order without one
+        try:
+            index = int(result.get('comment_index', position))
+        except (TypeError, ValueError):
+            index = position
+        return index if 0 <= index < batch_size else None
+
+    async def _analyze_batch(self, bot_name: str, pr_number: int, formatted_comments: str) -> List[Dict]:
+        response = await self._generate_json(
+            self.categorization_prompt(bot_name, pr_number, formatted_comments)
+        )
         response_text = response.text if hasattr(response, 'text') else response.parts[0].text
-        
+        return self.parse_categorization_response(response_text)
+
+    @staticmethod
+    def parse_categorization_response(response_text: str) -> List[Dict]:
         try:
             results = json.loads(response_text)
             return results if isinstance(results, list) else [results]
         except json.JSONDecodeError as e:
-            logger.error(f"Error parsing Gemini response: {str(e)}")
-            return []
+            # Keep every complete classification; missing comments are re-requested by the caller
+            results = salvage_objects(response_text)
+            logger.warning(f"Error parsing Gemini response ({str(e)}); salvaged {len(results)} classifications")
+            return results
 
     def _update_metrics_and_classifications(
         self, 
-        bot_metrics: dict,
-        classifications: dict,
+        accumulator: MetricsAccumulator,
+        analysis_results: List[Dict],
+        batch: List[List[IndexedComment]],
+        audits: Dict[Tuple[str, int, int], PreClassification]
+    ) -> List[int]:
+        """Record results by their comment_index; returns the batch positions with no usable result"""
+        recorded: Set[int] = set()
+        for position, result in enumerate(analysis_results):
+            self._record_result(accumulator, batch, position, result, audits, recorded)
+
+        return [position for position in range(len(batch)) if position not in recorded]
+
+    def _record_result(
+        self,
+        accumulator: MetricsAccumulator,
+        batch: List[List[IndexedComment]],
+        position: int,
+        result: Any,
+        audits: Dict[Tuple[str, int, int], PreClassification],
+        recorded: Set[int]
+    ):
+        """Record one classification object; `position` is its place in the response"""
+        index = self._result_index(result, position, len(batch))
+        if index is None or index in recorded:
+            return
+        recorded.add(index)
+
+        category = result['category']
+        reasoning = result.get('reasoning', 'No reasoning provided')
+
+        # Fan the representative's result out to every member of its cluster
+        for entry in batch[index]:
+            # Audited comments were already labeled locally; only compare against the LLM
+            if entry.key in audits:
+                self.pre_classifier.record_agreement(audits[entry.key], category)
+                continue
+
+            accumulator.add_total(entry.bot_name)
+            accumulator.record(
+                entry.bot_name, entry.pr_number, entry.comment, entry.comment_index,
+                category, reasoning
+            )
+            if self.on_classification:
+                self.on_classification(entry, category, reasoning)
+
+    def _record_pre_classifications(
+        self,
+        accumulator: MetricsAccumulator,
         bot_name: str,
         pr_number: int,
-        analysis_results: List[Dict],
-        batch: List[ReviewComment],
-        batch_start_idx: int
+        labeled: List[Tuple[int, ReviewComment, PreClassification]]
     ):
-        bot_metrics[bot_name]['total_comments'] += len(batch)
-        
-        for idx, result in enumerate(analysis_results):
-            category = result['category']
-            comment = batch[idx]
-            
-            # Update metrics
-            if category == 'CRITICAL_BUG':
-                bot_metrics[bot_name]['critical_bug_ratio'] += 1
-            elif category == 'NITPICK':
-                bot_metrics[bot_name]['nitpick_ratio'] += 1
-            else:
-                bot_metrics[bot_name]['other_ratio'] += 1
-
-            # Store classification
-            classifications[bot_name][pr_number].append({
-                'file_name': comment.file_name,
-                'line_nums': comment.line_nums,
-                'comment': comment.comment,
-                'code_chunk': comment.chunk,
-                'category': category,
-                'reasoning': result.get('reasoning', 'No reasoning provided'),
-                'comment_index': batch_start_idx + idx
-            })
-
-    def _finalize_metrics(self, bot_metrics: dict) -> Dict[str, Dict[str, float]]:
-        final_metrics = {}
-        
-        for bot, metrics in bot_metrics.items():
-            total = metrics['total_comments']
-            if total > 0:
-                final_metrics[bot] = {
-                    'critical_bug_ratio': metrics['critical_bug_ratio'] / total,
-                    'nitpick_ratio': metrics['nitpick_ratio'] / total,
-                    'other_ratio': metrics['other_ratio'] / total,
-                    'total_comments': total
-                }
-            else:
-                final_metrics[bot] = {
-                    'critical_bug_ratio': 0.0,
-                    'nitpick_ratio': 0.0,
-                    'other_ratio': 0.0,
-                    'total_comments': 0
-                }
-                
-        return final_metrics
-    
+        accumulator.add_total(bot_name, len(labeled))
+
+        for comment_index, comment, label in labeled:
+            accumulator.record(
+                bot_name, pr_number, comment, comment_index, label.category, label.reasoning
+            )
@@ -0,0 +1,253 @@
+"""
+Matching of bot review comments against reference findings.
+
+Reference findings (by default the 'gemini' issues from `analyze_diff`) are
+indexed per PR and file by the line ranges they cover. Each bot comment is
+looked up in that index, so only findings on overlapping lines of the same
+file are ever compared with it, and a cheap word-overlap score decides each
+candidate pair. Pairs that overlap but are neither clearly the same issue
+nor clearly different can be handed to an LLM judge.
+"""
+
+import math
+import re
+import logging
+from bisect import bisect_right
+from collections import defaultdict
+from itertools import accumulate, combinations
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from models import ReviewComment
+
+logger = logging.getLogger(__name__)
+
+Interval = Tuple[float, float]
+Judge = Callable[[List[Tuple[ReviewComment, ReviewComment]]], Awaitable[List[bool]]]
+
+# A finding or comment without usable line numbers covers its whole file
+WHOLE_FILE: Interval = (0, math.inf)
+
+_RANGE = re.compile(r'(\d+)\s*(?:-|–|\.\.|to)\s*(\d+)')
+_NUMBER = re.compile(r'\d+')
+_WORD = re.compile(r'[a-z_][a-z0-9_]{2,}')
+_HTML_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+
+_STOPWORDS = frozenset("""
+the and for this that with from are was were has have had not but can could should would will may might
+its into when then than there their them they which while where what who how why also only just more
+most some such very use used using been being does did doing here these those any all each other
+code line lines file function method value variable call calls called issue bug consider make sure
+""".split())
+
+
+def parse_line_ranges(line_nums: Any, ranges: bool = True) -> List[Interval]:
+    """Line intervals mentioned in a line_nums field.
+
+    With `ranges`, "12-15" is the range 12..15 (the LLM's format). Without,
+    every number is a single line; GitHub comments store "<line>-<original_line>".
+    """
+    text = str(line_nums) if line_nums is not None else ''
+    intervals = []
+    if ranges:
+        for match in _RANGE.finditer(text):
+            low, high = sorted((int(match.group(1)), int(match.group(2))))
+            intervals.append((low, high))
+        text = _RANGE.sub(' ', text)
+    intervals.extend((int(n), int(n)) for n in _NUMBER.findall(text))
+    return intervals or [WHOLE_FILE]
+
+
+def _normalize_path(path: str) -> str:
+    path = (path or '').strip().strip('`').replace('\\', '/')
+    for prefix in ('a/', 'b/', './'):
+        if path.startswith(prefix):
+            path = path[len(prefix):]
+    return path
+
+
+def _words(text: str) -> Set[str]:
+    return {word for word in _WORD.findall(_HTML_COMMENT.sub('', text or '').lower()) if word not in _STOPWORDS}
+
+
+def text_similarity(comment: ReviewComment, finding: ReviewComment) -> float:
+    """Overlap coefficient between a comment's words and a finding's description and snippet"""
+    comment_words = _words(comment.comment)
+    finding_words = _words(f"{finding.comment}\n{finding.chunk}")
+    if not comment_words or not finding_words:
+        return 0.0
+    return len(comment_words & finding_words) / min(len(comment_words), len(finding_words))
+
+
+class IntervalIndex:
+    """Static index over closed intervals answering overlap queries.
+
+    Intervals are sorted by start with a running maximum of their ends, so a
+    query binary-searches the last interval starting before its end and walks
+    left only while some interval further left can still reach its start.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[float, float, Any]]):
+        items = sorted(intervals, key=lambda item: (item[0], item[1]))
+        self._starts = [start for start, _, _ in items]
+        self._ends = [end for _, end, _ in items]
+        self._values = [value for _, _, value in items]
+        self._max_end = list(accumulate(self._ends, max))
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def overlapping(self, start: float, end: float) -> List[Any]:
+        found = []
+        i = bisect_right(self._starts, end)
+        while i > 0 and self._max_end[i - 1] >= start:
+            i -= 1
+            if self._ends[i] >= start:
+                found.append(self._values[i])
+        return found
+
+
+class FindingMatcher:
+    """Matches every bot's comments to reference findings and scores each bot against them.
+
+    A comment and a finding are candidates when they are on the same PR and
+    file and their lines are within `line_tolerance` of each other. A
+    candidate pair scoring at least `match_threshold` is a match, below
+    `reject_threshold` it is not, and anything in between is ambiguous: sent
+    to `judge` if one is given, otherwise counted as no match.
+    """
+
+    def __init__(self, reference: str = 'gemini', line_tolerance: int = 3,
+                 match_threshold: float = 0.5, reject_threshold: float = 0.2,
+                 judge: Optional[Judge] = None):
+        self.reference = reference
+        self.line_tolerance = line_tolerance
+        self.match_threshold = match_threshold
+        self.reject_threshold = reject_threshold
+        self.judge = judge
+
+    async def match(self, comments: Iterable[ReviewComment],
+                    reference_prs: Optional[Set[int]] = None) -> Dict[str, Any]:
+        """Score every bot against the reference findings.
+
+        With `reference_prs`, only PRs the reference has reviewed (even with no
+        findings) are scored; bot comments on other PRs are left out instead
+        of counting as unmatched.
+        """
+        findings: List[ReviewComment] = []
+        bot_comments: Dict[str, List[ReviewComment]] = defaultdict(list)
+        stats = defaultdict(int)
+        for comment in comments:
+            if comment.bot_name == self.reference:
+                findings.append(comment)
+            elif reference_prs is not None and comment.pr_number not in reference_prs:
+                stats['unreviewed'] += 1
+            else:
+                bot_comments[comment.bot_name].append(comment)
+
+        indexes, paths_by_name = self._build_indexes(findings)
+        # Per bot: matched comment positions, and the findings they caught
+        matched: Dict[str, Set[int]] = defaultdict(set)
+        caught: Dict[str, Set[int]] = defaultdict(set)
+        ambiguous: List[Tuple[str, int, int]] = []
+
+        for bot_name, bot_list in bot_comments.items():
+            for position, comment in enumerate(bot_list):
+                for finding_id in self._candidates(indexes, paths_by_name, comment):
+                    stats['candidates'] += 1
+                    score = text_similarity(comment, findings[finding_id])
+                    if score >= self.match_threshold:
+                        stats['matched'] += 1
+                        matched[bot_name].add(position)
+                        caught[bot_name].add(finding_id)
+                    elif score < self.reject_threshold:
+                        stats['rejected'] += 1
+                    else:
+                        ambiguous.append((bot_name, position, finding_id))
+
+        # A pair can't change the scores if both its comment and its finding are already matched
+        ambiguous = [
+            (bot_name, position, finding_id) for bot_name, position, finding_id in ambiguous
+            if position not in matched[bot_name] or finding_id not in caught[bot_name]
+        ]
+        stats['ambiguous'] = len(ambiguous)
+        if ambiguous and self.judge:
+            verdicts = await self.judge([
+                (findings[finding_id], bot_comments[bot_name][position])
+                for bot_name, position, finding_id in ambiguous
+            ])
+            stats['judged'] = len(ambiguous)
+            for (bot_name, position, finding_id), same_issue in zip(ambiguous, verdicts):
+                if same_issue:
+                    stats['judged_matches'] += 1
+                    matched[bot_name].add(position)
+                    caught[bot_name].add(finding_id)
+
+        report = self._report(findings, bot_comments, matched, caught)
+        report['stats'] = dict(stats)
+        logger.info(
+            f"Matched {len(bot_comments)} bots against {len(findings)} {self.reference} findings: "
+            f"{stats['candidates']} candidate pairs, {stats['ambiguous']} ambiguous"
+        )
+        return report
+
+    @staticmethod
+    def _build_indexes(findings: List[ReviewComment]):
+        """One interval index per (PR, file), plus the indexed paths per (PR, file name)"""
+        by_file = defaultdict(list)
+        paths_by_name = defaultdict(set)
+        for finding_id, finding in enumerate(findings):
+            path = _normalize_path(finding.file_name)
+            paths_by_name[(finding.pr_number, path.rsplit('/', 1)[-1])].add(path)
+            for start, end in set(parse_line_ranges(finding.line_nums, ranges=True)):
+                by_file[(finding.pr_number, path)].append((start, end, finding_id))
+        return {key: IntervalIndex(intervals) for key, intervals in by_file.items()}, paths_by_name
+
+    def _candidates(self, indexes, paths_by_name, comment: ReviewComment) -> Set[int]:
+        path = _normalize_path(comment.file_name)
+        index = indexes.get((comment.pr_number, path))
+        if index is None:
+            # The LLM sometimes reports only a file's name or a partial path
+            index = next((
+                indexes[(comment.pr_number, finding_path)]
+                for finding_path in sorted(paths_by_name.get((comment.pr_number, path.rsplit('/', 1)[-1]), ()))
+                if path.endswith('/' + finding_path) or finding_path.endswith('/' + path)
+            ), None)
+        if index is None:
+            return set()
+
+        candidates = set()
+        for start, end in parse_line_ranges(comment.line_nums, ranges=False):
+            candidates.update(index.overlapping(start - self.line_tolerance, end + self.line_tolerance))
+        return candidates
+
+    def _report(self, findings, bot_comments, matched, caught) -> Dict[str, Any]:
+        findings_per_pr = defaultdict(int)
+        for finding in findings:
+            findings_per_pr[finding.pr_number] += 1
+
+        bots = {}
+        for bot_name, bot_list in bot_comments.items():
+            reviewed_prs = {comment.pr_number for comment in bot_list}
+            reviewed_findings = sum(findings_per_pr[pr_number] for pr_number in reviewed_prs)
+            bots[bot_name] = {
+                'comments': len(bot_list),
+                'matched_comments': len(matched[bot_name]),
+                'caught_findings': len(caught[bot_name]),
+                'precision': len(matched[bot_name]) / len(bot_list) if bot_list else 0.0,
+                'recall': len(caught[bot_name]) / len(findings) if findings else 0.0,
+                # Bots don't review every PR; this only counts findings on PRs the bot commented on
+                'recall_on_reviewed_prs': len(caught[bot_name]) / reviewed_findings if reviewed_findings else 0.0,
+            }
+
+        overlap = defaultdict(dict)
+        for first, second in combinations(sorted(bot_comments), 2):
+            both = caught[first] & caught[second]
+            either = caught[first] | caught[second]
+            overlap[first][second] = {'both': len(both), 'jaccard': len(both) / len(either) if either else 0.0}
+
+        return {
+            'reference': self.reference,
+            'reference_findings': len(findings),
+            'bots': bots,
+            'overlap': dict(overlap),
+        }
@@ -0,0 +1,126 @@
+import sys
+from collections import defaultdict
+from typing import Dict, Any
+
+from models import ReviewComment, CommentTable
+
+
+class MetricsAccumulator:
+    """Collects per-bot category counts and per-comment classifications.
+
+    Batches can be recorded incrementally (e.g. from a streaming pipeline) and
+    `results()` returns a snapshot in the same shape as
+    `analyze_comment_quality_in_batch`. Classifications are kept as compact
+    tuples that reference comments in a shared CommentTable by ID.
+    """
+
+    def __init__(self):
+        self.bot_metrics = defaultdict(lambda: {
+            'critical_bug_ratio': 0.0,
+            'nitpick_ratio': 0.0,
+            'other_ratio': 0.0,
+            'total_comments': 0
+        })
+        self.classifications = defaultdict(lambda: defaultdict(list))
+        self.comments = CommentTable()
+        self.stats = defaultdict(lambda: defaultdict(int))
+
+    def add_total(self, bot_name: str, count: int = 1):
+        self.bot_metrics[bot_name]['total_comments'] += count
+
+    def add_stat(self, section: str, key: str, count: int = 1):
+        self.stats[section][key] += count
+
+    def record(
+        self,
+        bot_name: str,
+        pr_number: int,
+        comment: ReviewComment,
+        comment_index: int,
+        category: str,
+        reasoning: str
+    ):
+        # Update metrics
+        if category == 'CRITICAL_BUG':
+            self.bot_metrics[bot_name]['critical_bug_ratio'] += 1
+        elif category == 'NITPICK':
+            self.bot_metrics[bot_name]['nitpick_ratio'] += 1
+        else:
+            self.bot_metrics[bot_name]['other_ratio'] += 1
+
+        # Store classification as (comment_id, comment_index, category, reasoning)
+        self.classifications[bot_name][pr_number].append((
+            self.comments.add(comment), comment_index, sys.intern(category), reasoning
+        ))
+
+    def merge_results(self, results: Dict[str, Any]):
+        """Fold in results produced elsewhere (e.g. by another worker) in `results()` shape"""
+        comment_table = results.get('comments')
+        if isinstance(comment_table, list):
+            comment_table = CommentTable.from_records(comment_table)
+
+        for bot_name, pr_data in results.get('classifications', {}).items():
+            for pr_number, records in pr_data.items():
+                for record in records:
+                    self.add_total(bot_name)
+                    self.record(
+                        bot_name, int(pr_number), comment_table[record['comment_id']],
+                        record['comment_index'], record['category'], record['reasoning']
+                    )
+
+        for section, counts in results.items():
+            # Derived sections (ratios, per-rule agreement) can't be summed; callers merge those themselves
+            if section in ('metrics', 'classifications', 'comments', 'pre_classification', 'sampling') \
+                    or not isinstance(counts, dict):
+                continue
+            for key, count in counts.items():
+                if isinstance(count, int):
+                    self.add_stat(section, key, count)
+
+    def results(self) -> Dict[str, Any]:
+        classifications = {}
+        for bot_name, pr_data in self.classifications.items():
+            classifications[bot_name] = {
+                pr_number: [
+                    {
+                        'comment_id': comment_id,
+                        'comment_index': comment_index,
+                        'category': category,
+                        'reasoning': reasoning
+                    }
+                    for comment_id, comment_index, category, reasoning in sorted(records, key=lambda r: r[1])
+                ]
+                for pr_number, records in pr_data.items()
+            }
+
+        results = {
+            'metrics': self.finalize_metrics(),
+            'classifications': classifications,
+            'comments': self.comments
+        }
+        for section, counts in self.stats.items():
+            results[section] = dict(counts)
+
+        return results
+
+    def finalize_metrics(self) -> Dict[str, Dict[str, float]]:
+        final_metrics = {}
+
+        for bot, metrics in self.bot_metrics.items():
+            total = metrics['total_comments']
+            if total > 0:
+                final_metrics[bot] = {
+                    'critical_bug_ratio': metrics['critical_bug_ratio'] / total,
+                    'nitpick_ratio': metrics['nitpick_ratio'] / total,
+                    'other_ratio': metrics['other_ratio'] / total,
+                    'total_comments': total
+                }
+            else:
+                final_metrics[bot] = {
+                    'critical_bug_ratio': 0.0,
+                    'nitpick_ratio': 0.0,
+                    'other_ratio': 0.0,
+                    'total_comments': 0
+                }
+
+        return final_metrics
@@ -0,0 +1,138 @@
+import re
+import random
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Pattern, Tuple
+
+from models import ReviewComment
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PreClassification:
+    category: str
+    confidence: float
+    rule: str
+    reasoning: str
+
+
+# (rule name, category, confidence, pattern) - checked in order, first match wins
+DEFAULT_RULES: List[Tuple[str, str, float, str]] = [
+    ("emoji_only", "OTHER", 0.99, r"^(\s*([:;][\w+-]+[:;]|[^\w\s]))+\s*$"),
+    ("approval", "OTHER", 0.97,
+     r"^\W*(lgtm|looks good( to me)?|ship it|approved?|thanks?( you)?|thx|nice( work| catch)?|great( work)?)\W*$"),
+    # Only a heading or a bot's summary marker at the start: bug comments often carry <details> blocks
+    # (committable suggestions, AI prompts), and a sentence can start with "Changes to ..." or "Summary: ..."
+    ("walkthrough_summary", "OTHER", 0.95,
+     r"^(\s*<!--[\s\S]*?-->)*\s*(#+\s*(walkthrough|summary|changes|changeset|pr summary)\b|\W*summary by \w+)"),
+    ("nit_prefix", "NITPICK", 0.95, r"^\W*(nit|nitpick|minor|style)\s*[:\-]"),
+    ("typo", "NITPICK", 0.93, r"^\W*(nit\W*)?(typo|misspell(ed|ing)?|spelling|grammar)\b"),
+    # Short, single-line comments that lead with the formatting problem; longer ones usually explain a consequence
+    ("formatting", "NITPICK", 0.92,
+     r"^(?=[^\n]{0,60}$)\W*(inconsistent |extra |unnecessary |missing )?"
+     r"(whitespace|trailing (whitespace|space|comma|newline)s?|indentation|formatting|line length|blank lines?|"
+     r"newline at end of file|import order|sort(ed)? imports)\b"),
+]
+
+# Words that suggest a comment might point at a real defect even if it also matches a rule
+BUG_SIGNALS = re.compile(
+    r"\b(crash\w*|panic|null|none|undefined|race|deadlock|leak\w*|overflow|injection|vulnerab\w*|"
+    r"security|\w*exception|\w*error|corrupt\w*|data loss|segfault|infinite loop|off[- ]by[- ]one|unsafe|"
+    r"dereferenc\w*|potential issue|break(s|ing)?|fail(s|ure|ing)?)\b",
+    re.IGNORECASE
+)
+
+
+class RuleBasedPreClassifier:
+    """Labels obvious comments locally so they can skip the LLM categorization call"""
+
+    def __init__(self, min_confidence: float = 0.9, audit_rate: float = 0.05,
+                 bug_signal_penalty: float = 0.3, seed: int = 0,
+                 rules: Optional[List[Tuple[str, str, float, str]]] = None):
+        self.min_confidence = min_confidence
+        self.audit_rate = audit_rate
+        self.bug_signal_penalty = bug_signal_penalty
+        self.rules: List[Tuple[str, str, float, Pattern]] = [
+            (name, category, confidence, re.compile(pattern, re.IGNORECASE))
+            for name, category, confidence, pattern in (rules or DEFAULT_RULES)
+        ]
+        self._random = random.Random(seed)
+        self._counts = defaultdict(int)
+        self._agreement = defaultdict(lambda: {'agree': 0, 'total': 0})
+
+    def classify(self, comment: ReviewComment) -> Optional[PreClassification]:
+        """Return a local label for the comment, or None if it should go to the LLM"""
+        text = (comment.comment or '').strip()
+        if not text:
+            return None
+
+        for name, category, confidence, pattern in self.rules:
+            if not pattern.search(text):
+                continue
+
+            if BUG_SIGNALS.search(text):
+                confidence -= self.bug_signal_penalty
+
+            if confidence < self.min_confidence:
+                return None
+
+            return PreClassification(
+                category=category,
+                confidence=confidence,
+                rule=name,
+                reasoning=f"Pre-classified locally by rule '{name}' (confidence {confidence:.2f})"
+            )
+
+        return None
+
+    def split(self, comments: List[Tuple[int, ReviewComment]]
+              ) -> Tuple[List[Tuple[int, ReviewComment, PreClassification]], List[Tuple[int, ReviewComment]], Dict[int, PreClassification]]:
+        """Split indexed comments into locally labeled ones and ones to forward to the LLM.
+
+        A sample of the labeled comments (audit_rate) is also forwarded so the
+        rules can be checked against the LLM; their labels are returned in the
+        audit map keyed by comment index.
+        """
+        labeled, forwarded, audits = [], [], {}
+
+        for idx, comment in comments:
+            label = self.classify(comment)
+            if label is None:
+                self._counts['forwarded'] += 1
+                forwarded.append((idx, comment))
+                continue
+
+            self._counts['pre_classified'] += 1
+            labeled.append((idx, comment, label))
+            if self._random.random() < self.audit_rate:
+                self._counts['audited'] += 1
+                audits[idx] = label
+                forwarded.append((idx, comment))
+
+        return labeled, forwarded, audits
+
+    def record_agreement(self, label: PreClassification, llm_category: str):
+        """Record whether the LLM agreed with a locally assigned label"""
+        stats = self._agreement[label.rule]
+        stats['total'] += 1
+        if label.category == llm_category:
+            stats['agree'] += 1
+        else:
+            logger.debug(f"Rule '{label.rule}' labeled {label.category} but LLM said {llm_category}")
+
+    def stats(self) -> Dict[str, Dict]:
+        """Counts of pre-classified/forwarded comments and per-rule agreement with the LLM"""
+        agreement = {
+            rule: {**counts, 'rate': counts['agree'] / counts['total'] if counts['total'] else None}
+            for rule, counts in self._agreement.items()
+        }
+        total = self._counts['pre_classified'] + self._counts['forwarded']
+        return {
+            'pre_classified': self._counts['pre_classified'],
+            'forwarded': self._counts['forwarded'],
+            'audited': self._counts['audited'],
+            'skip_ratio': self._counts['pre_classified'] / total if total else 0.0,
+            'agreement': agreement
+        }
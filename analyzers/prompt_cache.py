@@ -0,0 +1,161 @@
+"""
+Provider-side caching of static prompt prefixes.
+
+Every prompt in `prompts.py` starts with a static prefix (instructions and
+output format) shared by thousands of calls per run. A PromptCache stores
+each registered prefix with the provider once and routes matching prompts to
+a model bound to that cached copy, so only the per-call suffix (the diff or
+the comments) is sent and processed on each request.
+"""
+
+import datetime
+import threading
+import time
+import logging
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Hashable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class PromptCache(ABC):
+    """Routes prompts that start with a registered prefix to a model holding a cached copy of it"""
+
+    def __init__(self):
+        self._prefixes: List[str] = []
+        # Calls run in worker threads; this also keeps two threads from caching the same prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+
+    def register(self, prefix: str):
+        if prefix and prefix not in self._prefixes:
+            self._prefixes.append(prefix)
+            # Longest first, in case one prefix starts with another
+            self._prefixes.sort(key=len, reverse=True)
+
+    def model_for(self, model: Any, prompt: str) -> Tuple[Any, str]:
+        """The model to call and the contents to send it in place of `prompt`"""
+        prefix = next((prefix for prefix in self._prefixes if prompt.startswith(prefix)), None)
+        with self._lock:
+            cached_model = self._cached_model(model, prefix) if prefix is not None else None
+            if cached_model is None:
+                self.misses += 1
+                return model, prompt
+            self.hits += 1
+        return cached_model, prompt[len(prefix):]
+
+    def record_usage(self, usage_metadata: Any):
+        """Tally the input and cached token counts a response reports"""
+        if usage_metadata is None:
+            return
+        with self._lock:
+            self.prompt_tokens += getattr(usage_metadata, 'prompt_token_count', 0) or 0
+            self.cached_tokens += getattr(usage_metadata, 'cached_content_token_count', 0) or 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'prompt_tokens': self.prompt_tokens,
+            'cached_tokens': self.cached_tokens,
+        }
+
+    @staticmethod
+    def _model_key(model: Any, prefix: str) -> Hashable:
+        return getattr(model, 'model_name', None) or id(model), prefix
+
+    @abstractmethod
+    def _cached_model(self, model: Any, prefix: str) -> Optional[Any]:
+        """A model bound to a cached copy of `prefix`, or None to send prompts in full"""
+
+
+class GeminiPromptCache(PromptCache):
+    """Gemini context caching: each prefix becomes CachedContent used as the system instruction.
+
+    Caches are recreated shortly before their TTL runs out and otherwise left
+    to expire. A prefix the API refuses to cache (for instance because it is
+    below the model's minimum cacheable size) is sent in full from then on.
+    Prefixes estimated below `min_tokens` are never offered to the API, so
+    the usual short instructions cost no failed create call per process.
+    """
+
+    # Gemini 1.5's minimum for context caching
+    MIN_TOKENS = 32768
+
+    def __init__(self, ttl_seconds: float = 3600.0, min_tokens: int = MIN_TOKENS):
+        super().__init__()
+        # Deferred for the same reason as in GeminiAnalyzer
+        import google.generativeai as genai
+
+        self.genai = genai
+        self.ttl_seconds = ttl_seconds
+        self.min_tokens = min_tokens
+        self._models: Dict[Hashable, Tuple[Any, float]] = {}
+        self._unavailable: Set[Hashable] = set()
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), 'cached_prefixes': len(self._models), 'uncacheable_prefixes': len(self._unavailable)}
+
+    def _cached_model(self, model: Any, prefix: str) -> Optional[Any]:
+        key = self._model_key(model, prefix)
+        if key in self._unavailable:
+            return None
+        # ~4 characters per token, as in the scheduler's and compactor's estimates
+        if len(prefix) // 4 < self.min_tokens:
+            logger.debug(f"Not caching a {len(prefix)}-character prompt prefix, below the minimum cacheable size")
+            self._unavailable.add(key)
+            return None
+
+        now = time.monotonic()
+        entry = self._models.get(key)
+        if entry is None or entry[1] <= now:
+            try:
+                cache = self.genai.caching.CachedContent.create(
+                    model=model.model_name,
+                    system_instruction=prefix,
+                    ttl=datetime.timedelta(seconds=self.ttl_seconds)
+                )
+            except Exception as e:
+                if '429' in str(e):
+                    # Rate limited: let the caller's backoff retry the whole call
+                    raise
+                logger.warning(f"Can't cache a {len(prefix)}-character prompt prefix, sending it in full: {str(e)}")
+                self._unavailable.add(key)
+                return None
+
+            logger.info(f"Cached a {len(prefix)}-character prompt prefix as {cache.name}")
+            entry = (self.genai.GenerativeModel.from_cached_content(cached_content=cache),
+                     now + self.ttl_seconds * 0.9)
+            self._models[key] = entry
+        return entry[0]
+
+
+class _PrefixedModel:
+    """Sends the prefix held locally ahead of each request, as a provider would from its cache"""
+
+    def __init__(self, model: Any, prefix: str):
+        self.model = model
+        self.prefix = prefix
+
+    def generate_content(self, contents: str, **kwargs):
+        return self.model.generate_content(self.prefix + contents, **kwargs)
+
+
+class LocalPromptCache(PromptCache):
+    """Stand-in for tests and offline runs: the model receives exactly the prompt it would without caching"""
+
+    def __init__(self):
+        super().__init__()
+        self._models: Dict[Hashable, _PrefixedModel] = {}
+
+    def stats(self) -> Dict[str, int]:
+        return {**super().stats(), 'cached_prefixes': len(self._models)}
+
+    def _cached_model(self, model: Any, prefix: str) -> Optional[Any]:
+        key = self._model_key(model, prefix)
+        if key not in self._models:
+            self._models[key] = _PrefixedModel(model, prefix)
+        return self._models[key]
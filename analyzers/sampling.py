@@ -0,0 +1,216 @@
+import math
+import random
+import logging
+from collections import defaultdict
+from typing import Dict, Hashable, List, Optional, Tuple, TYPE_CHECKING
+
+from models import IndexedComment
+from .metrics import MetricsAccumulator
+
+if TYPE_CHECKING:
+    from .gemini import GeminiAnalyzer
+
+logger = logging.getLogger(__name__)
+
+CATEGORIES = ('CRITICAL_BUG', 'NITPICK', 'OTHER')
+RATIO_KEYS = {'CRITICAL_BUG': 'critical_bug_ratio', 'NITPICK': 'nitpick_ratio', 'OTHER': 'other_ratio'}
+
+STRATIFY_OPTIONS = ('bot', 'pr-size')
+
+# Upper bounds of the PR size buckets used by `stratify='pr-size'`, in diff lines
+PR_SIZE_BUCKETS = ((200, 'small'), (1000, 'medium'), (math.inf, 'large'))
+# Same buckets in review comments per PR, used when diff sizes aren't known
+COMMENT_COUNT_BUCKETS = ((5, 'small'), (20, 'medium'), (math.inf, 'large'))
+
+
+def wilson_interval(successes: int, n: int, z: float = 1.96, population: Optional[int] = None) -> Tuple[float, float]:
+    """Wilson score interval for a proportion.
+
+    With `population`, a finite population correction is applied by
+    inflating the effective sample size; a full census has zero width.
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    if population is not None:
+        if n >= population:
+            return p, p
+        if population > 1:
+            n = n * (population - 1) / (population - n)
+
+    denominator = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denominator
+    margin = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denominator
+    return max(0.0, center - margin), min(1.0, center + margin)
+
+
+class StratifiedSampler:
+    """Estimates per-bot category ratios from a stratified random sample.
+
+    Comments are split into strata (per bot, or per bot and PR size) and
+    classified in rounds. A stratum stops drawing once its share of
+    `sample_size` is reached, or once the Wilson interval for every category
+    ratio is narrower than `ci_width`, or when it runs out of comments.
+    Per-bot estimates combine strata weighted by their population.
+    """
+
+    def __init__(self, sample_size: Optional[int] = None, ci_width: Optional[float] = None,
+                 stratify: str = 'bot', pr_sizes: Optional[Dict[int, int]] = None,
+                 round_size: int = 50, min_per_stratum: int = 30, z: float = 1.96, seed: int = 0):
+        if sample_size is None and ci_width is None:
+            raise ValueError("Either sample_size or ci_width is required")
+        if stratify not in STRATIFY_OPTIONS:
+            raise ValueError(f"Unknown stratification {stratify!r}; expected one of {STRATIFY_OPTIONS}")
+
+        self.sample_size = sample_size
+        self.ci_width = ci_width
+        self.stratify = stratify
+        self.pr_sizes = pr_sizes
+        self.round_size = round_size
+        self.min_per_stratum = min_per_stratum
+        self.z = z
+        self.rng = random.Random(seed)
+
+    async def run(self, analyzer: 'GeminiAnalyzer', entries: List[IndexedComment],
+                  accumulator: MetricsAccumulator) -> Dict[str, Dict]:
+        """Classify a sample of `entries` into the accumulator and return per-bot estimates"""
+        strata = self._strata(entries)
+        for members in strata.values():
+            self.rng.shuffle(members)
+        quotas = self._quotas(strata)
+        drawn = {key: 0 for key in strata}
+
+        round_number = 0
+        while True:
+            counts = self._stratum_counts(
+                {key: members[:drawn[key]] for key, members in strata.items()}, accumulator
+            )
+            batch = []
+            for key, members in strata.items():
+                if drawn[key] >= quotas[key] or self._converged(counts[key], len(members)):
+                    continue
+                take = min(self.round_size if self.ci_width else quotas[key], quotas[key] - drawn[key])
+                batch.extend(members[drawn[key]:drawn[key] + take])
+                drawn[key] += take
+
+            if not batch:
+                break
+
+            round_number += 1
+            logger.info(f"Sampling round {round_number}: classifying {len(batch)} comments")
+            await analyzer.categorize_indexed(batch, accumulator)
+
+        estimates = self.estimate(strata, accumulator)
+        logger.info(
+            f"Sampled {sum(drawn.values())} of {len(entries)} comments in {round_number} rounds"
+        )
+        return estimates
+
+    def estimate(self, strata: Dict[Hashable, List[IndexedComment]],
+                 accumulator: MetricsAccumulator) -> Dict[str, Dict]:
+        """Per-bot ratio estimates with confidence intervals"""
+        counts = self._stratum_counts(strata, accumulator)
+        by_bot = defaultdict(list)
+        for key in strata:
+            by_bot[key[0]].append(key)
+
+        estimates = {}
+        for bot_name, keys in by_bot.items():
+            population = sum(len(strata[key]) for key in keys)
+            sampled = sum(sum(counts[key].values()) for key in keys)
+            bot_estimate = {'population': population, 'sampled': sampled, 'strata': len(keys)}
+
+            for category, ratio_key in RATIO_KEYS.items():
+                if len(keys) == 1:
+                    key = keys[0]
+                    n = sum(counts[key].values())
+                    ratio = counts[key][category] / n if n else 0.0
+                    low, high = wilson_interval(counts[key][category], n, self.z, len(strata[key]))
+                else:
+                    ratio, low, high = self._combine(keys, strata, counts, category)
+                bot_estimate[ratio_key] = {'estimate': ratio, 'ci_low': low, 'ci_high': high}
+
+            estimates[bot_name] = bot_estimate
+
+        return estimates
+
+    def _combine(self, keys, strata, counts, category) -> Tuple[float, float, float]:
+        """Population-weighted stratified estimate with a normal-approximation interval"""
+        population = sum(len(strata[key]) for key in keys)
+        ratio, variance = 0.0, 0.0
+        for key in keys:
+            n, size = sum(counts[key].values()), len(strata[key])
+            if n == 0:
+                continue
+            weight = size / population
+            p = counts[key][category] / n
+            fpc = (size - n) / (size - 1) if size > 1 else 0.0
+            ratio += weight * p
+            variance += weight * weight * p * (1 - p) / n * fpc
+
+        margin = self.z * math.sqrt(variance)
+        return ratio, max(0.0, ratio - margin), min(1.0, ratio + margin)
+
+    def _strata(self, entries: List[IndexedComment]) -> Dict[Hashable, List[IndexedComment]]:
+        strata = defaultdict(list)
+        if self.stratify == 'bot':
+            for entry in entries:
+                strata[(entry.bot_name,)].append(entry)
+            return strata
+
+        # Without diff sizes, the number of comments on a PR stands in for its size
+        sizes, buckets = self.pr_sizes, PR_SIZE_BUCKETS
+        if sizes is None:
+            sizes, buckets = defaultdict(int), COMMENT_COUNT_BUCKETS
+            for entry in entries:
+                sizes[entry.pr_number] += 1
+        for entry in entries:
+            strata[(entry.bot_name, self._size_bucket(sizes.get(entry.pr_number, 0), buckets))].append(entry)
+        return strata
+
+    def _quotas(self, strata: Dict[Hashable, List[IndexedComment]]) -> Dict[Hashable, int]:
+        """Proportional allocation of sample_size, with a floor per stratum"""
+        if self.sample_size is None:
+            return {key: len(members) for key, members in strata.items()}
+
+        total = sum(len(members) for members in strata.values())
+        return {
+            key: min(len(members), max(self.min_per_stratum, math.ceil(self.sample_size * len(members) / total)))
+            for key, members in strata.items()
+        }
+
+    def _converged(self, counts: Dict[str, int], population: int) -> bool:
+        n = sum(counts.values())
+        if self.ci_width is None or n == 0 or n < min(self.min_per_stratum, population):
+            return False
+        return all(
+            high - low <= self.ci_width
+            for low, high in (wilson_interval(counts[category], n, self.z, population) for category in CATEGORIES)
+        )
+
+    @staticmethod
+    def _stratum_counts(strata, accumulator: MetricsAccumulator) -> Dict[Hashable, Dict[str, int]]:
+        """Category counts of the classified members of each stratum"""
+        labels = {
+            (bot_name, pr_number, comment_index): category
+            for bot_name, pr_data in accumulator.classifications.items()
+            for pr_number, records in pr_data.items()
+            for _, comment_index, category, _ in records
+        }
+
+        counts = {}
+        for key, members in strata.items():
+            stratum_counts = {category: 0 for category in CATEGORIES}
+            for entry in members:
+                category = labels.get(entry.key)
+                if category is not None:
+                    stratum_counts[category if category in RATIO_KEYS else 'OTHER'] += 1
+            counts[key] = stratum_counts
+        return counts
+
+    @staticmethod
+    def _size_bucket(size: int, buckets) -> str:
+        for upper, name in buckets:
+            if size <= upper:
+                return name
+        return buckets[-1][1]
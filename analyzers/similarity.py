@@ -0,0 +1,362 @@
+"""
+Local text similarity over review comments.
+
+Comments are turned into TF-IDF weighted vectors of hashed word n-grams,
+stored as a sparse CSR matrix in plain NumPy arrays, and compared by cosine
+similarity. Nearest-neighbor search multiplies blocks of query rows against
+the whole matrix (through scipy.sparse when it is installed, otherwise
+through an inverted index), so memory stays bounded by the block size
+rather than the square of the corpus. An index can be saved to disk and
+reused by later runs, re-vectorizing only comments it hasn't seen.
+"""
+
+import hashlib
+import json
+import os
+import re
+import zlib
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models import ReviewComment
+from .dedup import CommentDeduplicator
+
+logger = logging.getLogger(__name__)
+
+_TOKEN = re.compile(r'[a-z_][a-z0-9_]+')
+
+
+class SparseRows(NamedTuple):
+    """Rows of a CSR matrix: row i holds indices[indptr[i]:indptr[i + 1]] and the matching data"""
+    indptr: np.ndarray
+    indices: np.ndarray
+    data: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.indptr) - 1
+
+    def row_ids(self) -> np.ndarray:
+        return np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+
+    def take(self, rows: Sequence[int]) -> 'SparseRows':
+        rows = np.asarray(rows, dtype=np.int64)
+        starts, lengths = self.indptr[rows], np.diff(self.indptr)[rows]
+        positions = _expand_ranges(starts, lengths)
+        indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int64)
+        return SparseRows(indptr, self.indices[positions], self.data[positions])
+
+    @staticmethod
+    def concat(parts: List['SparseRows']) -> 'SparseRows':
+        offsets = np.cumsum([0] + [part.indptr[-1] for part in parts[:-1]])
+        indptr = np.concatenate([[0]] + [part.indptr[1:] + offset for part, offset in zip(parts, offsets)])
+        return SparseRows(
+            indptr.astype(np.int64),
+            np.concatenate([part.indices for part in parts]),
+            np.concatenate([part.data for part in parts])
+        )
+
+
+def _expand_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenation of range(start, start + length) for each pair, without a Python loop"""
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(starts, lengths) + offsets
+
+
+class HashedNgramVectorizer:
+    """Maps comment text to hashed word n-gram counts.
+
+    Hashing keeps the feature space fixed (`n_features` columns) without a
+    vocabulary, and uses CRC32 so the same text always lands on the same
+    columns, which saved indexes depend on. N-grams found in more than
+    `max_df` of a corpus (of at least MIN_DOCS_FOR_MAX_DF comments) carry
+    almost no signal and are dropped when an index is built.
+    """
+
+    MIN_DOCS_FOR_MAX_DF = 50
+
+    def __init__(self, n_features: int = 2 ** 18, ngram_range: Tuple[int, int] = (1, 2),
+                 include_chunk: bool = False, sublinear_tf: bool = True, max_df: float = 0.5):
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.include_chunk = include_chunk
+        self.sublinear_tf = sublinear_tf
+        self.max_df = max_df
+
+    def config(self) -> Dict[str, Any]:
+        return {
+            'n_features': self.n_features,
+            'ngram_range': list(self.ngram_range),
+            'include_chunk': self.include_chunk,
+            'sublinear_tf': self.sublinear_tf,
+            'max_df': self.max_df,
+        }
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> 'HashedNgramVectorizer':
+        return cls(config['n_features'], tuple(config['ngram_range']), config['include_chunk'],
+                   config['sublinear_tf'], config['max_df'])
+
+    def text(self, comment: ReviewComment) -> str:
+        text = comment.comment
+        if self.include_chunk:
+            text = f"{text}\n{comment.chunk}"
+        return CommentDeduplicator.normalize(text)
+
+    def key(self, comment: ReviewComment) -> str:
+        """Identifies a comment's vector across runs"""
+        return hashlib.sha1(self.text(comment).encode('utf-8')).hexdigest()
+
+    def transform(self, comments: Sequence[ReviewComment]) -> SparseRows:
+        """Term-frequency rows (before IDF weighting) with sorted column indices"""
+        low, high = self.ngram_range
+        indptr, indices, data = [0], [], []
+        for comment in comments:
+            tokens = _TOKEN.findall(self.text(comment))
+            grams = [
+                ' '.join(tokens[i:i + n])
+                for n in range(low, high + 1)
+                for i in range(len(tokens) - n + 1)
+            ]
+            columns = np.fromiter(
+                (zlib.crc32(gram.encode('utf-8')) % self.n_features for gram in grams),
+                dtype=np.int64, count=len(grams)
+            )
+            columns, counts = np.unique(columns, return_counts=True)
+            weights = 1 + np.log(counts) if self.sublinear_tf else counts.astype(np.float64)
+            indices.append(columns.astype(np.int32))
+            data.append(weights.astype(np.float32))
+            indptr.append(indptr[-1] + len(columns))
+
+        return SparseRows(
+            np.asarray(indptr, dtype=np.int64),
+            np.concatenate(indices) if indices else np.zeros(0, dtype=np.int32),
+            np.concatenate(data) if data else np.zeros(0, dtype=np.float32)
+        )
+
+
+class SimilarityIndex:
+    """Unit-length TF-IDF vectors for a list of comments, with blocked top-k neighbor search.
+
+    Row i of the index corresponds to the i-th comment it was built from.
+    """
+
+    def __init__(self, vectorizer: HashedNgramVectorizer, idf: np.ndarray, rows: SparseRows, keys: List[str]):
+        self.vectorizer = vectorizer
+        self.idf = idf
+        self.rows = rows
+        self.keys = keys
+        self._columns = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    @classmethod
+    def build(cls, comments: Sequence[ReviewComment],
+              vectorizer: Optional[HashedNgramVectorizer] = None) -> 'SimilarityIndex':
+        vectorizer = vectorizer or HashedNgramVectorizer()
+        counts = vectorizer.transform(comments)
+        # Smoothed IDF; each row lists a column at most once, so a bincount gives document frequencies
+        df = np.bincount(counts.indices, minlength=vectorizer.n_features)
+        idf = (np.log((1 + len(counts)) / (1 + df)) + 1).astype(np.float32)
+        if len(counts) >= vectorizer.MIN_DOCS_FOR_MAX_DF:
+            idf[df > vectorizer.max_df * len(counts)] = 0.0
+        keys = [vectorizer.key(comment) for comment in comments]
+        return cls(vectorizer, idf, _weight_and_normalize(counts, idf), keys)
+
+    @classmethod
+    def load_or_build(cls, path: Optional[str], comments: Sequence[ReviewComment],
+                      vectorizer: Optional[HashedNgramVectorizer] = None,
+                      reuse: bool = True, rebuild_ratio: float = 0.2) -> 'SimilarityIndex':
+        """Reuse the index saved at `path` for comments it already covers, then save the result.
+
+        New comments are weighted with the saved IDF. Once more than
+        `rebuild_ratio` of the comments are new, the IDF no longer reflects
+        the corpus and the index is rebuilt from scratch.
+        """
+        vectorizer = vectorizer or HashedNgramVectorizer()
+        index = None
+        if reuse and path and os.path.exists(path):
+            saved = cls.load(path)
+            if saved.vectorizer.config() == vectorizer.config():
+                index = saved.extend_to(comments, rebuild_ratio)
+
+        if index is None:
+            index = cls.build(comments, vectorizer)
+        if path:
+            index.save(path)
+        return index
+
+    def extend_to(self, comments: Sequence[ReviewComment], rebuild_ratio: float = 0.2) -> Optional['SimilarityIndex']:
+        """An index over `comments` reusing this index's vectors, or None if too many are new"""
+        known = {key: row for row, key in enumerate(self.keys)}
+        keys = [self.vectorizer.key(comment) for comment in comments]
+        new_positions = [i for i, key in enumerate(keys) if key not in known]
+        if comments and len(new_positions) > rebuild_ratio * len(comments):
+            logger.info(f"{len(new_positions)} of {len(comments)} comments are not indexed yet; rebuilding")
+            return None
+
+        parts, order = [], []
+        reused = [i for i, key in enumerate(keys) if key in known]
+        if reused:
+            parts.append(self.rows.take([known[keys[i]] for i in reused]))
+            order.extend(reused)
+        if new_positions:
+            counts = self.vectorizer.transform([comments[i] for i in new_positions])
+            parts.append(_weight_and_normalize(counts, self.idf))
+            order.extend(new_positions)
+        if not parts:
+            return SimilarityIndex(self.vectorizer, self.idf, self.rows.take([]), [])
+
+        # Put rows back in the order of `comments`
+        rows = SparseRows.concat(parts).take(np.argsort(order, kind='stable'))
+        logger.info(f"Reused {len(reused)} indexed comments, vectorized {len(new_positions)} new ones")
+        return SimilarityIndex(self.vectorizer, self.idf, rows, keys)
+
+    def save(self, path: str):
+        tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+        np.savez_compressed(
+            tmp_path,
+            indptr=self.rows.indptr, indices=self.rows.indices, data=self.rows.data,
+            idf=self.idf, keys=np.asarray(self.keys, dtype='U40'),
+            config=np.asarray(json.dumps(self.vectorizer.config()))
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'SimilarityIndex':
+        with np.load(path, allow_pickle=False) as saved:
+            vectorizer = HashedNgramVectorizer.from_config(json.loads(str(saved['config'])))
+            rows = SparseRows(saved['indptr'], saved['indices'], saved['data'])
+            return cls(vectorizer, saved['idf'], rows, [str(key) for key in saved['keys']])
+
+    def top_k(self, k: int = 10, min_similarity: float = 0.0,
+              max_block_cells: int = 4_000_000) -> Tuple[np.ndarray, np.ndarray]:
+        """Each comment's k most similar other comments.
+
+        Returns (neighbors, scores), both of shape (n, k) and sorted by
+        descending score; slots without a neighbor at or above
+        `min_similarity` hold -1 and 0.0. Scores are computed for blocks of
+        rows at a time, at most `max_block_cells` similarities per block.
+        """
+        n = len(self)
+        k = max(0, min(k, n - 1))
+        neighbors = np.full((n, k), -1, dtype=np.int64)
+        scores = np.zeros((n, k), dtype=np.float32)
+        if k == 0:
+            return neighbors, scores
+
+        for start, stop in self._blocks(max_block_cells):
+            block = self._block_scores(start, stop)
+            # A comment is not its own neighbor
+            block[np.arange(stop - start), np.arange(start, stop)] = -1.0
+
+            top = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            top_scores = np.take_along_axis(block, top, axis=1)
+            order = np.argsort(-top_scores, axis=1, kind='stable')
+            top, top_scores = np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+            keep = top_scores >= max(min_similarity, 1e-9)
+            neighbors[start:stop] = np.where(keep, top, -1)
+            scores[start:stop] = np.where(keep, top_scores, 0.0)
+
+        return neighbors, scores
+
+    def clusters(self, threshold: float = 0.6, k: int = 10) -> List[List[int]]:
+        """Groups of comments linked by neighbor similarity of at least `threshold`, largest first"""
+        neighbors, _ = self.top_k(k, min_similarity=threshold)
+        parent = list(range(len(self)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for i, j in zip(*np.nonzero(neighbors >= 0)):
+            a, b = find(int(i)), find(int(neighbors[i, j]))
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(self)):
+            groups[find(i)].append(i)
+        return sorted(groups.values(), key=lambda members: (-len(members), members[0]))
+
+    def similarity(self, i: int, j: int) -> float:
+        """Cosine similarity of two indexed comments"""
+        a, b = self.rows.take([i]), self.rows.take([j])
+        common, a_pos, b_pos = np.intersect1d(a.indices, b.indices, assume_unique=True, return_indices=True)
+        return float(np.dot(a.data[a_pos], b.data[b_pos])) if len(common) else 0.0
+
+    def _blocks(self, max_block_cells: int):
+        """Row ranges whose score blocks, and posting-list joins, stay within max_block_cells"""
+        n = len(self)
+        postings = np.bincount(self.rows.indices, minlength=self.vectorizer.n_features)
+        work = np.bincount(self.rows.row_ids(), weights=postings[self.rows.indices], minlength=n)
+
+        start = 0
+        while start < n:
+            stop = min(n, start + max(1, max_block_cells // n))
+            # Shrink blocks of rows made of very common n-grams
+            while stop - start > 1 and work[start:stop].sum() > max_block_cells:
+                stop = start + (stop - start) // 2
+            yield start, stop
+            start = stop
+
+    def _block_scores(self, start: int, stop: int) -> np.ndarray:
+        """Dense (stop - start, n) cosine similarities of rows start..stop against all rows"""
+        try:
+            import scipy.sparse as sp
+        except ImportError:
+            sp = None
+
+        if sp is not None:
+            if self._columns is None:
+                shape = (len(self), self.vectorizer.n_features)
+                self._columns = sp.csr_matrix((self.rows.data, self.rows.indices, self.rows.indptr), shape=shape).T.tocsr()
+            block = self.rows.take(range(start, stop))
+            query = sp.csr_matrix((block.data, block.indices, block.indptr),
+                                  shape=(stop - start, self.vectorizer.n_features))
+            return (query @ self._columns).toarray()
+
+        # Without scipy: walk the posting list of every column the block's rows use
+        if self._columns is None:
+            order = np.argsort(self.rows.indices, kind='stable')
+            postings = np.bincount(self.rows.indices, minlength=self.vectorizer.n_features)
+            self._columns = (
+                np.concatenate(([0], np.cumsum(postings))).astype(np.int64),
+                self.rows.row_ids()[order],
+                self.rows.data[order]
+            )
+        col_indptr, col_rows, col_data = self._columns
+
+        block = self.rows.take(range(start, stop))
+        lengths = col_indptr[block.indices + 1] - col_indptr[block.indices]
+        positions = _expand_ranges(col_indptr[block.indices], lengths)
+        query_rows = np.repeat(block.row_ids(), lengths)
+        weights = np.repeat(block.data, lengths) * col_data[positions]
+
+        n = len(self)
+        flat = np.bincount(query_rows * n + col_rows[positions], weights=weights, minlength=(stop - start) * n)
+        return flat.reshape(stop - start, n)
+
+
+def _weight_and_normalize(counts: SparseRows, idf: np.ndarray) -> SparseRows:
+    # Drop the columns pruned by max_df (zero IDF)
+    nonzero = idf[counts.indices] > 0
+    if not nonzero.all():
+        kept_per_row = np.bincount(counts.row_ids()[nonzero], minlength=len(counts))
+        indptr = np.concatenate(([0], np.cumsum(kept_per_row))).astype(np.int64)
+        counts = SparseRows(indptr, counts.indices[nonzero], counts.data[nonzero])
+
+    data = counts.data * idf[counts.indices]
+    norms = np.sqrt(np.bincount(counts.row_ids(), weights=data.astype(np.float64) ** 2, minlength=len(counts)))
+    norms[norms == 0] = 1.0
+    data = data / np.repeat(norms, np.diff(counts.indptr))
+    return SparseRows(counts.indptr, counts.indices, data.astype(np.float32))
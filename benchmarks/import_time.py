@@ -0,0 +1,94 @@
+"""
+Import-time benchmark.
+
+Imports each module in a fresh interpreter and reports the median wall time,
+plus which heavy third-party modules got pulled in as a side effect.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5] [--max-seconds 0.5]
+
+Exits non-zero if any light module exceeds --max-seconds or imports a heavy
+dependency, so it can be used as a CI check.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that should import quickly and without any heavy dependency
+LIGHT_MODULES = [
+    'models',
+    'prompts',
+    'main',
+    'pipeline',
+    'github.api',
+    'analyzers.gemini',
+    'visualization.visualizer',
+]
+
+HEAVY_DEPENDENCIES = [
+    'google.generativeai',
+    'anthropic',
+    'pandas',
+    'matplotlib',
+    'seaborn',
+    'aiohttp',
+]
+
+_PROBE = """
+import json, sys, time, warnings
+warnings.simplefilter('ignore')
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'elapsed': elapsed, 'heavy': heavy}}))
+"""
+
+
+def measure(module: str, runs: int) -> dict:
+    timings = []
+    heavy = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['elapsed'])
+        heavy = result['heavy']
+
+    return {'module': module, 'median': statistics.median(timings), 'heavy': heavy}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per module')
+    parser.add_argument('--max-seconds', type=float, default=None, help='Fail if a module exceeds this')
+    parser.add_argument('modules', nargs='*', default=LIGHT_MODULES)
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'Module':<30} {'Median (s)':<12} Heavy deps loaded")
+    print("-" * 80)
+    for module in args.modules:
+        result = measure(module, args.runs)
+        too_slow = args.max_seconds is not None and result['median'] > args.max_seconds
+        failed = failed or too_slow or bool(result['heavy'])
+        heavy = ', '.join(result['heavy']) or '-'
+        flag = '  SLOW' if too_slow else ''
+        print(f"{module:<30} {result['median']:<12.3f} {heavy}{flag}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
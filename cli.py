@@ -0,0 +1,768 @@
+"""
+Command line interface for the code review evaluator.
+
+Each stage reads from and writes to a persistent run directory, so expensive
+stages (fetching, diff analysis, categorization) can be skipped or rerun
+independently:
+
+    code-review-evals fetch --limit 50 --since 2024-06-01
+    code-review-evals analyze-diffs --concurrency 8
+    code-review-evals categorize
+    code-review-evals match       # score bots against the gemini findings
+    code-review-evals report --format txt,csv,png
+
+`code-review-evals run` executes all stages in order. Any command takes
+--profile to write per-stage CPU, memory and latency profiles to
+<run-dir>/profile.
+
+Large backfills can go through the provider's batch API instead:
+
+    code-review-evals batch-submit --stage diffs
+    code-review-evals batch-collect --stage diffs
+    code-review-evals batch-submit --stage categorize
+    code-review-evals batch-collect --stage categorize
+
+Or spread across processes/machines sharing the run directory:
+
+    code-review-evals coordinate --limit 5000
+    code-review-evals work --concurrency 8     # on each worker
+
+Or keep results current from GitHub webhooks:
+
+    code-review-evals serve --port 8080        # POST /webhook, GET /metrics
+    code-review-evals replay delivery.json     # process a saved payload
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from utils.run_store import RunStore
+from utils.scheduler import POLICIES
+from utils.profiling import PROFILERS
+from analyzers.sampling import STRATIFY_OPTIONS
+from analyzers.batch import BATCH_STAGES
+from analyzers.cascade import ModelCascade
+from distributed import JOB_KINDS
+
+logger = logging.getLogger(__name__)
+
+REPORT_FORMATS = ('txt', 'json', 'csv', 'png', 'svg', 'preview')
+DEFAULT_REPORT_FORMATS = ('txt', 'json', 'csv', 'png')
+
+
+def _parse_date(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _parse_pr_range(value: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Parse 'A-B', 'A-' or '-B' into inclusive bounds"""
+    if not value:
+        return None, None
+    low, _, high = value.partition('-')
+    return (int(low) if low else None), (int(high) if high else None)
+
+
+def _parse_formats(value: str) -> List[str]:
+    formats = [fmt.strip() for fmt in value.split(',') if fmt.strip()]
+    unknown = set(formats) - set(REPORT_FORMATS)
+    if unknown:
+        raise argparse.ArgumentTypeError(f"Unknown report format(s): {', '.join(sorted(unknown))}")
+    return formats
+
+
+def _require_env(name: str) -> str:
+    value = os.getenv(name)
+    if not value:
+        raise SystemExit(f"Missing required environment variable {name}")
+    return value
+
+
+def _github_tokens() -> List[str]:
+    """Tokens from $GITHUB_TOKENS (comma-separated) or $GITHUB_TOKEN"""
+    tokens = [token.strip() for token in os.getenv("GITHUB_TOKENS", "").split(',') if token.strip()]
+    return tokens or [_require_env("GITHUB_TOKEN")]
+
+
+async def _run_bounded(items: Iterable, worker: Callable[..., Awaitable], concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(item):
+        async with semaphore:
+            return await worker(item)
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+def _build_scheduler(args):
+    from utils.scheduler import CostScheduler
+
+    return CostScheduler(
+        slots=args.concurrency,
+        policy=args.schedule,
+        max_oversized_slots=args.max_oversized
+    )
+
+
+def _build_sampler(args, store: RunStore):
+    from analyzers.sampling import StratifiedSampler
+
+    if args.sample_size is None and args.ci_width is None:
+        return None
+
+    pr_sizes = None
+    if args.stratify == 'pr-size':
+        pr_sizes = {
+            pr_number: store.load_diff(pr_number).diff_content.count('\n')
+            for pr_number in store.diff_pr_numbers()
+        }
+    return StratifiedSampler(
+        sample_size=args.sample_size,
+        ci_width=args.ci_width,
+        stratify=args.stratify,
+        pr_sizes=pr_sizes
+    )
+
+
+def _build_hedger(args):
+    from utils.hedging import Hedger
+
+    if not getattr(args, 'hedge', False):
+        return None
+    return Hedger(percentile=args.hedge_percentile, budget=args.hedge_budget)
+
+
+def _build_github(args):
+    from github.api import GitHubAPI
+
+    return GitHubAPI(
+        _github_tokens(), args.repo,
+        request_timeout=getattr(args, 'github_timeout', 30.0),
+        hedger=_build_hedger(args)
+    )
+
+
+def _build_cascade(args):
+    if not getattr(args, 'cascade', False):
+        return None
+    from analyzers.cascade import ModelCascade
+
+    return ModelCascade(
+        cheap_model=args.cheap_model,
+        strong_model=args.strong_model,
+        confidence_threshold=args.escalate_below,
+        escalate_categories=args.escalate_on
+    )
+
+
+def _build_analyzer(args, sampler=None, store: Optional[RunStore] = None, hedger=None):
+    from analyzers.gemini import GeminiAnalyzer
+    from analyzers.preclassifier import RuleBasedPreClassifier
+    from analyzers.dedup import CommentDeduplicator
+    from analyzers.prompt_cache import GeminiPromptCache
+    from analyzers.compaction import PromptCompactor
+
+    on_issue = on_classification = None
+    if store is not None and getattr(args, 'stream', False):
+        # Streamed results land in the run directory as soon as they are parsed
+        def on_issue(comment):
+            store.append_stream_event({'type': 'issue', 'pr_number': comment.pr_number,
+                                       'file_name': comment.file_name, 'comment': comment.comment})
+
+        def on_classification(entry, category, reasoning):
+            store.append_stream_event({'type': 'classification', 'bot_name': entry.bot_name,
+                                       'pr_number': entry.pr_number, 'comment_index': entry.comment_index,
+                                       'category': category, 'reasoning': reasoning})
+
+    return GeminiAnalyzer(
+        _require_env("GOOGLE_API_KEY"),
+        pre_classifier=RuleBasedPreClassifier() if getattr(args, 'pre_classify', True) else None,
+        deduplicator=CommentDeduplicator() if getattr(args, 'dedup', True) else None,
+        sampler=sampler,
+        stream=getattr(args, 'stream', False),
+        prompt_cache=GeminiPromptCache() if getattr(args, 'prompt_cache', True) else None,
+        compactor=PromptCompactor(hunk_window=getattr(args, 'hunk_window', 6))
+        if getattr(args, 'compact', False) else None,
+        call_timeout=getattr(args, 'llm_timeout', 180.0),
+        hedger=hedger or _build_hedger(args),
+        model_name=getattr(args, 'model', None),
+        cascade=_build_cascade(args),
+        on_issue=on_issue,
+        on_classification=on_classification
+    )
+
+
+async def _select_prs(github, args) -> List[dict]:
+    """List PRs newest first, applying number-range and creation-date filters"""
+    since, until = _parse_date(args.since), _parse_date(args.until)
+    low, high = _parse_pr_range(args.pr_range)
+    has_filters = any(bound is not None for bound in (since, until, low, high))
+
+    selected = []
+    async for pr in github.iter_recent_prs(limit=sys.maxsize if has_filters else args.limit):
+        created = _parse_date(pr.get('created_at'))
+        # The listing is sorted by creation date, newest first
+        if (since and created and created < since) or (low is not None and pr['number'] < low):
+            break
+        if (until and created and created > until) or (high is not None and pr['number'] > high):
+            continue
+
+        selected.append(pr)
+        if len(selected) >= args.limit:
+            break
+
+    return selected
+
+
+async def cmd_fetch(args, store: RunStore):
+    github = _build_github(args)
+    if args.retry_failed:
+        # Re-drive only the PRs that failed in earlier runs
+        prs = [entry['pr'] or {'number': entry['pr_number']} for entry in store.dead_letter.entries(stage='fetch')]
+        logger.info(f"Retrying {len(prs)} previously failed PRs")
+    else:
+        prs = await _select_prs(github, args)
+        store.save_prs(prs)
+        logger.info(f"Selected {len(prs)} PRs from {args.repo}")
+
+    async def fetch(pr: dict):
+        pr_number = pr['number']
+        if args.cache and store.has_diff(pr_number) and store.has_comments(pr_number, 'github'):
+            logger.debug(f"PR #{pr_number} already fetched, skipping")
+            store.dead_letter.remove(pr_number)
+            return
+        try:
+            head_sha = store.head_sha(pr_number)
+            # A PR head's diff never changes, so one in the diff store from an earlier run is reused
+            if not (args.cache and store.link_diff(args.repo, pr_number, head_sha)):
+                store.save_diff(await github.fetch_pr_diff(pr_number), args.repo, head_sha)
+            store.save_comments(pr_number, 'github', await github.fetch_pr_comments(pr_number))
+            store.dead_letter.remove(pr_number)
+        except Exception as e:
+            logger.error(f"Error fetching PR #{pr_number}: {str(e)}")
+            store.dead_letter.add(pr_number, 'fetch', e, pr)
+
+    await _run_bounded(prs, fetch, args.concurrency)
+    if len(store.dead_letter):
+        logger.warning(
+            f"{len(store.dead_letter)} PRs failed; rerun with 'fetch --retry-failed' to retry the transient ones"
+        )
+
+
+async def cmd_analyze_diffs(args, store: RunStore):
+    pr_numbers = [
+        pr_number for pr_number in store.diff_pr_numbers()
+        if not (args.cache and store.has_comments(pr_number, 'gemini'))
+    ]
+    if not pr_numbers:
+        logger.info("All stored diffs already analyzed")
+        return
+
+    from utils.scheduler import estimate_diff_cost
+
+    analyzer = _build_analyzer(args, store=store)
+    scheduler = _build_scheduler(args)
+
+    async def analyze(pr_number: int):
+        diff = store.load_diff(pr_number)
+        try:
+            comments = await scheduler.run(estimate_diff_cost(diff), analyzer.analyze_diff, diff)
+        except Exception as e:
+            # Nothing is saved, so the next run analyzes this PR again
+            store.dead_letter.add(pr_number, 'analyze', e)
+            return
+        store.save_comments(pr_number, 'gemini', comments)
+        store.dead_letter.remove(pr_number, stage='analyze')
+
+    logger.info(f"Analyzing {len(pr_numbers)} diffs ({args.schedule} scheduling)")
+    await asyncio.gather(*(analyze(pr_number) for pr_number in pr_numbers))
+    failed = store.dead_letter.entries(stage='analyze', retryable_only=False)
+    if failed:
+        logger.warning(f"{len(failed)} diffs could not be analyzed; rerun 'analyze-diffs' to retry them")
+    logger.debug(f"Scheduler stats: {scheduler.stats()}")
+    if analyzer.compactor:
+        logger.info(f"Prompt compaction stats: {analyzer.compactor.stats()}")
+
+
+async def cmd_categorize(args, store: RunStore):
+    if args.cache and not store.results_stale():
+        logger.info("Categorization results are up to date, skipping")
+        return
+
+    comments = list(store.iter_comments())
+    logger.info(f"Categorizing {len(comments)} comments")
+    analyzer = _build_analyzer(args, _build_sampler(args, store), store)
+    store.save_results(await analyzer.analyze_comment_quality_in_batch(comments))
+
+
+async def cmd_match(args, store: RunStore):
+    from analyzers.matching import FindingMatcher
+
+    judge = _build_analyzer(args).judge_matches if args.judge else None
+    matcher = FindingMatcher(
+        reference=args.reference,
+        line_tolerance=args.line_tolerance,
+        judge=judge
+    )
+    # PRs whose diff analysis failed have no reference findings to be scored against
+    reference_prs = {
+        pr_number for pr_number in store.diff_pr_numbers() if store.has_comments(pr_number, 'gemini')
+    } if args.reference == 'gemini' else None
+    matching = await matcher.match(store.iter_comments(), reference_prs)
+    store.save_matching(matching)
+
+    for bot_name, scores in matching['bots'].items():
+        logger.info(
+            f"{bot_name}: precision {scores['precision']:.1%}, recall {scores['recall']:.1%} "
+            f"against {matching['reference_findings']} {matching['reference']} findings"
+        )
+
+
+async def cmd_similar(args, store: RunStore):
+    from analyzers.similarity import SimilarityIndex, HashedNgramVectorizer
+
+    comments = list(store.iter_comments())
+    if not comments:
+        raise SystemExit(f"No stored comments in {store.run_dir}; run 'fetch' first")
+
+    index = SimilarityIndex.load_or_build(
+        store.similarity_index_path, comments,
+        HashedNgramVectorizer(include_chunk=args.include_chunk), reuse=args.cache
+    )
+    groups = [group for group in index.clusters(args.threshold, args.neighbors) if len(group) > 1]
+
+    themes = []
+    for group in groups:
+        bots = defaultdict(int)
+        for i in group:
+            bots[comments[i].bot_name] += 1
+        themes.append({
+            'size': len(group),
+            'bots': dict(bots),
+            'prs': len({comments[i].pr_number for i in group}),
+            'members': [
+                {'bot_name': comments[i].bot_name, 'pr_number': comments[i].pr_number,
+                 'file_name': comments[i].file_name, 'line_nums': comments[i].line_nums,
+                 'comment': comments[i].comment[:300]}
+                for i in group
+            ],
+        })
+    store.save_similarity({'comments': len(comments), 'threshold': args.threshold, 'themes': themes})
+    logger.info(
+        f"Found {len(themes)} groups of similar comments covering "
+        f"{sum(theme['size'] for theme in themes)} of {len(comments)} comments"
+    )
+
+
+async def cmd_report(args, store: RunStore):
+    from visualization.visualizer import ResultsVisualizer, PREVIEW_DPI
+
+    results = store.load_results()
+    if results is None:
+        raise SystemExit(f"No categorization results in {store.run_dir}; run 'categorize' first")
+    matching = store.load_matching()
+    if matching is not None:
+        results['matching'] = matching
+
+    force = not args.cache
+    written, unchanged = [], []
+
+    def emit(path: str, wrote: bool):
+        (written if wrote else unchanged).append(path)
+
+    if 'txt' in args.format:
+        path = store.report_path('analysis_report.txt')
+        emit(path, ResultsVisualizer.save_detailed_report(results, path, force=force))
+    if 'json' in args.format:
+        path = store.report_path('analysis_report.json')
+        emit(path, ResultsVisualizer.save_json_report(results, path, force=force))
+    if 'csv' in args.format:
+        path = store.report_path('classifications.csv')
+        emit(path, ResultsVisualizer.save_csv_report(results, path, force=force))
+
+    chart_variants = [
+        (suffix, dpi) for fmt, suffix, dpi in (('png', '.png', 300), ('svg', '.svg', 300),
+                                               ('preview', '.preview.png', PREVIEW_DPI))
+        if fmt in args.format
+    ]
+    for suffix, dpi in chart_variants:
+        path = store.report_path('comment_distribution' + suffix)
+        emit(path, ResultsVisualizer.create_impact_distribution_chart(results['metrics'], path, dpi=dpi, force=force))
+        path = store.report_path('bot_comparison' + suffix)
+        emit(path, ResultsVisualizer.create_bot_comparison_chart(results['metrics'], path, dpi=dpi, force=force))
+
+    if written:
+        logger.info("Reports written:\n" + "\n".join(f"  {path}" for path in written))
+    if unchanged:
+        logger.info(f"{len(unchanged)} report(s) unchanged since the last run, skipped (--no-cache to rewrite)")
+
+
+def _build_batch_job(args, store: RunStore):
+    from analyzers.batch import OfflineBatchJob, GeminiBatchBackend, LocalBatchBackend
+    from analyzers.gemini import GeminiAnalyzer
+
+    if args.backend == 'local':
+        analyzer = _build_analyzer(args)
+
+        def respond(prompt: str) -> str:
+            return analyzer.model.generate_content(
+                prompt, generation_config=analyzer.genai.GenerationConfig(response_mime_type="application/json")
+            ).text
+
+        backend = LocalBatchBackend(os.path.join(store.run_dir, 'batch', 'local'), respond)
+    else:
+        backend = GeminiBatchBackend(_require_env("GOOGLE_API_KEY"), args.model or GeminiAnalyzer.MODEL_NAME)
+
+    return OfflineBatchJob(store, lambda: _build_analyzer(args), backend)
+
+
+async def cmd_batch_submit(args, store: RunStore):
+    job = _build_batch_job(args, store)
+    state = job.submit(args.stage)
+    logger.info(f"Batch job {state['job_id']} submitted; collect it with 'batch-collect --stage {args.stage}'")
+
+
+async def cmd_batch_collect(args, store: RunStore):
+    from analyzers.batch import SUCCEEDED
+
+    job = _build_batch_job(args, store)
+    status = await job.wait(args.stage, args.poll_interval, timeout=0 if not args.wait else args.timeout)
+    if status != SUCCEEDED:
+        raise SystemExit(f"Batch job for stage {args.stage!r} is {status}")
+
+    results = await job.ingest(args.stage)
+    if results is not None:
+        store.save_results(results)
+
+
+async def cmd_coordinate(args, store: RunStore):
+    from distributed import Coordinator
+    from utils.work_queue import WorkQueue
+
+    prs = await _select_prs(_build_github(args), args)
+    logger.info(f"Coordinating {len(prs)} PRs from {args.repo} through {store.queue_path}")
+    coordinator = Coordinator(store, WorkQueue(store.queue_path), categorize_batch_size=args.categorize_batch_size)
+    await coordinator.run(prs)
+
+
+async def cmd_work(args, store: RunStore):
+    from distributed import Worker
+    from utils.work_queue import WorkQueue
+
+    llm_hedger = _build_hedger(args)
+    worker = Worker(
+        store,
+        WorkQueue(store.queue_path),
+        build_github=lambda: _build_github(args),
+        # One hedger for every analyzer the worker builds, so its latency history carries over
+        build_analyzer=lambda: _build_analyzer(args, hedger=llm_hedger),
+        worker_id=args.worker_id,
+        kinds=args.kinds,
+        concurrency=args.concurrency,
+        lease_seconds=args.lease_seconds,
+        exit_when_idle=args.exit_when_idle
+    )
+    await worker.run()
+
+
+def _build_service(args, store: RunStore):
+    from server import EvaluationService
+
+    return EvaluationService(
+        store,
+        _build_github(args),
+        _build_analyzer(args, store=store),
+        analyze_diffs=args.analyze_diffs,
+        save_interval=args.save_interval
+    )
+
+
+async def cmd_serve(args, store: RunStore):
+    from server import serve
+
+    await serve(_build_service(args, store), args.host, args.port, args.webhook_secret)
+
+
+async def cmd_replay(args, store: RunStore):
+    import json
+    from server import infer_event
+
+    service = _build_service(args, store)
+    await service.start()
+    try:
+        for path in args.payloads:
+            with open(path, 'r', encoding='utf-8') as f:
+                payload = json.load(f)
+            # Accept {"event": ..., "payload": ...} records as well as bare payloads
+            if 'payload' in payload and 'event' in payload:
+                event, payload = payload['event'], payload['payload']
+            else:
+                event = args.event or infer_event(payload)
+            logger.info(f"{path}: {await service.handle(event, payload)}")
+    finally:
+        await service.close()
+    print(json.dumps(service.metrics(), indent=2))
+
+
+RUN_STAGES = (
+    ('fetch', cmd_fetch),
+    ('analyze-diffs', cmd_analyze_diffs),
+    ('categorize', cmd_categorize),
+    ('match', cmd_match),
+    ('report', cmd_report),
+)
+
+
+async def cmd_run(args, store: RunStore):
+    for _, stage in RUN_STAGES:
+        await stage(args, store)
+
+
+async def _run_profiled(args, store: RunStore):
+    """Run a command with per-stage profiling, writing the bundle to <run-dir>/profile"""
+    from utils.profiling import Profiler
+
+    stages = RUN_STAGES if args.handler is cmd_run else ((args.command, args.handler),)
+    profiler = Profiler(os.path.join(store.run_dir, 'profile'), top=args.profile_top, profiler=args.profiler)
+    async with profiler:
+        for name, stage in stages:
+            async with profiler.stage(name):
+                await stage(args, store)
+    print(profiler.summary())
+    print(f"Profile bundle written to {profiler.output_dir}")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--run-dir', default='analysis_results',
+                        help='Directory holding fetched data, results and reports (default: %(default)s)')
+    common.add_argument('-v', '--verbose', action='store_true', help='Enable debug logging')
+    common.add_argument('--no-cache', dest='cache', action='store_false',
+                        help='Redo work even if its output already exists in the run directory')
+    common.add_argument('--diff-store',
+                        help='Compressed diff store to share between run directories (default: <run-dir>/diff_store)')
+    common.add_argument('--profile', action='store_true',
+                        help='Profile CPU, memory, event-loop lag and slow awaits per stage and write the results '
+                             'to <run-dir>/profile')
+    common.add_argument('--profile-top', type=int, default=20,
+                        help='Functions, allocators and awaits listed per stage when profiling (default: %(default)s)')
+    common.add_argument('--profiler', choices=PROFILERS, default='auto',
+                        help="CPU profiler for --profile; 'auto' samples with pyinstrument when it is installed "
+                             "and uses cProfile otherwise (default: %(default)s)")
+
+    fetch = argparse.ArgumentParser(add_help=False)
+    fetch.add_argument('--repo', default=os.getenv("GITHUB_REPO", "microsoft/typescript"),
+                       help='owner/name of the GitHub repository (default: $GITHUB_REPO)')
+    fetch.add_argument('--limit', type=int, default=int(os.getenv("NUM_PRS", "100")),
+                       help='Maximum number of PRs to fetch (default: $NUM_PRS or 100)')
+    fetch.add_argument('--pr-range', help='Inclusive PR number range, e.g. 1200-1300, 1200- or -1300')
+    fetch.add_argument('--since', help='Only PRs created on or after this ISO date')
+    fetch.add_argument('--until', help='Only PRs created on or before this ISO date')
+    fetch.add_argument('--retry-failed', action='store_true',
+                       help='Only refetch PRs recorded as failed in the run directory')
+
+    concurrency = argparse.ArgumentParser(add_help=False)
+    concurrency.add_argument('--concurrency', type=int, default=4,
+                             help='Concurrent GitHub/LLM requests (default: %(default)s)')
+
+    deadline = argparse.ArgumentParser(add_help=False)
+    deadline.add_argument('--github-timeout', type=float, default=30.0,
+                          help='Seconds before a GitHub request is abandoned and retried (default: %(default)s)')
+    deadline.add_argument('--llm-timeout', type=float, default=180.0,
+                          help='Seconds before an LLM call is abandoned and retried (default: %(default)s)')
+    deadline.add_argument('--hedge', action='store_true',
+                          help='Send a duplicate of GitHub requests and LLM calls that run past the usual tail '
+                               'latency and use whichever answers first')
+    deadline.add_argument('--hedge-percentile', type=float, default=0.95,
+                          help='Latency percentile after which a call is hedged (default: %(default)s)')
+    deadline.add_argument('--hedge-budget', type=float, default=0.05,
+                          help='Maximum fraction of calls that may be hedged (default: %(default)s)')
+
+    stream = argparse.ArgumentParser(add_help=False)
+    stream.add_argument('--stream', action='store_true',
+                        help='Stream LLM responses and append each result to <run-dir>/stream.jsonl as it arrives')
+
+    prompt = argparse.ArgumentParser(add_help=False)
+    prompt.add_argument('--no-prompt-cache', dest='prompt_cache', action='store_false',
+                        help='Send the static instructions with every LLM call instead of caching them '
+                             'with the provider')
+    # Opt-in until compacted prompts are shown to classify the same as full ones
+    prompt.add_argument('--compact', action='store_true',
+                        help='Trim diffs, diff hunks and comments before sending them to the LLM')
+    prompt.add_argument('--hunk-window', type=int, default=6,
+                        help='Diff hunk lines kept on either side of a commented line (default: %(default)s)')
+
+    model = argparse.ArgumentParser(add_help=False)
+    model.add_argument('--model', default=os.getenv("GEMINI_MODEL"),
+                       help='Gemini model to call (default: $GEMINI_MODEL or gemini-1.5-flash-002)')
+    model.add_argument('--cascade', action='store_true',
+                       help='Categorize comments with --cheap-model first and have --strong-model re-check '
+                            'low-confidence answers and --escalate-on categories')
+    model.add_argument('--cheap-model', default=ModelCascade.CHEAP_MODEL,
+                       help='First-tier model of the cascade (default: %(default)s)')
+    model.add_argument('--strong-model', default=ModelCascade.STRONG_MODEL,
+                       help='Model that re-checks escalated comments (default: %(default)s)')
+    model.add_argument('--escalate-below', type=float, default=0.7,
+                       help='Cheap-tier confidence below which a comment is escalated (default: %(default)s)')
+    model.add_argument('--escalate-on', type=lambda value: [c.strip() for c in value.split(',') if c.strip()],
+                       default=['CRITICAL_BUG'],
+                       help="Comma-separated categories always escalated, or '' for none (default: CRITICAL_BUG)")
+
+    schedule = argparse.ArgumentParser(add_help=False)
+    schedule.add_argument('--schedule', choices=POLICIES, default='sjf',
+                          help='Order in which LLM jobs are admitted: fifo, sjf (cheapest first) '
+                               'or fair (weighted fair across job sizes) (default: %(default)s)')
+    schedule.add_argument('--max-oversized', type=int, default=1,
+                          help='Concurrent LLM slots that very large PRs may occupy (default: %(default)s)')
+
+    categorize = argparse.ArgumentParser(add_help=False)
+    categorize.add_argument('--no-pre-classify', dest='pre_classify', action='store_false',
+                            help='Send every comment to the LLM instead of labeling obvious ones locally')
+    categorize.add_argument('--no-dedup', dest='dedup', action='store_false',
+                            help='Classify duplicate comments individually')
+    categorize.add_argument('--sample-size', type=int,
+                            help='Classify a stratified random sample of about this many comments '
+                                 'and report estimated ratios with confidence intervals')
+    categorize.add_argument('--ci-width', type=float,
+                            help='Sample adaptively until every ratio\'s confidence interval is '
+                                 'narrower than this (e.g. 0.1)')
+    categorize.add_argument('--stratify', choices=STRATIFY_OPTIONS, default='bot',
+                            help='Sampling strata: per bot, or per bot and PR size (default: %(default)s)')
+
+    batch = argparse.ArgumentParser(add_help=False)
+    batch.add_argument('--stage', choices=BATCH_STAGES, required=True,
+                       help="Which prompts to batch: 'diffs' (diff analysis) or 'categorize'")
+    batch.add_argument('--backend', choices=('gemini', 'local'), default='gemini',
+                       help="Batch provider; 'local' runs the job through the online API for testing "
+                            "(default: %(default)s)")
+
+    collect = argparse.ArgumentParser(add_help=False)
+    collect.add_argument('--no-wait', dest='wait', action='store_false',
+                         help='Check the job once instead of polling until it finishes')
+    collect.add_argument('--poll-interval', type=float, default=60.0,
+                         help='Seconds between status checks (default: %(default)s)')
+    collect.add_argument('--timeout', type=float, help='Give up polling after this many seconds')
+
+    coordinate = argparse.ArgumentParser(add_help=False)
+    coordinate.add_argument('--categorize-batch-size', type=int, default=20,
+                            help='PRs per categorization job (default: %(default)s)')
+
+    work = argparse.ArgumentParser(add_help=False)
+    work.add_argument('--worker-id', help='Name recorded on leased jobs (default: <hostname>-<pid>)')
+    work.add_argument('--kinds', type=lambda value: value.split(','),
+                      help=f"Comma-separated job kinds to run, from {', '.join(JOB_KINDS)} (default: all)")
+    work.add_argument('--lease-seconds', type=float, default=300.0,
+                      help='How long a job stays leased without a heartbeat before others may retry it '
+                           '(default: %(default)s)')
+    work.add_argument('--exit-when-idle', action='store_true',
+                      help='Exit once the coordinator has enqueued everything and no jobs are left')
+
+    match = argparse.ArgumentParser(add_help=False)
+    match.add_argument('--reference', default='gemini',
+                       help='Bot whose comments are the reference findings (default: %(default)s)')
+    match.add_argument('--line-tolerance', type=int, default=3,
+                       help='Lines apart a comment and a finding may be and still be compared (default: %(default)s)')
+    match.add_argument('--no-judge', dest='judge', action='store_false',
+                       help='Count ambiguous comment/finding pairs as no match instead of asking the LLM')
+
+    similar = argparse.ArgumentParser(add_help=False)
+    similar.add_argument('--threshold', type=float, default=0.6,
+                         help='Cosine similarity at which two comments are grouped (default: %(default)s)')
+    similar.add_argument('--neighbors', type=int, default=10,
+                         help='Nearest neighbors considered per comment (default: %(default)s)')
+    similar.add_argument('--include-chunk', action='store_true',
+                         help='Compare the commented code as well as the comment text')
+
+    service = argparse.ArgumentParser(add_help=False)
+    service.add_argument('--no-diff-analysis', dest='analyze_diffs', action='store_false',
+                         help='Only classify bot comments; don\'t have Gemini analyze each new PR head')
+    service.add_argument('--save-interval', type=float, default=30.0,
+                         help='Seconds between saves of results.json while serving (default: %(default)s)')
+
+    server = argparse.ArgumentParser(add_help=False)
+    server.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: %(default)s)')
+    server.add_argument('--port', type=int, default=8080, help='Port to listen on (default: %(default)s)')
+    server.add_argument('--webhook-secret', default=os.getenv("GITHUB_WEBHOOK_SECRET"),
+                        help='Secret to verify webhook signatures with (default: $GITHUB_WEBHOOK_SECRET)')
+
+    replay = argparse.ArgumentParser(add_help=False)
+    replay.add_argument('payloads', nargs='+', help='Saved webhook payload JSON files, processed in order')
+    replay.add_argument('--event', choices=('pull_request', 'pull_request_review_comment'),
+                        help='Event type of the payloads (default: inferred from each payload)')
+
+    report = argparse.ArgumentParser(add_help=False)
+    report.add_argument('--format', type=_parse_formats, default=list(DEFAULT_REPORT_FORMATS),
+                        help=f"Comma-separated report formats from {', '.join(REPORT_FORMATS)}; 'preview' "
+                             f"writes low-resolution PNG charts (default: {','.join(DEFAULT_REPORT_FORMATS)})")
+
+    parser = argparse.ArgumentParser(
+        prog='code-review-evals',
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    subparsers.add_parser('fetch', parents=[common, fetch, concurrency, deadline],
+                          help='Fetch PR diffs and bot review comments').set_defaults(handler=cmd_fetch)
+    subparsers.add_parser('analyze-diffs', parents=[common, concurrency, schedule, stream, prompt, model, deadline],
+                          help='Find issues in fetched diffs with Gemini').set_defaults(handler=cmd_analyze_diffs)
+    subparsers.add_parser('categorize', parents=[common, categorize, stream, prompt, model, deadline],
+                          help='Categorize all stored comments').set_defaults(handler=cmd_categorize)
+    subparsers.add_parser('match', parents=[common, match, prompt, model, deadline],
+                          help='Score each bot\'s comments against the reference findings'
+                          ).set_defaults(handler=cmd_match)
+    subparsers.add_parser('similar', parents=[common, similar],
+                          help='Group similar comments across bots and PRs, locally'
+                          ).set_defaults(handler=cmd_similar)
+    subparsers.add_parser('report', parents=[common, report],
+                          help='Render reports and charts from categorization results').set_defaults(handler=cmd_report)
+    subparsers.add_parser('batch-submit', parents=[common, batch, categorize, model],
+                          help='Submit diff-analysis or categorization prompts as an offline batch job'
+                          ).set_defaults(handler=cmd_batch_submit)
+    subparsers.add_parser('batch-collect', parents=[common, batch, categorize, collect, model],
+                          help='Wait for a batch job and ingest its results into the run directory'
+                          ).set_defaults(handler=cmd_batch_collect)
+    subparsers.add_parser('coordinate', parents=[common, fetch, coordinate, deadline],
+                          help='Enqueue a run for workers and merge their results').set_defaults(handler=cmd_coordinate)
+    subparsers.add_parser('work', parents=[common, fetch, concurrency, categorize, prompt, model, deadline],
+                          help='Run queued fetch/analysis/categorization jobs').set_defaults(handler=cmd_work)
+    subparsers.add_parser('serve', parents=[common, fetch, prompt, model, service, server, deadline],
+                          help='Evaluate new PRs and bot comments as GitHub webhooks arrive'
+                          ).set_defaults(handler=cmd_serve)
+    subparsers.add_parser('replay', parents=[common, fetch, prompt, model, service, replay, deadline],
+                          help='Process saved webhook payloads as the server would').set_defaults(handler=cmd_replay)
+    subparsers.add_parser('run', parents=[common, fetch, concurrency, schedule, stream, categorize, prompt, model,
+                                          match, report, deadline],
+                          help='Run every stage in order').set_defaults(handler=cmd_run)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    load_dotenv()
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+
+    store = RunStore(args.run_dir, args.diff_store)
+    if args.profile:
+        asyncio.run(_run_profiled(args, store))
+    else:
+        asyncio.run(args.handler(args, store))
+
+
+if __name__ == "__main__":
+    main()
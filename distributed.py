@@ -0,0 +1,236 @@
+"""
+Coordinator/worker mode for backfills too large for one process.
+
+The coordinator lists PRs and enqueues one fetch job per PR into a durable
+work queue in the run directory. Workers, in any number of processes on
+machines that share the run directory, lease jobs and write their output to
+the shared RunStore:
+
+    fetch:<pr>          fetch diff and bot comments, then enqueue analyze:<pr>
+    analyze:<pr>        find issues in the diff with Gemini
+    categorize:<a>-<b>:<digest>
+                        categorize the comments of a batch of PRs; the digest
+                        covers the batch's PRs and their stored comment files
+
+Once every fetch and analysis job has finished, the coordinator enqueues the
+categorization batches, waits for them and merges the workers' partial
+results into results.json. Every job is idempotent, so a job whose worker
+crashed is simply leased again after its lease expires. A rerun with more
+PRs, new comments or a different batch size gets new categorization jobs, and
+only the partial results of this run's batches are merged.
+"""
+
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Optional, TYPE_CHECKING
+
+from analyzers.metrics import MetricsAccumulator
+from utils.run_store import RunStore
+from utils.work_queue import WorkQueue, Lease, DONE, FAILED, default_worker_id
+
+if TYPE_CHECKING:
+    from github.api import GitHubAPI
+    from analyzers.gemini import GeminiAnalyzer
+
+logger = logging.getLogger(__name__)
+
+JOB_KINDS = ('fetch', 'analyze', 'categorize')
+
+
+def partial_results_name(job_id: str) -> str:
+    return job_id.replace(':', '-')
+
+
+def merge_partial_results(partials: Iterable[Dict]) -> Dict:
+    """Combine per-job categorization results into one results dict"""
+    accumulator = MetricsAccumulator()
+    pre_classification = []
+    for partial in partials:
+        accumulator.merge_results(partial)
+        if 'pre_classification' in partial:
+            pre_classification.append(partial['pre_classification'])
+
+    results = accumulator.results()
+    if pre_classification:
+        results['pre_classification'] = _merge_pre_classification(pre_classification)
+    return results
+
+
+def _merge_pre_classification(stats_list: List[Dict]) -> Dict:
+    merged = {key: sum(stats[key] for stats in stats_list) for key in ('pre_classified', 'forwarded', 'audited')}
+    total = merged['pre_classified'] + merged['forwarded']
+    merged['skip_ratio'] = merged['pre_classified'] / total if total else 0.0
+
+    agreement = {}
+    for stats in stats_list:
+        for rule, counts in stats.get('agreement', {}).items():
+            rule_counts = agreement.setdefault(rule, {'agree': 0, 'total': 0})
+            rule_counts['agree'] += counts['agree']
+            rule_counts['total'] += counts['total']
+    merged['agreement'] = {
+        rule: {**counts, 'rate': counts['agree'] / counts['total'] if counts['total'] else None}
+        for rule, counts in agreement.items()
+    }
+    return merged
+
+
+class Coordinator:
+    """Enqueues a run's jobs, waits for the workers and merges their results"""
+
+    def __init__(self, store: RunStore, queue: WorkQueue, categorize_batch_size: int = 20,
+                 poll_interval: float = 10.0, max_attempts: int = 3):
+        self.store = store
+        self.queue = queue
+        self.categorize_batch_size = categorize_batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+    async def run(self, prs: List[dict]) -> Dict:
+        self.queue.set_closed(False)
+        self.store.save_prs(prs)
+        added = sum(
+            self.queue.enqueue(f"fetch:{pr['number']}", 'fetch', {'pr_number': pr['number']}, self.max_attempts)
+            for pr in prs
+        )
+        logger.info(f"Enqueued {added} fetch jobs ({len(prs) - added} already queued)")
+        await self.wait(('fetch', 'analyze'))
+
+        pr_numbers = sorted({
+            job['payload']['pr_number'] for job in self.queue.jobs(status=DONE, kind='fetch')
+        })
+        job_ids = []
+        for i in range(0, len(pr_numbers), self.categorize_batch_size):
+            chunk = pr_numbers[i:i + self.categorize_batch_size]
+            # Keyed by content, so a finished job is only reused while its PRs and their comments are unchanged
+            job_id = f"categorize:{chunk[0]}-{chunk[-1]}:{self.store.comments_fingerprint(chunk)[:12]}"
+            self.queue.enqueue(job_id, 'categorize', {'pr_numbers': chunk}, self.max_attempts)
+            job_ids.append(job_id)
+        # Nothing else will be enqueued; idle workers started with exit_when_idle can stop
+        self.queue.set_closed(True)
+        await self.wait(('categorize',))
+
+        self._record_failures()
+        partials = self.store.iter_partial_results(partial_results_name(job_id) for job_id in job_ids)
+        results = merge_partial_results(partials)
+        self.store.save_results(results)
+        return results
+
+    async def wait(self, kinds):
+        while True:
+            counts = await asyncio.to_thread(self.queue.counts, kinds)
+            logger.info(
+                f"{'/'.join(kinds)} jobs: {counts['done']} done, {counts['leased']} running, "
+                f"{counts['pending']} pending, {counts['failed']} failed"
+            )
+            if not counts['pending'] and not counts['leased']:
+                return counts
+            await asyncio.sleep(self.poll_interval)
+
+    def _record_failures(self):
+        for job in self.queue.jobs(status=FAILED):
+            logger.error(f"Job {job['id']} failed after {job['attempts']} attempts: {job['error']}")
+            if job['kind'] in ('fetch', 'analyze'):
+                self.store.dead_letter.add(job['payload']['pr_number'], job['kind'], RuntimeError(job['error']))
+
+
+class Worker:
+    """Leases jobs from the queue and runs them against the shared run directory"""
+
+    def __init__(self, store: RunStore, queue: WorkQueue,
+                 build_github: Callable[[], 'GitHubAPI'], build_analyzer: Callable[[], 'GeminiAnalyzer'],
+                 worker_id: Optional[str] = None, kinds: Optional[List[str]] = None, concurrency: int = 1,
+                 lease_seconds: float = 300.0, poll_interval: float = 5.0, exit_when_idle: bool = False):
+        self.store = store
+        self.queue = queue
+        self.build_github = build_github
+        self.build_analyzer = build_analyzer
+        self.worker_id = worker_id or default_worker_id()
+        self.kinds = kinds
+        self.concurrency = concurrency
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.exit_when_idle = exit_when_idle
+        self._github = None
+        self._analyzer = None
+        self.completed = 0
+
+    async def run(self):
+        logger.info(f"Worker {self.worker_id} started")
+        await asyncio.gather(*(self._slot() for _ in range(self.concurrency)))
+        logger.info(f"Worker {self.worker_id} finished after {self.completed} jobs")
+
+    async def _slot(self):
+        while True:
+            lease = await asyncio.to_thread(self.queue.lease, self.worker_id, self.kinds, self.lease_seconds)
+            if lease is not None:
+                await self._execute(lease)
+                continue
+
+            if self.exit_when_idle and self.queue.is_closed():
+                counts = self.queue.counts(self.kinds)
+                if not counts['pending'] and not counts['leased']:
+                    return
+            await asyncio.sleep(self.poll_interval)
+
+    async def _execute(self, lease: Lease):
+        logger.info(f"Running job {lease.job_id} (attempt {lease.attempts})")
+        heartbeat = asyncio.ensure_future(self._heartbeat(lease))
+        try:
+            await getattr(self, f"_run_{lease.kind}")(lease)
+        except Exception as e:
+            logger.error(f"Job {lease.job_id} failed: {str(e)}")
+            await asyncio.to_thread(self.queue.fail, lease, f"{type(e).__name__}: {e}", getattr(e, 'retryable', True))
+            return
+        finally:
+            heartbeat.cancel()
+
+        if await asyncio.to_thread(self.queue.complete, lease):
+            self.completed += 1
+
+    async def _heartbeat(self, lease: Lease):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            if not await asyncio.to_thread(self.queue.renew, lease, self.lease_seconds):
+                logger.warning(f"Lost lease on job {lease.job_id}; another worker may retry it")
+                return
+
+    async def _run_fetch(self, lease: Lease):
+        pr_number = lease.payload['pr_number']
+        if not (self.store.has_diff(pr_number) and self.store.has_comments(pr_number, 'github')):
+            github = self._get_github()
+            head_sha = self.store.head_sha(pr_number)
+            if not self.store.link_diff(github.repo, pr_number, head_sha):
+                self.store.save_diff(await github.fetch_pr_diff(pr_number), github.repo, head_sha)
+            bot_comments = await github.fetch_pr_comments(pr_number)
+            self.store.save_comments(pr_number, 'github', bot_comments)
+        self.queue.enqueue(f"analyze:{pr_number}", 'analyze', {'pr_number': pr_number})
+
+    async def _run_analyze(self, lease: Lease):
+        pr_number = lease.payload['pr_number']
+        if self.store.has_comments(pr_number, 'gemini'):
+            return
+        # analyze_diff raises on failure, so the job is released for a retry instead of saving no findings
+        comments = await self._get_analyzer().analyze_diff(self.store.load_diff(pr_number))
+        self.store.save_comments(pr_number, 'gemini', comments)
+
+    async def _run_categorize(self, lease: Lease):
+        comments = [
+            comment
+            for pr_number in lease.payload['pr_numbers']
+            for source in ('github', 'gemini')
+            if self.store.has_comments(pr_number, source)
+            for comment in self.store.load_comments(pr_number, source)
+        ]
+        # A fresh analyzer per job keeps pre-classifier stats scoped to this job's partial results
+        results = await self.build_analyzer().analyze_comment_quality_in_batch(comments)
+        self.store.save_partial_results(partial_results_name(lease.job_id), results)
+
+    def _get_github(self) -> 'GitHubAPI':
+        if self._github is None:
+            self._github = self.build_github()
+        return self._github
+
+    def _get_analyzer(self) -> 'GeminiAnalyzer':
+        if self._analyzer is None:
+            self._analyzer = self.build_analyzer()
+        return self._analyzer
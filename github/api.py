@@ -1,106 +1,218 @@
-import aiohttp
+import asyncio
+import json
+import random
 import logging
-from typing import List
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator, List, Optional, Union, TYPE_CHECKING
 from models import ReviewComment, PRDiff
+from .tokens import TokenPool
+from .errors import GitHubError, GitHubConnectionError, error_from_response
+from utils.profiling import awaited
+
+if TYPE_CHECKING:
+    from utils.hedging import Hedger
 
 logger = logging.getLogger(__name__)
 
+
+def _client_session():
+    # aiohttp is imported on first use to keep module import cheap
+    import aiohttp
+    return aiohttp.ClientSession()
+
+
+def parse_files_changed(diff_content: str) -> List[str]:
+    """Extract the paths of changed files from a unified diff"""
+    files_changed = []
+
+    # More robust file path extraction
+    for line in diff_content.split("\n"):
+        if line.startswith("+++ b/"):
+            # Remove the "+++ b/" prefix to get the file path
+            file_path = line[6:]  # "+++ b/" is 6 characters
+            if file_path and file_path != '/dev/null':  # Skip deleted files
+                files_changed.append(file_path)
+
+    return files_changed
+
+
+def parse_review_comment(comment: dict, pr_number: int) -> Optional[ReviewComment]:
+    """A GitHub review comment (API or webhook payload) as a ReviewComment, or None if a human wrote it"""
+    if 'bot' not in comment['user']['type'].lower():
+        return None
+    return ReviewComment(
+        file_name=comment['path'],
+        chunk=comment.get('diff_hunk', ''),
+        comment=comment['body'],
+        line_nums=f"{comment.get('line', '')}-{comment.get('original_line', '')}",
+        bot_name=comment['user']['login'],
+        pr_number=pr_number,
+        github_id=comment.get('id')
+    )
+
+
+@dataclass
+class RetryPolicy:
+    """Retries for transient GitHub failures (5xx, secondary rate limits, network errors)"""
+    max_retries: int = 5
+    base_delay: float = 1.0
+    max_delay: float = 60.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return retry_after + random.uniform(0, 1)
+        # Full jitter so concurrent workers don't retry in lockstep
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
 class GitHubAPI:
-    def __init__(self, token: str, repo: str):
-        self.token = token
+    JSON_ACCEPT = "application/vnd.github.v3+json"
+    DIFF_ACCEPT = "application/vnd.github.v3.diff"
+
+    def __init__(self, token: Union[str, List[str]], repo: str, retry_policy: Optional[RetryPolicy] = None,
+                 request_timeout: Optional[float] = 30.0, hedger: Optional['Hedger'] = None):
+        """Accepts a single token or a list of tokens to rotate between by remaining quota.
+
+        Each request is abandoned after `request_timeout` seconds and retried
+        per the retry policy. With a hedger, requests that run past the usual
+        tail latency get a duplicate.
+        """
+        tokens = [token] if isinstance(token, str) else list(token)
+        self.tokens = TokenPool(tokens)
         self.repo = repo
-        self.headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github.v3+json"
-        }
-        self.diff_headers = {
-            "Authorization": f"Bearer {token}",
-            "Accept": "application/vnd.github.v3.diff"
-        }
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.request_timeout = request_timeout
+        self.hedger = hedger
+        # A long-lived process can set a shared aiohttp session to keep connections alive between calls
+        self.session = None
+
+    @asynccontextmanager
+    async def _session(self):
+        if self.session is not None:
+            yield self.session
+            return
+        async with _client_session() as session:
+            yield session
 
     async def fetch_recent_prs(self, limit: int = 10) -> List[dict]:
         """Fetch recent PRs from the repository"""
-        async with aiohttp.ClientSession(headers=self.headers) as session:
+        return [pr async for pr in self.iter_recent_prs(limit)]
+
+
+    async def iter_recent_prs(self, limit: int = 10) -> AsyncIterator[dict]:
+        """Yield recent PRs page by page so consumers can start before the listing finishes"""
+        async with self._session() as session:
             url = f"https://api.github.com/repos/{self.repo}/pulls"
-            prs = []
+            yielded = 0
             page = 1
 
-            while len(prs) < limit:
+            while yielded < limit:
                 params = {
                     "state": "all",
-                    "per_page": min(10, limit - len(prs)),
+                    "per_page": min(10, limit - yielded),
                     "page": page,
                     "sort": "created",
                     "direction": "desc"
                 }
 
-                async with session.get(url, params=params) as response:
-                    if response.status != 200:
-                        raise Exception(f"Failed to fetch PRs: {await response.text()}")
-
-                    batch = await response.json()
-                    if not batch:
-                        break
+                batch = json.loads(await self._get(session, url, self.JSON_ACCEPT, params))
+                if not batch:
+                    break
 
-                    prs.extend(batch)
-                    page += 1
-
-            return prs[:limit]
+                for pr in batch[:limit - yielded]:
+                    yield pr
+                    yielded += 1
+                page += 1
 
 
     async def fetch_pr_diff(self, pr_number: int) -> PRDiff:
         """Fetch the diff content for a PR"""
         logger.info(f"Fetching PR {pr_number}")
-        async with aiohttp.ClientSession(headers=self.diff_headers) as session:
+        async with self._session() as session:
             url = f"https://api.github.com/repos/{self.repo}/pulls/{pr_number}"
 
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to fetch PR diff: {await response.text()}")
-
-                diff_content = await response.text()
-                files_changed = []
-                
-                # More robust file path extraction
-                for line in diff_content.split("\n"):
-                    if line.startswith("+++ b/"):
-                        try:
-                            # Remove the "+++ b/" prefix to get the file path
-                            file_path = line[6:]  # "+++ b/" is 6 characters
-                            if file_path and file_path != '/dev/null':  # Skip deleted files
-                                files_changed.append(file_path)
-                        except Exception as e:
-                            logger.warning(f"Could not parse file path from line: {line}")
-                            continue
-
-                logger.debug(f"Found {len(files_changed)} changed files in PR {pr_number}")
-                return PRDiff(
-                    pr_number=pr_number,
-                    diff_content=diff_content,
-                    files_changed=files_changed
-                )
+            diff_content = await self._get(session, url, self.DIFF_ACCEPT)
+            files_changed = parse_files_changed(diff_content)
+
+            logger.debug(f"Found {len(files_changed)} changed files in PR {pr_number}")
+            return PRDiff(
+                pr_number=pr_number,
+                diff_content=diff_content,
+                files_changed=files_changed
+            )
             
 
     async def fetch_pr_comments(self, pr_number: int) -> List[ReviewComment]:
         """Fetch review comments for a PR"""
-        async with aiohttp.ClientSession(headers=self.headers) as session:
+        async with self._session() as session:
             url = f"https://api.github.com/repos/{self.repo}/pulls/{pr_number}/comments"
 
-            async with session.get(url) as response:
-                if response.status != 200:
-                    raise Exception(f"Failed to fetch PR comments: {await response.text()}")
-
-                comments = await response.json()
-                return [
-                    ReviewComment(
-                        file_name=comment['path'],
-                        chunk=comment.get('diff_hunk', ''),
-                        comment=comment['body'],
-                        line_nums=f"{comment.get('line', '')}-{comment.get('original_line', '')}",
-                        bot_name=comment['user']['login'],
-                        pr_number=pr_number
-                    )
-                    for comment in comments
-                    if 'bot' in comment['user']['type'].lower()
-                ]
-            
+            comments = json.loads(await self._get(session, url, self.JSON_ACCEPT))
+            return [
+                review_comment for review_comment in (parse_review_comment(comment, pr_number) for comment in comments)
+                if review_comment is not None
+            ]
+
+
+    async def _get(self, session, url: str, accept: str, params: Optional[dict] = None) -> str:
+        """GET a URL and return the body, retrying transient failures.
+
+        Raises a GitHubError subclass once retries are exhausted, or
+        immediately for permanent failures such as 404/410.
+        """
+        attempt = 0
+        while True:
+            try:
+                async with awaited(f"GET {url}"):
+                    if self.hedger is None:
+                        return await self._get_once(session, url, accept, params)
+                    # Diffs take much longer than JSON listings, so each kind has its own latency profile
+                    return await self.hedger.run(accept, lambda: self._get_once(session, url, accept, params))
+            except GitHubError as e:
+                if not e.retryable or attempt >= self.retry_policy.max_retries:
+                    raise
+                delay = self.retry_policy.delay(attempt, e.retry_after)
+                attempt += 1
+                logger.warning(
+                    f"{type(e).__name__} ({e.status}) for {url}; "
+                    f"retry {attempt}/{self.retry_policy.max_retries} in {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+
+
+    async def _get_once(self, session, url: str, accept: str, params: Optional[dict] = None) -> str:
+        """One logical GET using the token with the most quota, switching tokens when one runs out.
+
+        If every token is exhausted, waits in TokenPool.acquire until the
+        earliest reset.
+        """
+        import aiohttp
+
+        timeout = aiohttp.ClientTimeout(total=self.request_timeout)
+        max_attempts = 3 * len(self.tokens)
+        for attempt in range(max_attempts):
+            token = await self.tokens.acquire()
+            # Diffs compress well; aiohttp decompresses the body transparently
+            headers = {"Authorization": f"Bearer {token}", "Accept": accept, "Accept-Encoding": "gzip, deflate"}
+
+            try:
+                async with session.get(url, params=params, headers=headers, timeout=timeout) as response:
+                    self.tokens.update(token, response.headers)
+                    body = await response.text()
+                    status, response_headers = response.status, response.headers
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise GitHubConnectionError(f"Request to {url} failed: {e!r}", url=url) from e
+
+            if status == 200:
+                return body
+
+            primary_rate_limited = (
+                status in (403, 429) and response_headers.get('X-RateLimit-Remaining') == '0'
+            )
+            if not primary_rate_limited or attempt == max_attempts - 1:
+                raise error_from_response(status, body, response_headers, url)
+
+            reset = response_headers.get('X-RateLimit-Reset')
+            self.tokens.mark_exhausted(token, float(reset) if reset else None)
+            logger.warning(f"GitHub token ...{token[-4:]} hit its rate limit; rotating to another token")
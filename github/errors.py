@@ -0,0 +1,55 @@
+from typing import Mapping, Optional
+
+
+class GitHubError(Exception):
+    """A failed GitHub API request"""
+
+    retryable = False
+
+    def __init__(self, message: str, status: Optional[int] = None, url: Optional[str] = None,
+                 retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status = status
+        self.url = url
+        self.retry_after = retry_after
+
+
+class GitHubNotFoundError(GitHubError):
+    """404/410: the resource is gone; retrying won't help"""
+
+
+class GitHubClientError(GitHubError):
+    """Other 4xx responses (bad credentials, validation errors)"""
+
+
+class GitHubServerError(GitHubError):
+    """5xx responses"""
+
+    retryable = True
+
+
+class GitHubSecondaryRateLimitError(GitHubError):
+    """403/429 caused by abuse/secondary limits rather than the hourly quota"""
+
+    retryable = True
+
+
+class GitHubConnectionError(GitHubError):
+    """Network failure or timeout before a response arrived"""
+
+    retryable = True
+
+
+def error_from_response(status: int, body: str, headers: Mapping[str, str], url: str) -> GitHubError:
+    """Map a non-2xx response to a typed error"""
+    message = f"GitHub request failed with {status} for {url}: {body[:500]}"
+    retry_after = headers.get('Retry-After')
+    retry_after = float(retry_after) if retry_after and retry_after.isdigit() else None
+
+    if status in (404, 410):
+        return GitHubNotFoundError(message, status, url)
+    if status >= 500:
+        return GitHubServerError(message, status, url, retry_after)
+    if status == 429 or (status == 403 and (retry_after is not None or 'secondary rate limit' in body.lower())):
+        return GitHubSecondaryRateLimitError(message, status, url, retry_after)
+    return GitHubClientError(message, status, url)
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Mapping, Optional
+
+logger = logging.getLogger(__name__)
+
+# Core REST quota for an authenticated token; used until the first response reports the real value
+DEFAULT_QUOTA = 5000
+
+
+@dataclass
+class TokenState:
+    token: str
+    remaining: int = DEFAULT_QUOTA
+    limit: int = DEFAULT_QUOTA
+    reset_at: float = 0.0
+
+    def headroom(self, now: float) -> int:
+        # Once the reset time has passed the token has its full quota again
+        if self.reset_at and now >= self.reset_at:
+            return self.limit
+        return self.remaining
+
+
+class TokenPool:
+    """Rotates GitHub tokens by remaining rate-limit quota.
+
+    Each request goes to the token with the most headroom according to the
+    X-RateLimit-* headers seen so far. When every token is exhausted the pool
+    sleeps until the earliest reset instead of failing.
+    """
+
+    def __init__(self, tokens: List[str], reserve: int = 0):
+        tokens = [token for token in tokens if token]
+        if not tokens:
+            raise ValueError("At least one GitHub token is required")
+
+        self._states: Dict[str, TokenState] = {token: TokenState(token) for token in dict.fromkeys(tokens)}
+        self.reserve = reserve
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    async def acquire(self) -> str:
+        """Return the token with the most remaining quota, waiting for a reset if all are exhausted"""
+        async with self._lock:
+            while True:
+                now = time.time()
+                best = max(self._states.values(), key=lambda state: state.headroom(now))
+
+                if best.headroom(now) > self.reserve:
+                    if best.reset_at and now >= best.reset_at:
+                        best.remaining, best.reset_at = best.limit, 0.0
+                    # Count the request up front so concurrent callers spread across tokens
+                    best.remaining -= 1
+                    return best.token
+
+                wake_at = min(state.reset_at for state in self._states.values())
+                sleep_time = max(1.0, wake_at - now + 1)
+                logger.warning(
+                    f"All {len(self._states)} GitHub tokens exhausted; sleeping {sleep_time:.0f}s until rate limit reset"
+                )
+                await asyncio.sleep(sleep_time)
+
+    def update(self, token: str, headers: Mapping[str, str]):
+        """Record the quota reported by a response's rate-limit headers"""
+        state = self._states.get(token)
+        if state is None:
+            return
+
+        remaining = headers.get('X-RateLimit-Remaining')
+        if remaining is not None:
+            state.remaining = int(remaining)
+        limit = headers.get('X-RateLimit-Limit')
+        if limit is not None:
+            state.limit = int(limit)
+        reset = headers.get('X-RateLimit-Reset')
+        if reset is not None:
+            state.reset_at = float(reset)
+
+    def mark_exhausted(self, token: str, reset_at: Optional[float] = None):
+        state = self._states.get(token)
+        if state is None:
+            return
+        state.remaining = 0
+        if reset_at:
+            state.reset_at = reset_at
+        elif not state.reset_at or state.reset_at <= time.time():
+            # No reset header: back off for a minute before trying this token again
+            state.reset_at = time.time() + 60
+
+    def snapshot(self) -> List[Dict]:
+        """Current quota per token (tokens masked), for logging"""
+        return [
+            {'token': f"...{state.token[-4:]}", 'remaining': state.remaining, 'reset_at': state.reset_at}
+            for state in self._states.values()
+        ]
@@ -1,16 +1,12 @@
 import asyncio
 import logging
 import os
-from typing import List
+from typing import List, Optional
 import re
 from datetime import datetime
 from collections import defaultdict
 
-from github.api import GitHubAPI
-from analyzers.gemini import GeminiAnalyzer
-from visualization.visualizer import ResultsVisualizer
 from models import ReviewComment
-import os
 from dotenv import load_dotenv
 
 # Load environment variables at the start of the script
@@ -124,63 +120,83 @@ def write_comment_to_log(file_handle, comment: ReviewComment):
 
 
 async def main():
+    # Heavy SDK and plotting imports are deferred until a run actually needs them
+    from github.api import GitHubAPI
+    from analyzers.gemini import GeminiAnalyzer
+    from analyzers.preclassifier import RuleBasedPreClassifier
+    from analyzers.dedup import CommentDeduplicator
+    from analyzers.prompt_cache import GeminiPromptCache
+    from analyzers.compaction import PromptCompactor
+    from visualization.visualizer import ResultsVisualizer
+    from pipeline import StreamingPipeline
+    from utils.dead_letter import DeadLetterQueue
+    from utils.diff_store import DiffStore
+    from utils.scheduler import CostScheduler
+
     # Load configuration from environment
     GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+    # Optional comma-separated pool of tokens to rotate between as rate limits run out
+    GITHUB_TOKENS = [t.strip() for t in os.getenv("GITHUB_TOKENS", "").split(',') if t.strip()] or [GITHUB_TOKEN]
     REPO = os.getenv("GITHUB_REPO", "microsoft/typescript")
     GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+    NUM_PRS = int(os.getenv("NUM_PRS", "100"))
     
-    if not all([GITHUB_TOKEN, GOOGLE_API_KEY]):
+    if not all([GITHUB_TOKENS[0], GOOGLE_API_KEY]):
         raise ValueError("Missing required environment variables. Please set GITHUB_TOKEN and GOOGLE_API_KEY")
     
     # Initialize components
-    github = GitHubAPI(GITHUB_TOKEN, REPO)
-    analyzer = GeminiAnalyzer(GOOGLE_API_KEY)
+    github = GitHubAPI(GITHUB_TOKENS, REPO)
+    analyzer = GeminiAnalyzer(
+        GOOGLE_API_KEY,
+        pre_classifier=RuleBasedPreClassifier(),
+        deduplicator=CommentDeduplicator(),
+        prompt_cache=GeminiPromptCache(),
+        compactor=PromptCompactor() if os.getenv("COMPACT_PROMPTS") else None,
+        model_name=os.getenv("GEMINI_MODEL")
+    )
     visualizer = ResultsVisualizer()
     
     try:
         output_dir = 'analysis_results'
         os.makedirs(output_dir, exist_ok=True)
         comments_log_path = os.path.join(output_dir, 'pr_comments.txt')
+        # PRs that fail are recorded here with the stage that failed ('fetch' or 'analyze')
+        dead_letter = DeadLetterQueue(os.path.join(output_dir, 'failed_prs.json'))
         
         # Either load existing comments or fetch new ones
         if os.path.exists(comments_log_path) and os.path.getsize(comments_log_path) > 0:
             logger.info("Reading comments from existing log file...")
             comments = parse_comments_from_log(comments_log_path)
             logger.info(f"Loaded {len(comments)} comments from log file")
+
+            # Analyze comments and generate reports
+            logger.info("Analyzing comment quality...")
+            analysis_results = await analyzer.analyze_comment_quality_in_batch(comments)
         else:
             logger.info("Fetching new PR comments...")
-            prs = await github.fetch_recent_prs(limit=100)
-            comments = []
-            
+
             with open(comments_log_path, 'w') as comments_log:
-                for pr in prs:
+                def log_pr(pr: dict, pr_comments: List[ReviewComment], error: Optional[Exception],
+                           stage: Optional[str]):
                     pr_number = pr['number']
-                    logger.info(f"Processing PR #{pr_number}...")
-                    
                     comments_log.write(f"=== PR #{pr_number} Comments ===\n")
                     comments_log.write(f"PR Title: {pr.get('title', 'No Title')}\n")
                     comments_log.write(f"PR URL: {pr.get('html_url', 'No URL')}\n\n")
-                    
-                    try:
-                        logger.info(f"Fetching PR {pr_number}")
-                        diff = await github.fetch_pr_diff(pr_number)
-                        logger.info(f"Fetching comments for PR {pr_number}")
-                        bot_comments = await github.fetch_pr_comments(pr_number)
-                        logger.info(f"Analyzing PR for {pr_number}")
-                        gemini_comments = await analyzer.analyze_diff(diff)
-                        
-                        for comment in bot_comments + gemini_comments:
-                            write_comment_to_log(comments_log, comment)
-                            comments.append(comment)
-                            
-                    except Exception as e:
-                        logger.error(f"Error processing PR #{pr_number}: {str(e)}")
-                        comments_log.write(f"Error processing PR #{pr_number}: {str(e)}\n\n")
-                        continue
-        
-        # Analyze comments and generate reports
-        logger.info("Analyzing comment quality...")
-        analysis_results = await analyzer.analyze_comment_quality_in_batch(comments)
+
+                    if error:
+                        comments_log.write(f"Error processing PR #{pr_number}: {str(error)}\n\n")
+                        dead_letter.add(pr_number, stage, error, pr)
+                    for comment in pr_comments:
+                        write_comment_to_log(comments_log, comment)
+
+                # Stream PRs through fetch, diff analysis and categorization concurrently
+                pipeline = StreamingPipeline(
+                    github, analyzer, on_pr=log_pr,
+                    scheduler=CostScheduler(policy=os.getenv("LLM_SCHEDULE", "sjf")),
+                    # Diffs are kept compressed on disk so reruns don't download them again
+                    diff_store=DiffStore(os.path.join(output_dir, 'diff_store'))
+                )
+                analysis_results = await pipeline.run(limit=NUM_PRS)
         
         logger.info("Generating visualizations and reports...")
         
@@ -1,9 +1,13 @@
-from dataclasses import dataclass
+import sys
+from dataclasses import asdict, dataclass
 from enum import Enum
-from typing import List, Optional
+from typing import Dict, Iterator, List, NamedTuple, Optional
 from pydantic import BaseModel
 
-@dataclass
+# Slotted dataclasses drop the per-instance __dict__ (Python 3.10+)
+_SLOTS = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_SLOTS)
 class ReviewComment:
     file_name: str
     chunk: str
@@ -12,13 +16,79 @@ class ReviewComment:
     bot_name: str
     pr_number: int
     category: Optional[str] = None
+    # GitHub's review comment id; None for LLM findings and comments stored before it was recorded
+    github_id: Optional[int] = None
+
+    # Highly repetitive across a corpus; interning shares one string object per distinct value
+    _INTERNED_FIELDS = frozenset(('file_name', 'bot_name', 'category'))
+
+    def __setattr__(self, name, value):
+        if name in ReviewComment._INTERNED_FIELDS and type(value) is str:
+            value = sys.intern(value)
+        object.__setattr__(self, name, value)
+
+class CommentTable:
+    """Append-only table of comments that classification records refer to by ID.
+
+    Records hold a small integer `comment_id` instead of copies of the
+    comment text, file name and code chunk.
+    """
+
+    __slots__ = ('_rows', '_ids')
+
+    def __init__(self, comments: Optional[List[ReviewComment]] = None):
+        self._rows: List[ReviewComment] = []
+        self._ids: Dict[int, int] = {}
+        for comment in comments or []:
+            self.add(comment)
+
+    def add(self, comment: ReviewComment) -> int:
+        """Return the comment's ID, adding it if this object isn't in the table yet"""
+        comment_id = self._ids.get(id(comment))
+        if comment_id is None:
+            comment_id = len(self._rows)
+            self._rows.append(comment)
+            self._ids[id(comment)] = comment_id
+        return comment_id
+
+    def __getitem__(self, comment_id: int) -> ReviewComment:
+        return self._rows[comment_id]
 
-@dataclass
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self) -> Iterator[ReviewComment]:
+        return iter(self._rows)
+
+    def to_records(self) -> List[dict]:
+        return [asdict(comment) for comment in self._rows]
+
+    @classmethod
+    def from_records(cls, records: List[dict]) -> 'CommentTable':
+        return cls([ReviewComment(**record) for record in records])
+
+class IndexedComment(NamedTuple):
+    """A comment together with its position in its bot/PR group"""
+    bot_name: str
+    pr_number: int
+    comment_index: int
+    comment: ReviewComment
+
+    @property
+    def key(self):
+        return (self.bot_name, self.pr_number, self.comment_index)
+
+@dataclass(**_SLOTS)
 class PRDiff:
     pr_number: int
     diff_content: str
     files_changed: List[str]
 
+    @property
+    def size(self) -> int:
+        """Length of the diff text in characters"""
+        return len(self.diff_content)
+
 class ImpactLevel(str, Enum):
     HIGH = "High"
     MEDIUM = "Medium"
@@ -0,0 +1,299 @@
+"""
+Streaming evaluation pipeline.
+
+PR listing -> fetch -> diff analysis -> batch packer -> categorizer -> metrics sink
+
+Stages run concurrently and are connected by bounded queues, so a slow stage
+applies backpressure to the stages in front of it and only a few PRs' worth of
+comments are in flight at any time. Categorization starts as soon as the first
+pack of comments is ready instead of after the last PR has been analyzed.
+
+With a CostScheduler, diff analysis and categorization share one pool of LLM
+slots and jobs are admitted by estimated cost rather than arrival order, so a
+few huge PRs can't hold up the rest of the stream.
+
+With a DiffStore, fetched diffs are kept compressed on disk and only their
+refs travel through the queues; a PR head already in the store isn't
+downloaded again.
+"""
+
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, Dict, List, Optional, TYPE_CHECKING
+
+from analyzers.metrics import MetricsAccumulator
+from models import ReviewComment
+from utils.rate_limiter import wait_with_timeout
+from utils.scheduler import estimate_comments_cost, estimate_diff_cost
+
+if TYPE_CHECKING:
+    from github.api import GitHubAPI
+    from analyzers.gemini import GeminiAnalyzer
+    from utils.scheduler import CostScheduler
+    from utils.diff_store import DiffStore
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+@dataclass
+class PipelineProgress:
+    prs_processed: int
+    prs_failed: int
+    comments_categorized: int
+    elapsed: float
+    metrics: Dict[str, Dict[str, float]]
+
+
+class StreamingPipeline:
+    def __init__(
+        self,
+        github: 'GitHubAPI',
+        analyzer: 'GeminiAnalyzer',
+        fetch_concurrency: int = 4,
+        analysis_concurrency: int = 4,
+        categorize_concurrency: int = 2,
+        queue_size: int = 8,
+        pack_size: int = 100,
+        pack_timeout: float = 5.0,
+        on_pr: Optional[Callable[[dict, List[ReviewComment], Optional[Exception], Optional[str]], None]] = None,
+        scheduler: Optional['CostScheduler'] = None,
+        diff_store: Optional['DiffStore'] = None,
+        fetch_timeout: Optional[float] = 300.0,
+        analysis_timeout: Optional[float] = 900.0
+    ):
+        self.github = github
+        self.analyzer = analyzer
+        self.fetch_concurrency = fetch_concurrency
+        self.analysis_concurrency = analysis_concurrency
+        self.categorize_concurrency = categorize_concurrency
+        self.queue_size = queue_size
+        self.pack_size = pack_size
+        self.pack_timeout = pack_timeout
+        self.on_pr = on_pr
+        self.scheduler = scheduler
+        self.diff_store = diff_store
+        # Per-PR stage deadlines; a PR that misses one is cancelled and reported as failed
+        self.fetch_timeout = fetch_timeout
+        self.analysis_timeout = analysis_timeout
+
+        self.accumulator = MetricsAccumulator()
+        self._prs_processed = 0
+        self._prs_failed = 0
+        self._comments_categorized = 0
+        self._started = 0.0
+
+    async def run(self, limit: int) -> Dict[str, Dict]:
+        """Run the pipeline to completion and return the final analysis results"""
+        async for progress in self.stream(limit):
+            logger.info(
+                f"Progress: {progress.prs_processed} PRs processed, "
+                f"{progress.comments_categorized} comments categorized "
+                f"({progress.elapsed:.1f}s)"
+            )
+        return self.results()
+
+    def results(self) -> Dict[str, Dict]:
+        return self.analyzer.collect_results(self.accumulator)
+
+    async def stream(self, limit: int) -> AsyncIterator[PipelineProgress]:
+        """Run the pipeline, yielding a progress snapshot after each categorized pack"""
+        self._started = time.monotonic()
+
+        pr_queue = asyncio.Queue(self.queue_size)
+        diff_queue = asyncio.Queue(self.queue_size)
+        comment_queue = asyncio.Queue(self.queue_size)
+        pack_queue = asyncio.Queue(self.categorize_concurrency)
+        progress_queue = asyncio.Queue()
+
+        analysis_workers, categorize_workers = self.analysis_concurrency, self.categorize_concurrency
+        if self.scheduler:
+            # Extra workers park their jobs in the scheduler so it has a choice of what to admit next
+            analysis_workers += self.queue_size
+            categorize_workers += self.categorize_concurrency
+
+        stages = [asyncio.ensure_future(stage) for stage in (
+            self._list_prs(limit, pr_queue),
+            self._stage(self.fetch_concurrency, self._fetch, pr_queue, diff_queue),
+            self._stage(analysis_workers, self._analyze, diff_queue, comment_queue),
+            self._pack(comment_queue, pack_queue),
+            self._stage(categorize_workers, self._categorize, pack_queue, progress_queue),
+        )]
+        runner = asyncio.gather(*stages)
+
+        try:
+            while True:
+                getter = asyncio.ensure_future(progress_queue.get())
+                await asyncio.wait({getter, runner}, return_when=asyncio.FIRST_COMPLETED)
+
+                if not getter.done():
+                    getter.cancel()
+                    # A stage crashed; surface its exception
+                    runner.result()
+                    continue
+
+                item = getter.result()
+                if item is _DONE:
+                    break
+                yield item
+
+            await runner
+        finally:
+            # Stop the remaining stages if the consumer stopped early or a stage failed
+            for stage in stages:
+                stage.cancel()
+            await asyncio.gather(*stages, return_exceptions=True)
+            if not runner.cancelled():
+                # Retrieved so asyncio doesn't log the cancelled stages' error as never retrieved
+                runner.exception()
+
+    async def _stage(self, workers: int, handler, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """Run `workers` copies of handler over in_queue, then mark out_queue as done"""
+        async def worker():
+            while True:
+                item = await in_queue.get()
+                if item is _DONE:
+                    # Let sibling workers see the end marker too
+                    await in_queue.put(_DONE)
+                    return
+                await handler(item, out_queue)
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+        await out_queue.put(_DONE)
+
+    async def _list_prs(self, limit: int, out_queue: asyncio.Queue):
+        async for pr in self.github.iter_recent_prs(limit):
+            await out_queue.put(pr)
+        # Not in a `finally`: once cancelled, nothing drains the queue and the put would never return
+        await out_queue.put(_DONE)
+
+    async def _fetch(self, pr: dict, out_queue: asyncio.Queue):
+        pr_number = pr['number']
+
+        async def fetch():
+            diff = await self._fetch_diff(pr)
+            logger.info(f"Fetching comments for PR {pr_number}")
+            return diff, await self.github.fetch_pr_comments(pr_number)
+
+        try:
+            diff, bot_comments = await self._within_deadline(fetch(), self.fetch_timeout, f"Fetching PR #{pr_number}")
+        except Exception as e:
+            self._pr_failed(pr, e, 'fetch')
+            return
+
+        await out_queue.put((pr, diff, bot_comments))
+
+    async def _fetch_diff(self, pr: dict):
+        pr_number = pr['number']
+        if self.diff_store is None:
+            logger.info(f"Fetching PR {pr_number}")
+            return await self.github.fetch_pr_diff(pr_number)
+
+        head_sha = (pr.get('head') or {}).get('sha')
+        ref = self.diff_store.lookup(self.github.repo, pr_number, head_sha)
+        if ref is None:
+            logger.info(f"Fetching PR {pr_number}")
+            ref = self.diff_store.put(await self.github.fetch_pr_diff(pr_number), self.github.repo, head_sha)
+        else:
+            logger.info(f"Using stored diff for PR {pr_number}")
+        return self.diff_store.open(ref)
+
+    async def _analyze(self, item, out_queue: asyncio.Queue):
+        pr, diff, bot_comments = item
+        try:
+            logger.info(f"Analyzing PR for {pr['number']}")
+            if self.scheduler:
+                # The deadline starts once the scheduler admits the job, not while it waits for a slot
+                gemini_comments = await self.scheduler.run(estimate_diff_cost(diff), self._analyze_diff, diff)
+            else:
+                gemini_comments = await self._analyze_diff(diff)
+        except Exception as e:
+            # The bots' comments are still categorized; only the reference findings are missing
+            self._pr_failed(pr, e, 'analyze', bot_comments)
+            if bot_comments:
+                await out_queue.put(bot_comments)
+            return
+
+        comments = bot_comments + gemini_comments
+        self._prs_processed += 1
+        if self.on_pr:
+            self.on_pr(pr, comments, None, None)
+
+        if comments:
+            await out_queue.put(comments)
+
+    async def _analyze_diff(self, diff) -> List[ReviewComment]:
+        return await self._within_deadline(
+            self.analyzer.analyze_diff(diff), self.analysis_timeout, f"Analyzing PR #{diff.pr_number}"
+        )
+
+    @staticmethod
+    async def _within_deadline(coro, timeout: Optional[float], description: str):
+        if timeout is None:
+            return await coro
+        try:
+            return await wait_with_timeout(coro, timeout)
+        except asyncio.TimeoutError:
+            raise asyncio.TimeoutError(f"{description} missed its {timeout:g}s deadline")
+
+    async def _pack(self, in_queue: asyncio.Queue, out_queue: asyncio.Queue):
+        """Group per-PR comment lists into packs of roughly pack_size comments.
+
+        A pack is flushed when it is full or pack_timeout seconds after its
+        first PR arrived, so slow PR streams still produce early results.
+        A single PR's comments are never split across packs.
+        """
+        pack: List[ReviewComment] = []
+        deadline = None
+        getter = None
+
+        while True:
+            # Keep the same getter across timeouts so no dequeued item is ever dropped
+            if getter is None:
+                getter = asyncio.ensure_future(in_queue.get())
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            await asyncio.wait({getter}, timeout=timeout)
+
+            item = None
+            if getter.done():
+                item, getter = getter.result(), None
+
+            if item is _DONE:
+                break
+
+            if item:
+                if not pack:
+                    deadline = time.monotonic() + self.pack_timeout
+                pack.extend(item)
+
+            if pack and (len(pack) >= self.pack_size or item is None):
+                await out_queue.put(pack)
+                pack, deadline = [], None
+
+        if pack:
+            await out_queue.put(pack)
+        await out_queue.put(_DONE)
+
+    async def _categorize(self, pack: List[ReviewComment], out_queue: asyncio.Queue):
+        if self.scheduler:
+            await self.scheduler.run(estimate_comments_cost(pack), self.analyzer.categorize, pack, self.accumulator)
+        else:
+            await self.analyzer.categorize(pack, self.accumulator)
+        self._comments_categorized += len(pack)
+        await out_queue.put(PipelineProgress(
+            prs_processed=self._prs_processed,
+            prs_failed=self._prs_failed,
+            comments_categorized=self._comments_categorized,
+            elapsed=time.monotonic() - self._started,
+            metrics=self.accumulator.finalize_metrics()
+        ))
+
+    def _pr_failed(self, pr: dict, error: Exception, stage: str, comments: Optional[List[ReviewComment]] = None):
+        logger.error(f"Error processing PR #{pr['number']} ({stage}): {str(error)}")
+        self._prs_failed += 1
+        if self.on_pr:
+            self.on_pr(pr, comments or [], error, stage)
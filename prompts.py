@@ -1,25 +1,44 @@
 """
 Centralized storage for all prompts used in code review analysis.
 Each prompt is organized by analyzer type and purpose.
+
+Prompts are split into a static prefix (instructions and output format,
+identical on every call) followed by a suffix template holding the diff or
+comments, so providers can cache the prefix once instead of re-reading it on
+every request.
 """
 
+from typing import NamedTuple
+
+
+class PromptTemplate(NamedTuple):
+    prefix: str
+    suffix: str
+
+    def format(self, **kwargs) -> str:
+        return self.prefix + self.suffix.format(**kwargs)
+
+
 # Common templates that can be used across different analyzers
-# Common templates that can be used across different analyzers
-DIFF_ANALYSIS_TEMPLATE = """You are a senior staff principle engineer performing a security and functionality focused code review.
+DIFF_ANALYSIS_INSTRUCTIONS = """You are a senior staff principle engineer performing a security and functionality focused code review.
 Go through this PR diff line by line, focusing ONLY on bugs that could cause:
 1. Runtime errors or crashes
-2. Race conditions 
+2. Race conditions
 3. Memory leaks
 4. State management issues
 5. Security vulnerabilities
 6. Data loss or corruption
 7. Performance issues
-8. Resource leaks
+8. Resource leaks"""
+
+DIFF_ANALYSIS_REMINDER = "Remember: Only report issues that could actually break functionality or corrupt data at runtime."
+
+DIFF_ANALYSIS_TEMPLATE = f"""{DIFF_ANALYSIS_INSTRUCTIONS}
 
 Analyze this diff:
-{diff}
+{{diff}}
 
-Remember: Only report issues that could actually break functionality or corrupt data at runtime."""
+{DIFF_ANALYSIS_REMINDER}"""
 
 COMMENT_CATEGORIES = """
 1. CRITICAL_BUG: Comments identifying serious issues that could cause crashes, data loss, security vulnerabilities, etc.
@@ -28,44 +47,88 @@ COMMENT_CATEGORIES = """
 
 # Gemini-specific prompts
 GEMINI_PROMPTS = {
-    "diff_analysis": f"""{DIFF_ANALYSIS_TEMPLATE}
+    "diff_analysis": PromptTemplate(
+        prefix=f"""{DIFF_ANALYSIS_INSTRUCTIONS}
 
 The output format should be the following JSON EXACTLY:
-{{{{
+{{
     "issues": [
-        {{{{
+        {{
             "bug_description": "1-2 line description of how this bug impacts runtime behavior and how to fix it",
             "severity": "HIGH|MEDIUM|LOW based on potential user impact",
             "bug_type": "RACE_CONDITION|STATE_MANAGEMENT|MEMORY_LEAK|SECURITY|CRASH|CORRUPTION",
             "file_name": "Affected file",
             "line_numbers": "Relevant line numbers",
             "snippet": "Code showing the bug"
-        }}}}
+        }}
     ]
-}}}}""",
+}}
+
+""",
+        suffix=f"""Analyze this diff:
+{{diff}}
 
-    "comment_categorization": f"""As a senior engineer, analyze these code review comments and categorize each one into exactly ONE of:
+{DIFF_ANALYSIS_REMINDER}"""
+    ),
+
+    "comment_categorization": PromptTemplate(
+        prefix=f"""As a senior engineer, analyze code review comments and categorize each one into exactly ONE of:
 {COMMENT_CATEGORIES}
 
-PR #{{pr_number}} by {{bot_name}}:
-{{comments}}
+Respond with a JSON array where each object has:
+{{
+    "comment_index": "<index>",
+    "category": "CRITICAL_BUG|NITPICK|OTHER",
+    "reasoning": "Brief explanation of why this category was chosen"
+}}
+IMPORTANT: Each comment MUST be categorized. The category field MUST be exactly one of CRITICAL_BUG, NITPICK, or OTHER.
+
+""",
+        suffix="""PR #{pr_number} by {bot_name}:
+{comments}"""
+    ),
+
+    # Used by the cheap tier of a model cascade, which escalates low-confidence answers
+    "comment_categorization_scored": PromptTemplate(
+        prefix=f"""As a senior engineer, analyze code review comments and categorize each one into exactly ONE of:
+{COMMENT_CATEGORIES}
 
 Respond with a JSON array where each object has:
-{{{{
+{{
     "comment_index": "<index>",
     "category": "CRITICAL_BUG|NITPICK|OTHER",
+    "confidence": "<number between 0 and 1: how likely it is that the category is correct>",
     "reasoning": "Brief explanation of why this category was chosen"
-}}}}
-IMPORTANT: Each comment MUST be categorized. The category field MUST be exactly one of CRITICAL_BUG, NITPICK, or OTHER."""
+}}
+IMPORTANT: Each comment MUST be categorized. The category field MUST be exactly one of CRITICAL_BUG, NITPICK, or OTHER.
+Give a low confidence when a comment could reasonably belong to another category.
+
+""",
+        suffix="""PR #{pr_number} by {bot_name}:
+{comments}"""
+    ),
+
+    "match_judgment": PromptTemplate(
+        prefix="""As a senior engineer, decide for each pair below whether the review comment reports the same
+underlying problem as the reference finding. They are on the same lines of the same file, but a comment
+only matches if it identifies the same defect, not merely a nearby or related concern.
+
+Respond with a JSON array where each object has:
+{
+    "pair_index": "<index>",
+    "same_issue": true|false
+}
+IMPORTANT: Each pair MUST be judged.
+
+""",
+        suffix="""{pairs}"""
+    ),
 }
 
 # Claude-specific prompts
 CLAUDE_PROMPTS = {
-    "diff_analysis": f"""{DIFF_ANALYSIS_TEMPLATE}
-
-Analyze this PR diff for potential bugs and issues:
-
-{{diff}}
+    "diff_analysis": PromptTemplate(
+        prefix=f"""{DIFF_ANALYSIS_INSTRUCTIONS}
 
 For each issue found, provide detailed analysis following this structure:
 {{
@@ -76,13 +139,19 @@ For each issue found, provide detailed analysis following this structure:
     "lines": "line numbers",
     "code": "relevant code snippet",
     "fix": "suggested fix approach"
-}}""",
+}}
 
-    "comment_categorization": f"""Analyze these code review comments and categorize each as either:
-{COMMENT_CATEGORIES}
+""",
+        suffix=f"""Analyze this PR diff for potential bugs and issues:
+
+{{diff}}
 
-PR #{{pr_number}} comments from {{bot_name}}:
-{{comments}}
+{DIFF_ANALYSIS_REMINDER}"""
+    ),
+
+    "comment_categorization": PromptTemplate(
+        prefix=f"""Analyze code review comments and categorize each as either:
+{COMMENT_CATEGORIES}
 
 Respond with a JSON array of objects:
 [
@@ -91,26 +160,18 @@ Respond with a JSON array of objects:
         "category": "CRITICAL_BUG|NITPICK|OTHER",
         "reasoning": "Brief explanation"
     }}
-]"""
+]
+
+""",
+        suffix="""PR #{pr_number} comments from {bot_name}:
+{comments}"""
+    ),
 }
 
 # GPT-4-specific prompts
 GPT4_PROMPTS = {
-    "diff_analysis": f"""{DIFF_ANALYSIS_TEMPLATE}
-
-Analyze this PR diff for potential bugs:
-
-{{diff}}
-
-Focus on issues that could cause:
-1. Runtime errors or crashes
-2. Race conditions
-3. Memory leaks
-4. State management issues
-5. Security vulnerabilities
-6. Data loss or corruption
-7. Performance issues
-8. Resource leaks
+    "diff_analysis": PromptTemplate(
+        prefix=f"""{DIFF_ANALYSIS_INSTRUCTIONS}
 
 Provide analysis in this JSON format:
 {{
@@ -125,15 +186,20 @@ Provide analysis in this JSON format:
             "fix": "suggested fix"
         }}
     ]
-}}""",
+}}
 
-    "comment_categorization": f"""Analyze code review comments and categorize each one.
-Categories:
-{COMMENT_CATEGORIES}
+""",
+        suffix=f"""Analyze this PR diff for potential bugs:
 
-Analyze these code review comments from PR #{{pr_number}} by {{bot_name}}:
+{{diff}}
+
+{DIFF_ANALYSIS_REMINDER}"""
+    ),
 
-{{comments}}
+    "comment_categorization": PromptTemplate(
+        prefix=f"""Analyze code review comments and categorize each one.
+Categories:
+{COMMENT_CATEGORIES}
 
 Categorize each comment and explain your reasoning. Respond in JSON format:
 {{
@@ -144,6 +210,11 @@ Categorize each comment and explain your reasoning. Respond in JSON format:
             "reasoning": "Brief explanation"
         }}
     ]
-}}"""
-}
+}}
+
+""",
+        suffix="""Analyze these code review comments from PR #{pr_number} by {bot_name}:
 
+{comments}"""
+    ),
+}
@@ -0,0 +1,325 @@
+"""
+Webhook-driven evaluation service.
+
+`code-review-evals serve` runs a small aiohttp server for GitHub webhooks:
+
+    POST /webhook   pull_request and pull_request_review_comment deliveries
+    GET  /metrics   current per-bot metrics and service counters as JSON
+    GET  /healthz   liveness check
+
+A review comment event carries the comment itself, so a new bot comment is
+classified straight from the payload without calling GitHub. A pull_request
+event (opened, reopened, synchronize, ready_for_review) fetches that PR's bot
+comments and, once per head commit, has Gemini analyze its diff. Only
+comments the service hasn't seen before are classified. Every event for a PR
+runs under that PR's lock, so concurrent deliveries can't classify the same
+comment twice.
+
+Results accumulate in one MetricsAccumulator, which is restored from the run
+directory's results.json on startup and saved back periodically, so
+`code-review-evals report` works against a running service. One GitHubAPI
+(with a shared HTTP session) and one GeminiAnalyzer serve every event, so the
+token pool, prompt cache and single-flight cache stay warm.
+
+Deliveries saved from a webhook's "Recent Deliveries" page can be replayed
+without a server with `code-review-evals replay`.
+"""
+
+import asyncio
+import hmac
+import json
+import time
+import hashlib
+import logging
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
+
+from analyzers.metrics import MetricsAccumulator
+from github.api import parse_review_comment
+from models import IndexedComment, ReviewComment
+from utils.run_store import RunStore
+
+if TYPE_CHECKING:
+    from github.api import GitHubAPI
+    from analyzers.gemini import GeminiAnalyzer
+
+logger = logging.getLogger(__name__)
+
+EVENTS = ('pull_request', 'pull_request_review_comment')
+PR_ACTIONS = ('opened', 'reopened', 'synchronize', 'ready_for_review')
+COMMENT_ACTIONS = ('created',)
+
+
+def infer_event(payload: Dict[str, Any]) -> str:
+    """The webhook event a saved payload belongs to, for payloads saved without their headers"""
+    return 'pull_request_review_comment' if 'comment' in payload else 'pull_request'
+
+
+def verify_signature(secret: str, body: bytes, signature: Optional[str]) -> bool:
+    """Check GitHub's X-Hub-Signature-256 header against the webhook secret"""
+    expected = 'sha256=' + hmac.new(secret.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    return signature is not None and hmac.compare_digest(expected, signature)
+
+
+def _comment_keys(comment: ReviewComment) -> List[Tuple]:
+    """Keys that identify a comment across events; a comment matching any of them has been seen.
+
+    `line` (the first half of line_nums) moves or becomes null when a push
+    shifts or outdates a comment, so only `original_line` is used. GitHub's
+    id is preferred; the content key covers findings and comments restored
+    from results saved before ids were recorded.
+    """
+    original_line = comment.line_nums.rpartition('-')[2]
+    keys = [(comment.bot_name, comment.pr_number, comment.file_name, original_line, comment.comment)]
+    if comment.github_id is not None:
+        keys.append(('id', comment.github_id))
+    return keys
+
+
+class EvaluationService:
+    def __init__(self, store: RunStore, github: 'GitHubAPI', analyzer: 'GeminiAnalyzer',
+                 analyze_diffs: bool = True, save_interval: float = 30.0):
+        self.store = store
+        self.github = github
+        self.analyzer = analyzer
+        self.analyze_diffs = analyze_diffs
+        self.save_interval = save_interval
+
+        self.accumulator = MetricsAccumulator()
+        self._seen: Set[Tuple] = set()
+        self._next_index: Dict[Tuple[str, int], int] = defaultdict(int)
+        self._pr_locks: Dict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._tasks: Set[asyncio.Task] = set()
+        self._saver: Optional[asyncio.Task] = None
+        self._dirty = False
+
+        self.counts = defaultdict(int)
+        self._latencies = deque(maxlen=1000)
+
+        results = store.load_results()
+        if results is not None:
+            self.accumulator.merge_results(results)
+            self._mark_recorded()
+            logger.info(f"Restored {len(self._seen)} classified comments from {store.results_path}")
+
+    async def start(self):
+        import aiohttp
+
+        self.github.session = aiohttp.ClientSession()
+        self._saver = asyncio.ensure_future(self._save_periodically())
+
+    async def close(self):
+        """Finish in-flight events, save results and release the shared HTTP session"""
+        if self._tasks:
+            logger.info(f"Waiting for {len(self._tasks)} in-flight events")
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._saver:
+            self._saver.cancel()
+        self.save()
+        if self.github.session is not None:
+            await self.github.session.close()
+            self.github.session = None
+
+    def submit(self, event: str, payload: Dict[str, Any]) -> asyncio.Task:
+        """Handle an event in the background, so webhook deliveries are acknowledged immediately"""
+        task = asyncio.ensure_future(self.handle(event, payload))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def handle(self, event: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Process one webhook event; returns a summary of what it did"""
+        started = time.monotonic()
+        action = payload.get('action')
+        pull_request = payload.get('pull_request') or {}
+        pr_number = pull_request.get('number') or payload.get('number')
+        repo = (payload.get('repository') or {}).get('full_name')
+
+        relevant = (
+            (event == 'pull_request' and action in PR_ACTIONS)
+            or (event == 'pull_request_review_comment' and action in COMMENT_ACTIONS)
+        )
+        if not relevant or pr_number is None:
+            self.counts['ignored'] += 1
+            return {'status': 'ignored', 'event': event, 'action': action}
+        if repo and repo.lower() != self.github.repo.lower():
+            logger.warning(f"Ignoring {event} for {repo}; this service evaluates {self.github.repo}")
+            self.counts['ignored'] += 1
+            return {'status': 'ignored', 'event': event, 'action': action}
+
+        self.counts[event] += 1
+        try:
+            async with self._pr_locks[pr_number]:
+                if event == 'pull_request_review_comment':
+                    classified = await self._on_comment(pr_number, payload['comment'])
+                else:
+                    classified = await self._on_pull_request(pull_request)
+        except Exception as e:
+            self.counts['errors'] += 1
+            logger.error(f"Error handling {event} for PR #{pr_number}: {str(e)}")
+            return {'status': 'error', 'event': event, 'pr_number': pr_number, 'error': str(e)}
+
+        elapsed = time.monotonic() - started
+        self._latencies.append(elapsed)
+        logger.info(f"{event}/{action} for PR #{pr_number}: classified {classified} new comments in {elapsed:.2f}s")
+        return {'status': 'processed', 'event': event, 'pr_number': pr_number, 'classified': classified}
+
+    def metrics(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            'metrics': self.accumulator.finalize_metrics(),
+            'service': {
+                **self.counts,
+                'in_flight': len(self._tasks),
+                'latency_p50': latencies[len(latencies) // 2] if latencies else None,
+                'latency_p95': latencies[int(len(latencies) * 0.95)] if latencies else None,
+            },
+        }
+
+    def save(self):
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            self.store.save_results(snapshot)
+
+    def _snapshot(self) -> Optional[Dict[str, Any]]:
+        """Results to save if anything changed since the last save"""
+        if not self._dirty:
+            return None
+        self._dirty = False
+        results = self.analyzer.collect_results(self.accumulator)
+        # Serialized here rather than by the saving thread, while no event can append to the table
+        results['comments'] = results['comments'].to_records()
+        return results
+
+    async def _on_comment(self, pr_number: int, payload_comment: Dict[str, Any]) -> int:
+        comment = parse_review_comment(payload_comment, pr_number)
+        if comment is None:
+            return 0
+
+        stored = self.store.load_comments(pr_number, 'github') if self.store.has_comments(pr_number, 'github') else []
+        stored_keys = {key for c in stored for key in _comment_keys(c)}
+        if not stored_keys.intersection(_comment_keys(comment)):
+            self.store.save_comments(pr_number, 'github', stored + [comment])
+        return await self._classify_new([comment])
+
+    async def _on_pull_request(self, pull_request: Dict[str, Any]) -> int:
+        pr_number = pull_request['number']
+        comments = await self.github.fetch_pr_comments(pr_number)
+        self.store.save_comments(pr_number, 'github', comments)
+        # Bot comments first, so they don't wait for the slower diff analysis
+        classified = await self._classify_new(comments)
+
+        head_sha = (pull_request.get('head') or {}).get('sha')
+        if self.analyze_diffs and self.store.diff_store.lookup(self.github.repo, pr_number, head_sha) is None:
+            diff = await self.github.fetch_pr_diff(pr_number)
+            # analyze_diff raises on failure, so the diff below isn't stored and the next event retries it
+            findings = await self.analyzer.analyze_diff(diff)
+            self.store.save_comments(pr_number, 'gemini', findings)
+            self.store.save_diff(diff, self.github.repo, head_sha)
+            classified += await self._classify_new(findings)
+        return classified
+
+    async def _classify_new(self, comments: List[ReviewComment]) -> int:
+        entries = []
+        for comment in comments:
+            keys = _comment_keys(comment)
+            if self._seen.intersection(keys):
+                continue
+            self._seen.update(keys)
+            group = (comment.bot_name, comment.pr_number)
+            entries.append(IndexedComment(comment.bot_name, comment.pr_number, self._next_index[group], comment))
+            self._next_index[group] += 1
+        if not entries:
+            return 0
+
+        await self.analyzer.categorize_indexed(entries, self.accumulator)
+        self._dirty = True
+
+        # Comments the LLM failed to classify are forgotten, so a later event retries them
+        recorded = {
+            (bot_name, pr_number, comment_index)
+            for bot_name, pr_number in {(entry.bot_name, entry.pr_number) for entry in entries}
+            for _, comment_index, _, _ in self.accumulator.classifications.get(bot_name, {}).get(pr_number, ())
+        }
+        for entry in entries:
+            if entry.key not in recorded:
+                self._seen.difference_update(_comment_keys(entry.comment))
+        classified = sum(1 for entry in entries if entry.key in recorded)
+        self.counts['comments_classified'] += classified
+        return classified
+
+    def _mark_recorded(self):
+        for bot_name, pr_data in self.accumulator.classifications.items():
+            for pr_number, records in pr_data.items():
+                for comment_id, comment_index, _, _ in records:
+                    self._seen.update(_comment_keys(self.accumulator.comments[comment_id]))
+                    group = (bot_name, pr_number)
+                    self._next_index[group] = max(self._next_index[group], comment_index + 1)
+
+    async def _save_periodically(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            snapshot = self._snapshot()
+            if snapshot is None:
+                continue
+            try:
+                await asyncio.to_thread(self.store.save_results, snapshot)
+            except Exception as e:
+                self._dirty = True
+                logger.error(f"Error saving results: {str(e)}")
+
+
+def create_app(service: EvaluationService, webhook_secret: Optional[str] = None):
+    from aiohttp import web
+
+    async def webhook(request):
+        body = await request.read()
+        if webhook_secret and not verify_signature(webhook_secret, body, request.headers.get('X-Hub-Signature-256')):
+            return web.json_response({'error': 'invalid signature'}, status=401)
+
+        event = request.headers.get('X-GitHub-Event', '')
+        if event == 'ping':
+            return web.json_response({'status': 'pong'})
+        if event not in EVENTS:
+            return web.json_response({'status': 'ignored', 'event': event})
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return web.json_response({'error': 'invalid JSON payload'}, status=400)
+
+        service.submit(event, payload)
+        return web.json_response({'status': 'accepted'}, status=202)
+
+    async def metrics(request):
+        return web.json_response(service.metrics())
+
+    async def healthz(request):
+        return web.json_response({'status': 'ok'})
+
+    async def on_startup(app):
+        await service.start()
+
+    async def on_cleanup(app):
+        await service.close()
+
+    app = web.Application()
+    app.router.add_post('/webhook', webhook)
+    app.router.add_get('/metrics', metrics)
+    app.router.add_get('/healthz', healthz)
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+async def serve(service: EvaluationService, host: str, port: int, webhook_secret: Optional[str] = None):
+    """Run the webhook server until cancelled"""
+    from aiohttp import web
+
+    runner = web.AppRunner(create_app(service, webhook_secret))
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Listening for GitHub webhooks on http://{host}:{port}/webhook")
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
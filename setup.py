@@ -14,7 +14,13 @@ setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://github.com/Entelligence-AI/code_review_evals",
-    packages=find_packages(),
+    packages=find_packages(exclude=["benchmarks", "notebooks"]),
+    py_modules=["cli", "distributed", "main", "models", "pipeline", "prompts", "server"],
+    entry_points={
+        "console_scripts": [
+            "code-review-evals=cli:main",
+        ],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Developers",
@@ -0,0 +1,71 @@
+import asyncio
+import json
+import re
+
+from analyzers.batch import SUCCEEDED, LocalBatchBackend, OfflineBatchJob
+from analyzers.gemini import GeminiAnalyzer
+from models import PRDiff, ReviewComment
+from utils.run_store import RunStore
+
+
+def respond(prompt):
+    """Fake model: finds one issue per diff, and labels comments mentioning a crash as bugs"""
+    if 'Comment 0:' not in prompt:
+        return json.dumps({'issues': [
+            {'file_name': 'a.py', 'snippet': 'x = 1', 'bug_description': 'x is never used', 'line_numbers': '1'}
+        ]})
+    bodies = re.split(r'^Comment \d+:', prompt, flags=re.M)[1:]
+    return json.dumps([
+        {'comment_index': i, 'category': 'CRITICAL_BUG' if 'crash' in body else 'NITPICK', 'reasoning': 'fake'}
+        for i, body in enumerate(bodies)
+    ])
+
+
+def _comment(pr_number, text, bot_name='bot'):
+    return ReviewComment(file_name='a.py', chunk='x = 1', comment=text, line_nums='1',
+                         bot_name=bot_name, pr_number=pr_number)
+
+
+def _job(tmp_path):
+    store = RunStore(str(tmp_path / 'run'))
+    backend = LocalBatchBackend(str(tmp_path / 'local'), respond)
+    return store, OfflineBatchJob(store, lambda: GeminiAnalyzer('key', call_timeout=None), backend)
+
+
+def test_categorization_round_trip(tmp_path):
+    store, job = _job(tmp_path)
+    store.save_comments(1, 'github', [_comment(1, 'this will crash'), _comment(1, 'rename x')])
+    store.save_comments(2, 'github', [_comment(2, 'missing docstring', bot_name='other')])
+
+    state = job.submit('categorize')
+    assert sorted(state['requests']) == ['cat-bot-1-0', 'cat-other-2-0']
+    assert asyncio.run(job.wait('categorize', poll_interval=0)) == SUCCEEDED
+    results = asyncio.run(job.ingest('categorize'))
+
+    assert results['batch'] == {'ingested': 2}
+    assert results['metrics']['bot']['total_comments'] == 2
+    assert results['metrics']['bot']['critical_bug_ratio'] == 0.5
+    assert results['metrics']['other']['nitpick_ratio'] == 1.0
+
+
+def test_batches_whose_comments_changed_after_submission_are_stale(tmp_path):
+    store, job = _job(tmp_path)
+    store.save_comments(1, 'github', [_comment(1, 'this will crash')])
+    store.save_comments(2, 'github', [_comment(2, 'rename x')])
+    job.submit('categorize')
+
+    store.save_comments(2, 'github', [_comment(2, 'rename x to count')])
+    results = asyncio.run(job.ingest('categorize'))
+
+    assert results['batch'] == {'ingested': 1, 'stale': 1}
+    assert results['metrics']['bot']['total_comments'] == 1
+
+
+def test_diff_findings_are_saved_as_gemini_comments(tmp_path):
+    store, job = _job(tmp_path)
+    store.save_diff(PRDiff(pr_number=3, diff_content='+x = 1', files_changed=['a.py']))
+
+    job.submit('diffs')
+    assert asyncio.run(job.ingest('diffs')) is None
+    assert [c.comment for c in store.load_comments(3, 'gemini')] == ['x is never used']
+    assert store.load_comments(3, 'gemini')[0].bot_name == 'gemini'
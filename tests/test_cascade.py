@@ -0,0 +1,101 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from analyzers.cascade import ModelCascade
+from analyzers.gemini import GeminiAnalyzer
+from models import ReviewComment
+
+
+class FakeModel:
+    """Answers each "Comment N:" in a prompt with `answer(comment_text)`"""
+
+    def __init__(self, answer):
+        self.model_name = 'models/fake'
+        self.answer = answer
+        self.prompts = []
+
+    def generate_content(self, contents, **kwargs):
+        self.prompts.append(contents)
+        bodies = re.split(r'^Comment \d+:', contents, flags=re.M)[1:]
+        results = [{'comment_index': i, **self.answer(body)} for i, body in enumerate(bodies)]
+        usage = SimpleNamespace(prompt_token_count=len(contents) // 4, candidates_token_count=10 * len(bodies))
+        return SimpleNamespace(text=json.dumps(results), usage_metadata=usage)
+
+
+class FailingModel:
+    model_name = 'models/down'
+
+    def generate_content(self, contents, **kwargs):
+        raise RuntimeError('503 Service Unavailable')
+
+
+def cheap(body):
+    if 'crash' in body:
+        return {'category': 'CRITICAL_BUG', 'confidence': 0.9, 'reasoning': 'cheap'}
+    if 'maybe' in body:
+        return {'category': 'OTHER', 'confidence': 0.4, 'reasoning': 'cheap'}
+    return {'category': 'NITPICK', 'confidence': 0.95, 'reasoning': 'cheap'}
+
+
+def strong(body):
+    if 'docs' in body:
+        return {'category': 'NITPICK', 'reasoning': 'strong'}
+    return {'category': 'CRITICAL_BUG', 'reasoning': 'strong'}
+
+
+COMMENTS = [
+    ReviewComment(file_name='a.py', chunk='x = 1', comment=f"{text} ({i})", line_nums='1', bot_name='bot', pr_number=1)
+    for i, text in enumerate(['rename this variable', 'this will crash on null', 'maybe a race here?',
+                              'crash mentioned in the docs wording'])
+]
+
+
+def _analyzer(cascade, cheap_model, strong_model):
+    analyzer = GeminiAnalyzer('key', cascade=cascade, call_timeout=None)
+    analyzer._models[cascade.cheap_model] = cheap_model
+    analyzer._models[cascade.strong_model] = strong_model
+    return analyzer
+
+
+def test_escalation_reason():
+    cascade = ModelCascade(confidence_threshold=0.7)
+    assert cascade.escalation_reason({'category': 'CRITICAL_BUG', 'confidence': 0.99}) == 'category'
+    assert cascade.escalation_reason({'category': 'NITPICK', 'confidence': 0.5}) == 'low_confidence'
+    assert cascade.escalation_reason({'category': 'NITPICK', 'confidence': 'high'}) == 'no_confidence'
+    assert cascade.escalation_reason({'category': 'NITPICK'}) == 'no_confidence'
+    assert cascade.escalation_reason({'category': 'NITPICK', 'confidence': '0.7'}) is None
+    with pytest.raises(ValueError):
+        ModelCascade(confidence_threshold=1.5)
+
+
+def test_only_uncertain_and_escalated_comments_reach_the_strong_model():
+    cheap_model, strong_model = FakeModel(cheap), FakeModel(strong)
+    analyzer = _analyzer(ModelCascade(), cheap_model, strong_model)
+    results = asyncio.run(analyzer.analyze_comment_quality_in_batch(COMMENTS))
+
+    assert len(cheap_model.prompts) == 1 and len(strong_model.prompts) == 1
+    assert 'confidence' in cheap_model.prompts[0] and 'confidence' not in strong_model.prompts[0]
+    assert 'rename this variable' not in strong_model.prompts[0]
+
+    categories = [record['category'] for record in results['classifications']['bot'][1]]
+    assert categories == ['NITPICK', 'CRITICAL_BUG', 'CRITICAL_BUG', 'NITPICK']
+    stats = results['cascade']
+    assert stats['escalated'] == 3
+    assert stats['escalation_reasons'] == {'category': 2, 'low_confidence': 1}
+    assert (stats['confirmed'], stats['overturned'], stats['unanswered']) == (1, 2, 0)
+    assert stats['changes'] == {'OTHER->CRITICAL_BUG': 1, 'CRITICAL_BUG->NITPICK': 1}
+    assert stats['escalation_ratio'] == 0.75
+
+
+def test_cheap_answers_stand_when_the_strong_model_fails():
+    analyzer = _analyzer(ModelCascade(), FakeModel(cheap), FailingModel())
+    results = asyncio.run(analyzer.analyze_comment_quality_in_batch(COMMENTS))
+
+    assert results['metrics']['bot']['total_comments'] == len(COMMENTS)
+    stats = results['cascade']
+    assert stats['unanswered'] == 3
+    assert stats['tiers']['strong']['failures'] == 1
@@ -0,0 +1,79 @@
+import re
+
+from analyzers.compaction import PromptCompactor
+
+
+def _hunk(start: int, lines):
+    return f"@@ -{start},{len(lines)} +{start},{len(lines)} @@\n" + '\n'.join(lines)
+
+
+def test_comment_boilerplate_and_footers_are_stripped():
+    text = (
+        "<!-- internal state -->\n**Possible null dereference**\n\n`user` may be None here.\n\n"
+        "<details>\n<summary>🤖 Prompt for AI Agents</summary>\n\nFix the null check\n</details>\n\n"
+        "---\nWas this comment helpful? React with 👍 or 👎\n<sub>Powered by ReviewBot</sub>"
+    )
+    assert PromptCompactor().compact_comment(text) == "**Possible null dereference**\n\n`user` may be None here."
+
+
+def test_suggestion_details_are_kept():
+    text = "Bug here.\n<details>\n<summary>Committable suggestion</summary>\n\n```x = 1```\n</details>"
+    assert PromptCompactor().compact_comment(text) == text
+
+
+def test_hunk_is_windowed_around_the_commented_line():
+    body = [f" line {n}" for n in range(10, 40)]
+    compacted = PromptCompactor(hunk_window=2).compact_hunk(_hunk(10, body), '20-20').split('\n')
+
+    assert compacted[0].startswith('@@')
+    assert compacted[1] == '... (8 lines omitted; resumes at line 18)'
+    assert compacted[2:7] == [f" line {n}" for n in range(18, 23)]
+    # GitHub's hunk ends at the commented line, which is always kept
+    assert compacted[7] == '... (14 lines omitted; resumes at line 37)'
+    assert compacted[-1] == ' line 39'
+
+
+def test_short_hunks_are_kept_whole():
+    hunk = _hunk(1, [' a  ', '+b  ', '-c'])
+    assert PromptCompactor().compact_hunk(hunk, '2') == _hunk(1, [' a', '+b  ', '-c'])
+
+
+def test_diff_context_collapse_keeps_line_numbers_recoverable():
+    old = [f"line {n}" for n in range(1, 41)]
+    hunk = [' ' + line for line in old[:9]] + ['-line 10', '+line ten'] + [' ' + line for line in old[10:30]]
+    hunk += ['+inserted'] + [' ' + line for line in old[30:]]
+    diff = (
+        "diff --git a/app.py b/app.py\nindex 123..456 100644\n--- a/app.py\n+++ b/app.py\n"
+        + _hunk(1, hunk) + "\n\\ No newline at end of file"
+    )
+    compacted = PromptCompactor(diff_context=2).compact_diff(diff)
+
+    assert 'index 123' not in compacted and 'No newline' not in compacted
+    lines = compacted.split('\n')
+    # Every line after a marker is where the marker says it is in the new file
+    new_file = [line[1:] for line in hunk if not line.startswith('-')]
+    for marker, following in zip(lines, lines[1:]):
+        match = re.search(r'resumes at line (\d+)', marker)
+        if match and not following.startswith('-'):
+            assert new_file[int(match.group(1)) - 1] == following[1:]
+    assert lines.count('+inserted') == 1 and '-line 10' in lines and '+line ten' in lines
+    assert sum(1 for line in lines if line.startswith('...')) == 3
+
+
+def test_deleted_and_generated_files_are_summarized():
+    diff = (
+        "diff --git a/old.py b/old.py\ndeleted file mode 100644\n--- a/old.py\n+++ /dev/null\n@@ -1,2 +0,0 @@\n-a\n-b\n"
+        "diff --git a/package-lock.json b/package-lock.json\n--- a/package-lock.json\n+++ b/package-lock.json\n"
+        "@@ -1 +1 @@\n-x\n+y"
+    )
+    compacted = PromptCompactor().compact_diff(diff)
+    assert '... (file deleted; 2 removed lines omitted)' in compacted
+    assert '... (generated file; 2 changed lines omitted)' in compacted
+    assert '-a' not in compacted.split('\n') and '+y' not in compacted.split('\n')
+
+
+def test_stats_count_tokens_saved():
+    compactor = PromptCompactor()
+    compactor.compact_comment("Bug.\n\n<sub>Powered by ReviewBot</sub>" + " " * 400)
+    stats = compactor.stats()
+    assert stats['comments'] == 1 and stats['tokens_saved'] > 0
@@ -0,0 +1,39 @@
+from github.errors import GitHubNotFoundError, GitHubServerError
+from utils.dead_letter import DeadLetterQueue
+
+
+def test_entries_persist_and_count_attempts(tmp_path):
+    path = str(tmp_path / 'failed_prs.json')
+    queue = DeadLetterQueue(path)
+    queue.add(1, 'fetch', GitHubServerError('bad gateway', 502), {'number': 1, 'title': 'Fix', 'body': 'dropped'})
+    queue.add(1, 'fetch', GitHubServerError('bad gateway', 502))
+
+    reloaded = DeadLetterQueue(path)
+    [entry] = reloaded.entries()
+    assert 1 in reloaded
+    assert entry['attempts'] == 2 and entry['error_type'] == 'GitHubServerError'
+    # The PR summary from the first failure is kept, without fields outside the summary
+    assert entry['pr'] == {'number': 1, 'title': 'Fix', 'html_url': None, 'created_at': None}
+
+
+def test_retryable_only_filters_permanent_failures(tmp_path):
+    queue = DeadLetterQueue(str(tmp_path / 'failed_prs.json'))
+    queue.add(1, 'fetch', GitHubServerError('bad gateway', 502))
+    queue.add(2, 'fetch', GitHubNotFoundError('gone', 404))
+    queue.add(3, 'analyze', RuntimeError('503 Service Unavailable'))
+
+    assert [entry['pr_number'] for entry in queue.entries(stage='fetch')] == [1]
+    assert [entry['pr_number'] for entry in queue.entries(stage='fetch', retryable_only=False)] == [1, 2]
+    assert [entry['pr_number'] for entry in queue.entries(stage='analyze')] == [3]
+
+
+def test_remove_only_matches_the_given_stage(tmp_path):
+    path = str(tmp_path / 'failed_prs.json')
+    queue = DeadLetterQueue(path)
+    queue.add(1, 'fetch', GitHubServerError('bad gateway', 502))
+
+    queue.remove(1, stage='analyze')
+    assert 1 in queue
+    queue.remove(1, stage='fetch')
+    queue.remove(2)
+    assert len(queue) == 0 and len(DeadLetterQueue(path)) == 0
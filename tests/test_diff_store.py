@@ -0,0 +1,61 @@
+import os
+
+import pytest
+
+from models import PRDiff
+from utils.diff_store import DiffStore
+from utils.run_store import RunStore
+
+CONTENT = 'diff --git a/a.py b/a.py\n+++ b/a.py\n+print("héllo")\n' * 50
+
+
+def _diff(pr_number=1, content=CONTENT):
+    return PRDiff(pr_number=pr_number, diff_content=content, files_changed=['a.py'])
+
+
+def _objects(root):
+    return [name for _, _, files in os.walk(os.path.join(root, 'objects')) for name in files]
+
+
+@pytest.mark.parametrize('codec', ['gzip', 'zstd'])
+def test_round_trip(tmp_path, codec):
+    if codec == 'zstd':
+        pytest.importorskip('zstandard')
+    store = DiffStore(str(tmp_path), codec=codec)
+    ref = store.put(_diff(), 'owner/repo', 'abc123')
+
+    assert store.lookup('owner/repo', 1, 'abc123') == ref
+    stored = store.open(ref)
+    assert stored.diff_content == CONTENT
+    assert (stored.pr_number, stored.files_changed, stored.size) == (1, ['a.py'], len(CONTENT))
+
+
+def test_identical_content_shares_one_object(tmp_path):
+    store = DiffStore(str(tmp_path), codec='gzip')
+    first = store.put(_diff(1), 'owner/repo', 'abc')
+    second = store.put(_diff(2), 'owner/repo', 'def')
+    assert first.digest == second.digest
+    assert len(_objects(str(tmp_path))) == 1
+    assert store.read(second) == CONTENT
+
+
+def test_lookup_misses(tmp_path):
+    store = DiffStore(str(tmp_path), codec='gzip')
+    ref = store.put(_diff(), 'owner/repo', 'abc')
+    assert store.lookup('owner/repo', 1, 'other') is None
+    assert store.lookup('owner/repo', 1, None) is None
+    # A ref whose object was deleted is ignored rather than failing on read
+    os.remove(os.path.join(str(tmp_path), 'objects', ref.digest[:2], ref.digest + '.gz'))
+    assert store.lookup('owner/repo', 1, 'abc') is None
+
+
+def test_run_store_links_and_loads_stored_diffs(tmp_path):
+    shared = str(tmp_path / 'diffs')
+    store = RunStore(str(tmp_path / 'run'), diff_store_dir=shared)
+    store.save_diff(_diff(), 'owner/repo', 'abc')
+    assert store.load_diff(1).diff_content == CONTENT
+
+    other_run = RunStore(str(tmp_path / 'other'), diff_store_dir=shared)
+    assert other_run.link_diff('owner/repo', 1, 'abc')
+    assert not other_run.link_diff('owner/repo', 2, 'abc')
+    assert other_run.load_diff(1).diff_content == CONTENT
@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from analyzers.gemini import GeminiAnalyzer
+from analyzers.metrics import MetricsAccumulator
+from distributed import Coordinator, Worker
+from models import PRDiff, ReviewComment
+from utils.run_store import RunStore
+from utils.work_queue import WorkQueue, DONE, FAILED
+
+
+def _comment(pr_number: int, bot_name: str = 'bot', text: str = 'rename this') -> ReviewComment:
+    return ReviewComment(file_name='a.py', chunk='', comment=text, line_nums='1', bot_name=bot_name,
+                         pr_number=pr_number)
+
+
+class FakeGitHub:
+    repo = 'owner/repo'
+
+    async def fetch_pr_diff(self, pr_number):
+        return PRDiff(pr_number=pr_number, diff_content='+++ b/a.py\n+x\n', files_changed=['a.py'])
+
+    async def fetch_pr_comments(self, pr_number):
+        return [_comment(pr_number)]
+
+
+class FakeAnalyzer:
+    def __init__(self, failures=0):
+        self.failures = failures
+
+    async def analyze_diff(self, diff):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('503 Service Unavailable')
+        return [_comment(diff.pr_number, 'gemini', 'null dereference')]
+
+    async def analyze_comment_quality_in_batch(self, comments):
+        accumulator = MetricsAccumulator()
+        for entry in GeminiAnalyzer.index_comments(comments):
+            accumulator.add_total(entry.bot_name)
+            accumulator.record(entry.bot_name, entry.pr_number, entry.comment, entry.comment_index, 'NITPICK', '')
+        return accumulator.results()
+
+
+def test_expired_lease_is_retried_and_stale_holder_is_rejected(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.enqueue('job', 'fetch', {'pr_number': 1}, max_attempts=2)
+
+    first = queue.lease('worker-a', lease_seconds=0.01)
+    assert queue.lease('worker-b') is None
+    time.sleep(0.02)
+    second = queue.lease('worker-b')
+    assert second.attempts == 2
+
+    assert not queue.complete(first)
+    assert queue.complete(second)
+    assert queue.jobs(status=DONE)[0]['id'] == 'job'
+
+
+def test_job_fails_once_out_of_attempts(tmp_path):
+    queue = WorkQueue(str(tmp_path / 'queue.db'))
+    queue.enqueue('job', 'analyze', {'pr_number': 1}, max_attempts=2)
+    for _ in range(2):
+        queue.fail(queue.lease('worker'), 'boom')
+    assert queue.lease('worker') is None
+    assert queue.jobs(status=FAILED)[0]['attempts'] == 2
+
+
+def _run(store, prs, analyzer, batch_size):
+    queue = WorkQueue(store.queue_path)
+    coordinator = Coordinator(store, queue, categorize_batch_size=batch_size, poll_interval=0.01)
+    worker = Worker(store, queue, FakeGitHub, lambda: analyzer, poll_interval=0.01, exit_when_idle=True)
+
+    async def run():
+        results, _ = await asyncio.gather(coordinator.run(prs), worker.run())
+        return results, queue
+
+    return asyncio.run(run())
+
+
+def test_failed_analysis_is_retried_not_saved_empty(tmp_path):
+    store = RunStore(str(tmp_path))
+    _, queue = _run(store, [{'number': 1}], FakeAnalyzer(failures=1), batch_size=10)
+
+    assert [c.comment for c in store.load_comments(1, 'gemini')] == ['null dereference']
+    assert queue.jobs(kind='analyze')[0]['attempts'] == 2
+
+
+def test_rerun_with_more_prs_and_new_batch_size_does_not_double_count(tmp_path):
+    store = RunStore(str(tmp_path))
+    _run(store, [{'number': n} for n in range(1, 5)], FakeAnalyzer(), batch_size=2)
+    results, _ = _run(store, [{'number': n} for n in range(1, 7)], FakeAnalyzer(), batch_size=4)
+
+    # One bot comment and one gemini finding per PR, each counted once
+    assert results['metrics']['bot']['total_comments'] == 6
+    assert results['metrics']['gemini']['total_comments'] == 6
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from github.api import GitHubAPI, RetryPolicy
+from github.errors import (
+    GitHubClientError, GitHubNotFoundError, GitHubSecondaryRateLimitError, GitHubServerError, error_from_response
+)
+
+URL = 'https://api.github.com/repos/owner/repo/pulls/1'
+
+
+class RecordingPolicy(RetryPolicy):
+    """Records the delays it would have slept for and doesn't sleep"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.delays = []
+
+    def delay(self, attempt, retry_after=None):
+        self.delays.append(super().delay(attempt, retry_after))
+        return 0.0
+
+
+class FakeResponse:
+    def __init__(self, status, body='', headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+    async def text(self):
+        return self.body
+
+
+class FakeSession:
+    """Serves the queued responses in order, the last one repeatedly"""
+
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = 0
+
+    def get(self, url, params=None, headers=None, timeout=None):
+        self.requests += 1
+        return self.responses.pop(0) if len(self.responses) > 1 else self.responses[0]
+
+
+def _api(responses, policy):
+    api = GitHubAPI('token', 'owner/repo', retry_policy=policy)
+    api.session = FakeSession(responses)
+    return api
+
+
+def test_responses_map_to_typed_errors():
+    assert isinstance(error_from_response(404, '', {}, URL), GitHubNotFoundError)
+    assert isinstance(error_from_response(410, '', {}, URL), GitHubNotFoundError)
+    assert isinstance(error_from_response(422, '', {}, URL), GitHubClientError)
+    assert error_from_response(502, '', {}, URL).retryable
+
+    limited = error_from_response(403, '', {'Retry-After': '30'}, URL)
+    assert isinstance(limited, GitHubSecondaryRateLimitError) and limited.retry_after == 30.0
+    assert isinstance(error_from_response(403, 'You have exceeded a secondary rate limit', {}, URL),
+                      GitHubSecondaryRateLimitError)
+    assert not error_from_response(403, 'Bad credentials', {}, URL).retryable
+
+
+def test_full_jitter_stays_within_bounds():
+    policy = RetryPolicy(base_delay=1.0, max_delay=10.0)
+    for attempt in range(8):
+        cap = min(10.0, 2 ** attempt)
+        assert all(0 <= policy.delay(attempt) <= cap for _ in range(200))
+
+
+def test_retry_after_is_honored():
+    delays = [RetryPolicy(max_delay=1.0).delay(0, retry_after=30) for _ in range(200)]
+    assert all(30 <= delay <= 31 for delay in delays)
+
+
+def test_not_found_is_not_retried():
+    policy = RecordingPolicy()
+    api = _api([FakeResponse(404, 'Not Found')], policy)
+    with pytest.raises(GitHubNotFoundError):
+        asyncio.run(api.fetch_pr_diff(1))
+    assert api.session.requests == 1 and policy.delays == []
+
+
+def test_transient_errors_are_retried_with_the_server_delay():
+    policy = RecordingPolicy()
+    api = _api([
+        FakeResponse(502, 'Bad Gateway'),
+        FakeResponse(403, 'slow down', {'Retry-After': '7'}),
+        FakeResponse(200, 'diff --git a/a.py b/a.py\n+++ b/a.py\n+x\n'),
+    ], policy)
+    diff = asyncio.run(api.fetch_pr_diff(1))
+    assert diff.files_changed == ['a.py']
+    assert api.session.requests == 3
+    assert 7.0 <= policy.delays[1] <= 8.0
+
+
+def test_retries_are_bounded():
+    policy = RecordingPolicy(max_retries=2)
+    api = _api([FakeResponse(503, 'Service Unavailable')], policy)
+    with pytest.raises(GitHubServerError):
+        asyncio.run(api.fetch_pr_diff(1))
+    assert api.session.requests == 3
@@ -0,0 +1,75 @@
+import asyncio
+
+from utils.hedging import Hedger
+
+SAMPLES = 5
+
+
+async def _warm_up(hedger, seconds=0.01):
+    async def call():
+        await asyncio.sleep(seconds)
+
+    for _ in range(SAMPLES):
+        await hedger.run('k', call)
+
+
+def _latencies(hedger):
+    return hedger.stats()['latencies']['k']
+
+
+def test_cancelled_loser_is_recorded_as_a_lower_bound():
+    hedger = Hedger(budget=1.0, min_samples=SAMPLES, min_delay=0.0)
+    delays = iter([0.2, 0.0])
+
+    async def call():
+        await asyncio.sleep(next(delays))
+        return 'ok'
+
+    async def run():
+        await _warm_up(hedger)
+        return await hedger.run('k', call)
+
+    assert asyncio.run(run()) == 'ok'
+    stats = hedger.stats()
+    assert stats['hedged'] == 1 and stats['hedge_wins'] == 1 and stats['abandoned'] == 0
+    # The hedge's latency and the cancelled primary's elapsed time, at least the hedging delay
+    assert _latencies(hedger)['samples'] == SAMPLES + 2
+    assert _latencies(hedger)['max'] >= 0.01
+
+
+def test_uncancellable_loser_runs_to_completion_and_is_recorded():
+    hedger = Hedger(budget=1.0, min_samples=SAMPLES, min_delay=0.0)
+    delays = iter([0.1, 0.0])
+    finished = []
+
+    async def call():
+        delay = next(delays)
+        await asyncio.sleep(delay)
+        finished.append(delay)
+        return delay
+
+    async def run():
+        await _warm_up(hedger)
+        result = await hedger.run('k', call, cancellable=False)
+        assert finished == [0.0]
+        await asyncio.sleep(0.2)
+        return result
+
+    assert asyncio.run(run()) == 0.0
+    assert finished == [0.0, 0.1]
+    assert _latencies(hedger)['max'] >= 0.1
+    assert hedger.stats()['abandoned'] == 1
+
+
+def test_no_hedge_without_enough_samples():
+    hedger = Hedger(budget=1.0, min_samples=SAMPLES)
+    calls = []
+
+    async def call():
+        calls.append(1)
+        return 'ok'
+
+    assert asyncio.run(hedger.run('k', call)) == 'ok'
+    assert calls == [1]
+    assert hedger.stats()['hedged'] == 0
+    assert hedger.stats()['delays'] == {'k': None}
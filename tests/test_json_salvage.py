@@ -0,0 +1,42 @@
+import json
+
+from utils.json_salvage import IncrementalJSONExtractor, salvage_objects
+
+ITEMS = [
+    {'index': 0, 'category': 'NITPICK', 'reasoning': 'braces {in] "quoted" text\\'},
+    {'index': 1, 'category': 'CRITICAL_BUG', 'reasoning': 'nested', 'lines': [{'start': 1}]},
+]
+
+
+def test_complete_array():
+    assert salvage_objects(json.dumps(ITEMS)) == ITEMS
+
+
+def test_truncated_tail_keeps_complete_items():
+    text = json.dumps(ITEMS)
+    assert salvage_objects(text[:text.index('"nested"')]) == ITEMS[:1]
+
+
+def test_markdown_fences_and_wrapping_object():
+    text = '```json\n' + json.dumps({'issues': ITEMS}) + '\n```'
+    assert salvage_objects(text) == ITEMS
+
+
+def test_malformed_item_is_skipped():
+    text = '[{"index": 0, "category": NITPICK}, ' + json.dumps(ITEMS[1]) + ']'
+    assert salvage_objects(text) == ITEMS[1:]
+
+
+def test_lone_object_is_returned_on_close():
+    assert salvage_objects('{"category": "OTHER"}') == [{'category': 'OTHER'}]
+    assert salvage_objects('not json at all') == []
+
+
+def test_objects_are_emitted_as_their_chunks_arrive():
+    extractor = IncrementalJSONExtractor()
+    emitted = []
+    for char in json.dumps(ITEMS):
+        emitted.extend([item] for item in extractor.feed(char))
+    assert emitted == [ITEMS[:1], ITEMS[1:]]
+    assert extractor.close() == []
+    assert extractor.emitted == 2
@@ -0,0 +1,80 @@
+import asyncio
+import random
+
+from analyzers.matching import WHOLE_FILE, FindingMatcher, IntervalIndex, parse_line_ranges
+from models import ReviewComment
+
+
+def _comment(bot_name, body, line_nums, file_name='src/app.py', pr_number=1):
+    return ReviewComment(file_name=file_name, chunk='', comment=body, line_nums=line_nums,
+                         bot_name=bot_name, pr_number=pr_number)
+
+
+def test_parse_line_ranges():
+    assert parse_line_ranges('15-12, 20') == [(12, 15), (20, 20)]
+    assert parse_line_ranges('lines 3 to 5') == [(3, 5)]
+    # GitHub comments store "<line>-<original_line>", which isn't a range
+    assert parse_line_ranges('10-40', ranges=False) == [(10, 10), (40, 40)]
+    assert parse_line_ranges('-', ranges=False) == [WHOLE_FILE]
+    assert parse_line_ranges(None) == [WHOLE_FILE]
+
+
+def test_interval_index_matches_brute_force():
+    rng = random.Random(7)
+    intervals = []
+    for value in range(200):
+        start = rng.randint(0, 500)
+        intervals.append((start, start + rng.choice([0, 1, 5, 50, 300]), value))
+    index = IntervalIndex(intervals)
+    for _ in range(200):
+        start = rng.randint(-10, 520)
+        end = start + rng.randint(0, 40)
+        expected = {value for low, high, value in intervals if low <= end and high >= start}
+        assert set(index.overlapping(start, end)) == expected
+
+
+def test_matches_within_line_tolerance_and_partial_paths():
+    findings = [
+        _comment('gemini', 'Null pointer dereference when session token expires', '40-42'),
+        _comment('gemini', 'Unbounded retry loop hammers upstream service', '90'),
+    ]
+    comments = [
+        # Same issue, two lines past the finding, reported against a partial path
+        _comment('bot', 'Possible null pointer dereference: session token may have expired', '44-44', 'app.py'),
+        # Same words, but nowhere near the finding
+        _comment('bot', 'Unbounded retry loop hammers upstream service', '300-300'),
+    ]
+    report = asyncio.run(FindingMatcher().match(findings + comments))
+    assert report['bots']['bot']['matched_comments'] == 1
+    assert report['bots']['bot']['caught_findings'] == 1
+    assert report['bots']['bot']['precision'] == 0.5
+    assert report['stats']['candidates'] == 1
+
+
+def test_comments_on_unreviewed_prs_are_left_out():
+    comments = [
+        _comment('gemini', 'Race condition in cache refresh', '5'),
+        _comment('bot', 'Race condition in cache refresh', '5-5'),
+        _comment('bot', 'Another issue entirely', '5-5', pr_number=2),
+    ]
+    report = asyncio.run(FindingMatcher().match(comments, reference_prs={1}))
+    assert report['bots']['bot']['comments'] == 1
+    assert report['bots']['bot']['precision'] == 1.0
+    assert report['stats']['unreviewed'] == 1
+
+
+def test_ambiguous_pairs_go_to_the_judge():
+    judged = []
+
+    async def judge(pairs):
+        judged.extend(pairs)
+        return [True] * len(pairs)
+
+    comments = [
+        _comment('gemini', 'Race condition when refreshing cache entries concurrently', '5'),
+        _comment('bot', 'Concurrent writers could corrupt cache entries here', '5-5'),
+    ]
+    report = asyncio.run(FindingMatcher(judge=judge).match(comments))
+    assert len(judged) == 1
+    assert report['stats']['judged_matches'] == 1
+    assert report['bots']['bot']['recall'] == 1.0
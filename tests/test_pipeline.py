@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from analyzers.metrics import MetricsAccumulator
+from models import PRDiff, ReviewComment
+from pipeline import StreamingPipeline
+
+
+def _comment(pr_number: int, bot_name: str = 'bot', text: str = 'rename this') -> ReviewComment:
+    return ReviewComment(file_name='a.py', chunk='', comment=text, line_nums='1', bot_name=bot_name,
+                         pr_number=pr_number)
+
+
+class FakeGitHub:
+    repo = 'owner/repo'
+
+    def __init__(self, prs=3, comments_per_pr=1, delay=0.0):
+        self.prs = prs
+        self.comments_per_pr = comments_per_pr
+        self.delay = delay
+        self.listed = 0
+
+    async def iter_recent_prs(self, limit):
+        for pr_number in range(1, min(limit, self.prs) + 1):
+            self.listed += 1
+            yield {'number': pr_number, 'title': f"PR {pr_number}"}
+
+    async def fetch_pr_diff(self, pr_number):
+        return PRDiff(pr_number=pr_number, diff_content='+++ b/a.py\n+x\n', files_changed=['a.py'])
+
+    async def fetch_pr_comments(self, pr_number):
+        await asyncio.sleep(self.delay)
+        return [_comment(pr_number, text=f"rename this ({i})") for i in range(self.comments_per_pr)]
+
+
+class FakeAnalyzer:
+    def __init__(self, failing_prs=(), categorize_delay=0.0, crash=False):
+        self.failing_prs = set(failing_prs)
+        self.categorize_delay = categorize_delay
+        self.crash = crash
+        self.packs = []
+
+    async def analyze_diff(self, diff):
+        if diff.pr_number in self.failing_prs:
+            raise RuntimeError('503 Service Unavailable')
+        return [_comment(diff.pr_number, 'gemini', 'null dereference')]
+
+    async def categorize(self, comments, accumulator: MetricsAccumulator):
+        if self.crash:
+            raise RuntimeError('categorizer crashed')
+        await asyncio.sleep(self.categorize_delay)
+        self.packs.append(list(comments))
+        for index, comment in enumerate(comments):
+            accumulator.add_total(comment.bot_name)
+            accumulator.record(comment.bot_name, comment.pr_number, comment, index, 'NITPICK', '')
+
+    def collect_results(self, accumulator):
+        return accumulator.results()
+
+
+def test_failed_diff_analysis_still_categorizes_bot_comments():
+    failures = []
+
+    def on_pr(pr, comments, error, stage):
+        if error:
+            failures.append((pr['number'], stage, len(comments)))
+
+    pipeline = StreamingPipeline(FakeGitHub(), FakeAnalyzer(failing_prs={2}), pack_timeout=0.01, on_pr=on_pr)
+    results = asyncio.run(pipeline.run(limit=3))
+
+    assert failures == [(2, 'analyze', 1)]
+    assert results['metrics']['bot']['total_comments'] == 3
+    assert results['metrics']['gemini']['total_comments'] == 2
+
+
+def _pr_numbers(pack):
+    return [comment.pr_number for comment in pack]
+
+
+def test_packs_flush_on_size_without_splitting_a_pr():
+    analyzer = FakeAnalyzer()
+    pipeline = StreamingPipeline(FakeGitHub(prs=10, comments_per_pr=2), analyzer, pack_size=5, pack_timeout=60)
+    results = asyncio.run(pipeline.run(limit=10))
+
+    assert results['metrics']['bot']['total_comments'] == 20
+    # Each PR brings three comments, so a pack fills up after two PRs
+    assert all(len(pack) == 6 for pack in analyzer.packs[:-1])
+    seen = [set(_pr_numbers(pack)) for pack in analyzer.packs]
+    assert sum(len(prs) for prs in seen) == 10
+    for pack in analyzer.packs:
+        for pr_number in set(_pr_numbers(pack)):
+            assert _pr_numbers(pack).count(pr_number) == 3
+
+
+def test_packs_flush_on_timeout():
+    analyzer = FakeAnalyzer()
+    pipeline = StreamingPipeline(FakeGitHub(prs=3, delay=0.05), analyzer, fetch_concurrency=1,
+                                 pack_size=1000, pack_timeout=0.01)
+    asyncio.run(pipeline.run(limit=3))
+    assert len(analyzer.packs) == 3
+
+
+def test_slow_categorization_holds_back_listing():
+    github = FakeGitHub(prs=500)
+    pipeline = StreamingPipeline(github, FakeAnalyzer(categorize_delay=10), pack_size=1, queue_size=2)
+
+    async def run():
+        stream = pipeline.stream(limit=500)
+        task = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.2)
+        listed = github.listed
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await stream.aclose()
+        return listed
+
+    # Bounded by the queues and workers between listing and categorization, not by the PR count
+    assert asyncio.run(run()) < 40
+
+
+def test_early_stop_cancels_every_stage():
+    github = FakeGitHub(prs=500)
+    pipeline = StreamingPipeline(github, FakeAnalyzer(), pack_size=1)
+
+    async def run():
+        stream = pipeline.stream(limit=500)
+        progress = await stream.__anext__()
+        await stream.aclose()
+        await asyncio.sleep(0)
+        return progress, github.listed, len(asyncio.all_tasks())
+
+    progress, listed, tasks = asyncio.run(run())
+    assert progress.comments_categorized >= 1
+    assert listed < 500
+    assert tasks == 1
+
+
+def test_stage_crash_is_raised():
+    pipeline = StreamingPipeline(FakeGitHub(), FakeAnalyzer(crash=True), pack_timeout=0.01)
+    with pytest.raises(RuntimeError, match='categorizer crashed'):
+        asyncio.run(pipeline.run(limit=3))
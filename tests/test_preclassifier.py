@@ -0,0 +1,54 @@
+from analyzers.preclassifier import RuleBasedPreClassifier
+from models import ReviewComment
+
+
+def _comment(text: str) -> ReviewComment:
+    return ReviewComment(file_name='app.py', chunk='', comment=text, line_nums='10', bot_name='bot', pr_number=1)
+
+
+def _classify(text: str):
+    return RuleBasedPreClassifier().classify(_comment(text))
+
+
+def test_obvious_comments_are_labeled_locally():
+    assert _classify("LGTM!").category == 'OTHER'
+    assert _classify("nit: trailing whitespace").category == 'NITPICK'
+    assert _classify("Typo: 'recieve' should be 'receive'").rule == 'typo'
+    assert _classify("## Walkthrough\nThis PR adds a settings page.").rule == 'walkthrough_summary'
+    assert _classify("<!-- generated -->\n## Summary by CodeRabbit\n- New features").rule == 'walkthrough_summary'
+
+
+def test_bug_comment_with_details_block_goes_to_llm():
+    text = (
+        "_⚠️ Potential issue_\n\n**Null dereference when the user is missing**\n\n"
+        "This will crash the handler.\n\n<details>\n<summary>📝 Committable suggestion</summary>\n\n"
+        "```python\nif user is None:\n    return\n```\n</details>"
+    )
+    assert _classify(text) is None
+
+
+def test_bug_signals_veto_every_rule():
+    assert _classify("typo in the variable name causes a NameError") is None
+    assert _classify("## Summary\nThis change introduces a race between the two writers") is None
+
+
+def test_mid_comment_mentions_do_not_match():
+    assert _classify("The retry loop never exits; also fix the spelling in the log message") is None
+
+
+def test_bug_reports_that_open_like_a_rule_go_to_llm():
+    bug_reports = [
+        "Changes to the retry counter make the loop skip the last page of results.",
+        "Summary: the cache key omits the tenant id, so users see each other's data.",
+        "The date formatting uses %M (minutes) instead of %m (month), so every report is mislabeled.",
+        "Indentation puts the return inside the for loop, so only the first item is processed.",
+    ]
+    indexed = [(i, _comment(text)) for i, text in enumerate(bug_reports)]
+    _, forwarded, _ = RuleBasedPreClassifier(audit_rate=0.0).split(indexed)
+    assert [idx for idx, _ in forwarded] == [0, 1, 2, 3]
+
+
+def test_short_formatting_comments_are_labeled_locally():
+    assert _classify("Trailing whitespace.").rule == 'formatting'
+    assert _classify("Missing newline at end of file").rule == 'formatting'
+    assert _classify("**Summary by CodeRabbit**\n- Bug fixes").rule == 'walkthrough_summary'
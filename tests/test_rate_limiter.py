@@ -0,0 +1,58 @@
+import asyncio
+import time
+
+import pytest
+
+from utils.rate_limiter import make_api_call_with_backoff, wait_with_timeout
+
+
+def test_wait_with_timeout_returns_and_times_out():
+    async def sleep(seconds):
+        await asyncio.sleep(seconds)
+        return seconds
+
+    assert asyncio.run(wait_with_timeout(sleep(0), 1)) == 0
+    assert asyncio.run(wait_with_timeout(sleep(0), None)) == 0
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(wait_with_timeout(sleep(1), 0.01))
+
+
+def test_cancellation_is_not_lost_when_the_call_finishes_at_the_same_time():
+    async def quick():
+        return 'done'
+
+    async def run():
+        outer = asyncio.ensure_future(wait_with_timeout(quick(), 10))
+        # Let the inner call finish, then cancel the caller before it resumes
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        outer.cancel()
+        await outer
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(run())
+
+
+def test_timeouts_are_retried_only_once():
+    attempts = []
+
+    def hang():
+        attempts.append(1)
+        time.sleep(0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(make_api_call_with_backoff(hang, timeout=0.01, initial_delay=0))
+    assert len(attempts) == 2
+
+
+def test_rate_limits_are_retried_up_to_max_retries():
+    attempts = []
+
+    def limited():
+        attempts.append(1)
+        if len(attempts) < 4:
+            raise RuntimeError('429 Resource has been exhausted')
+        return 'ok'
+
+    assert asyncio.run(make_api_call_with_backoff(limited, initial_delay=0)) == 'ok'
+    assert len(attempts) == 4
@@ -0,0 +1,120 @@
+import asyncio
+import json
+import re
+from types import SimpleNamespace
+
+import pytest
+
+from analyzers.gemini import GeminiAnalyzer
+from analyzers.metrics import MetricsAccumulator
+from analyzers.sampling import StratifiedSampler, wilson_interval
+from models import ReviewComment
+
+
+def test_known_value():
+    low, high = wilson_interval(50, 100)
+    assert low == pytest.approx(0.4038, abs=1e-4)
+    assert high == pytest.approx(0.5962, abs=1e-4)
+
+
+def test_extreme_proportions_stay_in_bounds():
+    low, high = wilson_interval(0, 20)
+    assert low == 0.0 and 0.0 < high < 0.2
+    low, high = wilson_interval(20, 20)
+    assert 0.8 < low < 1.0 and high == 1.0
+    assert wilson_interval(0, 0) == (0.0, 1.0)
+
+
+def test_narrows_with_sample_size():
+    widths = [high - low for low, high in (wilson_interval(n // 4, n) for n in (20, 80, 320))]
+    assert widths == sorted(widths, reverse=True)
+
+
+def test_finite_population_correction():
+    low, high = wilson_interval(30, 60)
+    corrected_low, corrected_high = wilson_interval(30, 60, population=100)
+    assert low < corrected_low < 0.5 < corrected_high < high
+    # A census is exact
+    assert wilson_interval(30, 60, population=60) == (0.5, 0.5)
+
+
+def _comments(bot_name, pr_number, count, text):
+    return [
+        ReviewComment(file_name='a.py', chunk='x = 1', comment=f"{text} {i}", line_nums='1',
+                      bot_name=bot_name, pr_number=pr_number)
+        for i in range(count)
+    ]
+
+
+class LabelingAnalyzer:
+    """Stands in for GeminiAnalyzer.categorize_indexed; labels comments mentioning a crash as bugs"""
+
+    def __init__(self):
+        self.classified = []
+
+    async def categorize_indexed(self, entries, accumulator):
+        for entry in entries:
+            self.classified.append(entry.key)
+            category = 'CRITICAL_BUG' if 'crash' in entry.comment.comment else 'NITPICK'
+            accumulator.add_total(entry.bot_name)
+            accumulator.record(entry.bot_name, entry.pr_number, entry.comment, entry.comment_index, category, 'test')
+
+
+class FakeModel:
+    """Answers each "Comment N:" in a categorization prompt the same way LabelingAnalyzer does"""
+    model_name = 'models/fake'
+
+    def generate_content(self, contents, **kwargs):
+        bodies = re.split(r'^Comment \d+:', contents, flags=re.M)[1:]
+        results = [
+            {'comment_index': i, 'category': 'CRITICAL_BUG' if 'crash' in body else 'NITPICK', 'reasoning': 'fake'}
+            for i, body in enumerate(bodies)
+        ]
+        return SimpleNamespace(text=json.dumps(results))
+
+
+def test_sample_is_allocated_proportionally_with_a_floor_per_stratum():
+    comments = _comments('big', 1, 900, 'nit') + _comments('small', 2, 100, 'nit')
+    sampler = StratifiedSampler(sample_size=200, min_per_stratum=30)
+    analyzer = LabelingAnalyzer()
+
+    estimates = asyncio.run(sampler.run(analyzer, GeminiAnalyzer.index_comments(comments), MetricsAccumulator()))
+
+    # 90% of 200 for the big bot; the small bot's 10% share is raised to the floor
+    assert {bot: (e['population'], e['sampled']) for bot, e in estimates.items()} == {
+        'big': (900, 180), 'small': (100, 30)
+    }
+    assert len(set(analyzer.classified)) == 210
+
+
+def test_stratum_smaller_than_its_quota_is_classified_in_full():
+    comments = _comments('big', 1, 900, 'nit') + _comments('tiny', 2, 10, 'crash')
+    sampler = StratifiedSampler(sample_size=100, min_per_stratum=30)
+
+    estimates = asyncio.run(
+        sampler.run(LabelingAnalyzer(), GeminiAnalyzer.index_comments(comments), MetricsAccumulator())
+    )
+
+    assert estimates['tiny']['sampled'] == 10
+    # A census has an exact ratio
+    assert estimates['tiny']['critical_bug_ratio'] == {'estimate': 1.0, 'ci_low': 1.0, 'ci_high': 1.0}
+
+
+def test_results_report_sampled_totals_with_population_ratio_estimates():
+    # One bot on a small PR (all nits) and a large PR (all bugs); the large PR's stratum is oversampled
+    comments = _comments('bot', 1, 900, 'nit') + _comments('bot', 2, 100, 'crash')
+    sampler = StratifiedSampler(sample_size=100, stratify='pr-size', pr_sizes={1: 50, 2: 5000}, min_per_stratum=30)
+    analyzer = GeminiAnalyzer('key', sampler=sampler, call_timeout=None)
+    analyzer._models[analyzer.model_name] = FakeModel()
+
+    results = asyncio.run(analyzer.analyze_comment_quality_in_batch(comments))
+
+    estimate = results['sampling']['bot']
+    assert (estimate['population'], estimate['sampled'], estimate['strata']) == (1000, 120, 2)
+    metrics = results['metrics']['bot']
+    # total_comments counts what was classified, while the ratios weight each stratum by its population:
+    # 30 of the 120 sampled comments are bugs, but only 10% of the population is
+    assert metrics['total_comments'] == 120
+    assert metrics['critical_bug_ratio'] == pytest.approx(0.1)
+    assert metrics['nitpick_ratio'] == pytest.approx(0.9)
+    assert estimate['critical_bug_ratio']['ci_low'] <= 0.1 <= estimate['critical_bug_ratio']['ci_high']
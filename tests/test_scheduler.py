@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from utils.scheduler import CostScheduler
+
+
+def _admission_order(scheduler, jobs, wait_between=0.0):
+    """Queue (name, cost, tenant) jobs behind a job holding every slot; returns the order they are admitted in"""
+    order = []
+
+    async def job(name):
+        order.append(name)
+
+    async def run():
+        gate = asyncio.Event()
+        holders = [asyncio.ensure_future(scheduler.run(1, gate.wait)) for _ in range(scheduler.slots)]
+        await asyncio.sleep(0)
+        tasks = []
+        for name, cost, tenant in jobs:
+            if tasks:
+                await asyncio.sleep(wait_between)
+            tasks.append(asyncio.ensure_future(scheduler.run(cost, job, name, tenant=tenant)))
+        await asyncio.sleep(0)
+        gate.set()
+        await asyncio.gather(*holders, *tasks)
+
+    asyncio.run(run())
+    return order
+
+
+JOBS = [('large', 20000, None), ('small', 100, None), ('medium', 2000, None)]
+
+
+def test_fifo_admits_in_arrival_order():
+    assert _admission_order(CostScheduler(slots=1, policy='fifo'), JOBS) == ['large', 'small', 'medium']
+
+
+def test_sjf_admits_cheapest_first():
+    assert _admission_order(CostScheduler(slots=1, policy='sjf'), JOBS) == ['small', 'medium', 'large']
+
+
+def test_sjf_ages_waiting_jobs():
+    scheduler = CostScheduler(slots=1, policy='sjf', aging_seconds=0.001)
+    jobs = [('large', 3000, None), ('small', 100, None)]
+    # The large job has waited ~50 aging periods by the time the small one arrives
+    assert _admission_order(scheduler, jobs, wait_between=0.05) == ['large', 'small']
+
+
+def test_fair_interleaves_tenants():
+    jobs = [('a1', 100, 'a'), ('a2', 100, 'a'), ('a3', 100, 'a'), ('b1', 100, 'b')]
+    assert _admission_order(CostScheduler(slots=1, policy='fifo'), jobs) == ['a1', 'a2', 'a3', 'b1']
+    assert _admission_order(CostScheduler(slots=1, policy='fair'), jobs) == ['a1', 'b1', 'a2', 'a3']
+
+
+def test_fair_weights_give_a_tenant_a_larger_share():
+    jobs = [('a1', 100, 'a'), ('a2', 100, 'a'), ('b1', 100, 'b'), ('b2', 100, 'b')]
+    scheduler = CostScheduler(slots=1, policy='fair', weights={'b': 4.0})
+    assert _admission_order(scheduler, jobs) == ['b1', 'b2', 'a1', 'a2']
+
+
+def test_oversized_jobs_are_limited_to_their_slots():
+    scheduler = CostScheduler(slots=2, policy='fifo', oversized_cost=1000, max_oversized_slots=1)
+    running, peak = set(), []
+
+    async def job(name, seconds):
+        running.add(name)
+        peak.append(sum(1 for n in running if n.startswith('big')))
+        await asyncio.sleep(seconds)
+        running.discard(name)
+
+    async def run():
+        await asyncio.gather(
+            scheduler.run(5000, job, 'big1', 0.02), scheduler.run(5000, job, 'big2', 0.02),
+            scheduler.run(10, job, 'small', 0.0),
+        )
+
+    asyncio.run(run())
+    assert max(peak) == 1
+    assert scheduler.stats()['dispatched'] == 3
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        CostScheduler(policy='lifo')
@@ -0,0 +1,118 @@
+import asyncio
+
+from github.api import parse_review_comment
+from models import PRDiff, ReviewComment
+from server import EvaluationService, verify_signature
+from utils.run_store import RunStore
+
+REPO = 'owner/repo'
+
+
+def _api_comment(comment_id, line, body='nit: rename this variable'):
+    return {
+        'id': comment_id, 'path': 'a.py', 'diff_hunk': '@@ -1 +1 @@', 'body': body,
+        'line': line, 'original_line': 10, 'user': {'login': 'review-bot[bot]', 'type': 'Bot'},
+    }
+
+
+class FakeGitHub:
+    repo = REPO
+    session = None
+
+    def __init__(self):
+        self.line = 10
+
+    async def fetch_pr_comments(self, pr_number):
+        payloads = [_api_comment(1, self.line), _api_comment(2, self.line, 'typo here')]
+        return [parse_review_comment(payload, pr_number) for payload in payloads]
+
+    async def fetch_pr_diff(self, pr_number):
+        return PRDiff(pr_number=pr_number, diff_content='+++ b/a.py\n+x\n', files_changed=['a.py'])
+
+
+class FakeAnalyzer:
+    def __init__(self, diff_failures=0):
+        self.diff_failures = diff_failures
+        self.diff_calls = 0
+        self.classified = 0
+
+    async def analyze_diff(self, diff):
+        self.diff_calls += 1
+        if self.diff_failures:
+            self.diff_failures -= 1
+            raise RuntimeError('503 Service Unavailable')
+        return [ReviewComment(file_name='a.py', chunk='', comment='null dereference', line_nums='3',
+                              bot_name='gemini', pr_number=diff.pr_number)]
+
+    async def categorize_indexed(self, entries, accumulator):
+        for entry in entries:
+            self.classified += 1
+            accumulator.add_total(entry.bot_name)
+            accumulator.record(entry.bot_name, entry.pr_number, entry.comment, entry.comment_index, 'NITPICK', '')
+
+    def collect_results(self, accumulator):
+        return accumulator.results()
+
+
+def _event(action='synchronize', sha='abc'):
+    return {'action': action, 'number': 7, 'pull_request': {'number': 7, 'head': {'sha': sha}},
+            'repository': {'full_name': REPO}}
+
+
+def test_shifted_comments_are_not_classified_again(tmp_path):
+    github, analyzer = FakeGitHub(), FakeAnalyzer()
+    service = EvaluationService(RunStore(str(tmp_path)), github, analyzer)
+
+    async def run():
+        await service.handle('pull_request', _event('opened', 'abc'))
+        # A push moves every existing comment; outdated ones lose their line entirely
+        github.line = None
+        await service.handle('pull_request', _event('synchronize', 'def'))
+
+    asyncio.run(run())
+    # Two bot comments and the one finding, which both head commits report
+    assert analyzer.classified == 3
+    assert service.metrics()['metrics']['review-bot[bot]']['total_comments'] == 2
+
+
+def test_failed_diff_analysis_is_retried_on_the_next_event(tmp_path):
+    store = RunStore(str(tmp_path))
+    analyzer = FakeAnalyzer(diff_failures=1)
+    service = EvaluationService(store, FakeGitHub(), analyzer)
+
+    first = asyncio.run(service.handle('pull_request', _event()))
+    assert first['status'] == 'error'
+    assert store.diff_store.lookup(REPO, 7, 'abc') is None
+
+    asyncio.run(service.handle('pull_request', _event()))
+    asyncio.run(service.handle('pull_request', _event()))
+    assert analyzer.diff_calls == 2
+    assert store.diff_store.lookup(REPO, 7, 'abc') is not None
+    assert service.metrics()['metrics']['gemini']['total_comments'] == 1
+
+
+def test_restart_restores_seen_comments(tmp_path):
+    store = RunStore(str(tmp_path))
+    service = EvaluationService(store, FakeGitHub(), FakeAnalyzer())
+    asyncio.run(service.handle('pull_request', _event()))
+    service.save()
+
+    analyzer = FakeAnalyzer()
+    restarted = EvaluationService(RunStore(str(tmp_path)), FakeGitHub(), analyzer)
+    asyncio.run(restarted.handle('pull_request_review_comment', {
+        'action': 'created', 'pull_request': {'number': 7}, 'repository': {'full_name': REPO},
+        'comment': _api_comment(1, 12),
+    }))
+    assert analyzer.classified == 0
+    assert restarted.metrics()['metrics']['review-bot[bot]']['total_comments'] == 2
+
+
+def test_signature_verification():
+    import hashlib
+    import hmac
+
+    body = b'{"action": "opened"}'
+    signature = 'sha256=' + hmac.new(b'secret', body, hashlib.sha256).hexdigest()
+    assert verify_signature('secret', body, signature)
+    assert not verify_signature('secret', body, 'sha256=0')
+    assert not verify_signature('secret', body, None)
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+from utils.singleflight import SingleFlight, prompt_key
+
+
+def test_concurrent_identical_prompts_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def call(prompt):
+        calls.append(prompt)
+        await asyncio.sleep(0.01)
+        return f"answer to {prompt}"
+
+    async def run():
+        key = prompt_key('model', 'prompt')
+        return await asyncio.gather(*(flight.do(key, call, 'prompt') for _ in range(5)))
+
+    assert asyncio.run(run()) == ['answer to prompt'] * 5
+    assert calls == ['prompt']
+    assert flight.stats() == {'calls': 1, 'coalesced': 4}
+
+
+def test_error_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight()
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        if len(attempts) == 1:
+            raise RuntimeError('503 Service Unavailable')
+        return 'ok'
+
+    async def run():
+        results = await asyncio.gather(*(flight.do('key', call) for _ in range(3)), return_exceptions=True)
+        return results, await flight.do('key', call)
+
+    results, retried = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert retried == 'ok' and len(attempts) == 2
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    flight = SingleFlight()
+
+    async def call():
+        await asyncio.sleep(0.02)
+        return 'ok'
+
+    async def run():
+        first = asyncio.ensure_future(flight.do('key', call))
+        second = asyncio.ensure_future(flight.do('key', call))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(run()) == 'ok'
+
+
+def test_prompt_key_separates_parts():
+    assert prompt_key('ab', 'c') != prompt_key('a', 'bc')
+    assert prompt_key('model', 'prompt') == prompt_key('model', 'prompt')
@@ -0,0 +1,99 @@
+import asyncio
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from analyzers.gemini import GeminiAnalyzer, StreamInterrupted
+from models import PRDiff
+
+
+def _issue(n):
+    return {'file_name': f'f{n}.py', 'snippet': 'x', 'bug_description': f'bug {n}', 'line_numbers': str(n)}
+
+
+# One chunk per issue, split so each chunk completes exactly one object
+CHUNKS = ['{"issues": [' + json.dumps(_issue(1)), ', ' + json.dumps(_issue(2)), ', ' + json.dumps(_issue(3)) + ']}']
+
+
+class StreamingModel:
+    """Streams `chunks`, failing with `error` once `fail_after` chunks were sent"""
+
+    def __init__(self, chunks, fail_after=None, error=RuntimeError('connection reset'), before_chunk=None):
+        self.model_name = 'models/fake'
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.error = error
+        self.before_chunk = before_chunk
+        self.calls = 0
+
+    def generate_content(self, contents, stream=False, **kwargs):
+        assert stream
+        self.calls += 1
+        return self._stream()
+
+    def _stream(self):
+        for sent, text in enumerate(self.chunks):
+            if sent == self.fail_after:
+                raise self.error
+            if self.before_chunk:
+                self.before_chunk(sent)
+            yield SimpleNamespace(text=text)
+
+
+def _analyzer(model, **kwargs):
+    analyzer = GeminiAnalyzer('key', stream=True, call_timeout=None, **kwargs)
+    analyzer.model = model
+    return analyzer
+
+
+DIFF = PRDiff(pr_number=7, diff_content='+x = 1', files_changed=['f.py'])
+
+
+def test_streamed_issues_are_parsed():
+    model = StreamingModel(CHUNKS)
+    comments = asyncio.run(_analyzer(model).analyze_diff(DIFF))
+    assert [c.comment for c in comments] == ['bug 1', 'bug 2', 'bug 3']
+    assert {c.pr_number for c in comments} == {7}
+
+
+def test_each_issue_is_reported_as_soon_as_its_object_completes():
+    reported = []
+    seen_before_chunk = {}
+    arrived = threading.Event()
+
+    def before_chunk(sent):
+        # Give the event loop a moment to parse the previous chunk before sending the next one
+        if sent:
+            arrived.wait(1)
+            arrived.clear()
+        seen_before_chunk[sent] = list(reported)
+
+    def on_issue(comment):
+        reported.append(comment.comment)
+        arrived.set()
+
+    asyncio.run(_analyzer(StreamingModel(CHUNKS, before_chunk=before_chunk), on_issue=on_issue).analyze_diff(DIFF))
+    assert seen_before_chunk == {0: [], 1: ['bug 1'], 2: ['bug 1', 'bug 2']}
+    assert reported == ['bug 1', 'bug 2', 'bug 3']
+
+
+def test_stream_interrupted_after_first_chunk_is_not_retried():
+    reported = []
+    model = StreamingModel(CHUNKS, fail_after=1, error=RuntimeError('429 Resource exhausted'))
+    analyzer = _analyzer(model, on_issue=lambda comment: reported.append(comment.comment))
+
+    with pytest.raises(StreamInterrupted):
+        asyncio.run(analyzer.analyze_diff(DIFF))
+    # A 429 before any chunk would be retried; after one, replaying would report bug 1 twice
+    assert model.calls == 1
+    assert reported == ['bug 1']
+
+
+def test_stream_failing_before_first_chunk_raises_the_original_error():
+    model = StreamingModel(CHUNKS, fail_after=0, error=ValueError('bad request'))
+
+    with pytest.raises(ValueError, match='bad request'):
+        asyncio.run(_analyzer(model).analyze_diff(DIFF))
+    assert model.calls == 1
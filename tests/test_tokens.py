@@ -0,0 +1,53 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import github.tokens
+from github.tokens import TokenPool
+
+
+def test_picks_the_token_with_the_most_headroom():
+    pool = TokenPool(['a', 'b', 'c'])
+    pool.update('a', {'X-RateLimit-Remaining': '100', 'X-RateLimit-Limit': '5000'})
+    pool.update('b', {'X-RateLimit-Remaining': '4000'})
+    pool.update('c', {'X-RateLimit-Remaining': '3999'})
+
+    async def acquire(n):
+        return [await pool.acquire() for _ in range(n)]
+
+    # Each acquisition is counted up front, so b and c alternate once they are level
+    assert asyncio.run(acquire(4)) == ['b', 'b', 'c', 'b']
+
+
+def test_a_token_past_its_reset_has_its_full_quota():
+    pool = TokenPool(['a', 'b'])
+    pool.update('a', {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(time.time() - 1)})
+    pool.update('b', {'X-RateLimit-Remaining': '10'})
+    assert asyncio.run(pool.acquire()) == 'a'
+    assert pool.snapshot()[0]['remaining'] == 4999
+
+
+def test_sleeps_until_the_earliest_reset_when_every_token_is_exhausted(monkeypatch):
+    clock = [1000.0]
+    sleeps = []
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    monkeypatch.setattr(github.tokens, 'time', SimpleNamespace(time=lambda: clock[0]))
+    monkeypatch.setattr(github.tokens.asyncio, 'sleep', sleep)
+
+    pool = TokenPool(['a', 'b'])
+    pool.mark_exhausted('a', reset_at=1300.0)
+    pool.mark_exhausted('b', reset_at=1100.0)
+
+    assert asyncio.run(pool.acquire()) == 'b'
+    assert sleeps == [101.0]
+
+
+def test_requires_a_token():
+    with pytest.raises(ValueError):
+        TokenPool(['', None])
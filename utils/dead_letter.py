@@ -0,0 +1,68 @@
+import json
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeadLetterQueue:
+    """Persistent list of PRs that failed, so a later run can re-drive just those.
+
+    Entries are keyed by PR number and written to disk on every change.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._entries: Dict[int, dict] = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._entries = {int(entry['pr_number']): entry for entry in json.load(f)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, pr_number: int) -> bool:
+        return pr_number in self._entries
+
+    def add(self, pr_number: int, stage: str, error: Exception, pr: Optional[dict] = None):
+        previous = self._entries.get(pr_number, {})
+        self._entries[pr_number] = {
+            'pr_number': pr_number,
+            'stage': stage,
+            'error_type': type(error).__name__,
+            'error': str(error)[:1000],
+            'retryable': getattr(error, 'retryable', True),
+            'attempts': previous.get('attempts', 0) + 1,
+            'failed_at': time.time(),
+            'pr': self._pr_summary(pr) or previous.get('pr'),
+        }
+        self._save()
+
+    def remove(self, pr_number: int, stage: Optional[str] = None):
+        """Forget a PR's failure; with `stage`, only a failure recorded for that stage"""
+        entry = self._entries.get(pr_number)
+        if entry is None or (stage is not None and entry['stage'] != stage):
+            return
+        del self._entries[pr_number]
+        self._save()
+
+    def entries(self, stage: Optional[str] = None, retryable_only: bool = True) -> List[dict]:
+        return [
+            entry for entry in self._entries.values()
+            if (stage is None or entry['stage'] == stage)
+            and (entry['retryable'] or not retryable_only)
+        ]
+
+    @staticmethod
+    def _pr_summary(pr: Optional[dict]) -> Optional[dict]:
+        if not pr:
+            return None
+        return {key: pr.get(key) for key in ('number', 'title', 'html_url', 'created_at')}
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(list(self._entries.values()), f, indent=2)
+        os.replace(tmp_path, self.path)
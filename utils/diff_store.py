@@ -0,0 +1,178 @@
+import gzip
+import json
+import mmap
+import os
+import hashlib
+import logging
+from typing import List, NamedTuple, Optional
+
+from models import PRDiff
+
+logger = logging.getLogger(__name__)
+
+CODECS = ('zstd', 'gzip')
+_EXTENSIONS = {'zstd': '.zst', 'gzip': '.gz'}
+
+
+def _default_codec() -> str:
+    try:
+        import zstandard  # noqa: F401
+        return 'zstd'
+    except ImportError:
+        return 'gzip'
+
+
+def _compress(codec: str, data: bytes) -> bytes:
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _decompress(codec: str, data) -> bytes:
+    if codec == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("This diff was stored with zstd; install the 'zstandard' package to read it")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+class DiffRef(NamedTuple):
+    """A stored diff: which PR head it belongs to and where its content lives"""
+    repo: Optional[str]
+    pr_number: int
+    head_sha: Optional[str]
+    digest: str
+    codec: str
+    size: int
+    files_changed: List[str]
+
+
+class StoredDiff(PRDiff):
+    """A PRDiff whose content stays compressed on disk until it is read.
+
+    Everything but the text itself comes from the ref, so holding many of
+    these (a scheduler queue, a shard) costs a few hundred bytes each.
+    `diff_content` is decompressed on every access and not kept.
+    """
+
+    __slots__ = ('ref', '_store')
+
+    def __init__(self, store: 'DiffStore', ref: DiffRef):
+        self.pr_number = ref.pr_number
+        self.files_changed = ref.files_changed
+        self.ref = ref
+        self._store = store
+
+    @property
+    def diff_content(self) -> str:
+        return self._store.read(self.ref)
+
+    @property
+    def size(self) -> int:
+        return self.ref.size
+
+    def __repr__(self) -> str:
+        return f"StoredDiff(pr_number={self.pr_number}, digest={self.ref.digest[:12]}, size={self.ref.size})"
+
+
+class DiffStore:
+    """Content-addressed, compressed diff storage keyed by (repo, PR, head SHA).
+
+    Layout:
+        objects/<ab>/<sha256>.zst|.gz          diff text, one file per distinct content
+        refs/<owner>/<name>/<pr>/<head_sha>.json  the DiffRef for that PR head
+
+    A PR head's diff never changes, so a ref found here can be used instead
+    of downloading the diff again. Identical diffs (re-pushed heads,
+    backports) share one object. Objects are zstd-compressed when the
+    `zstandard` package is installed and gzip-compressed otherwise; reads
+    memory-map the object and decompress it on demand.
+    """
+
+    def __init__(self, root: str, codec: Optional[str] = None):
+        if codec is not None and codec not in CODECS:
+            raise ValueError(f"Unknown codec {codec!r}; expected one of {', '.join(CODECS)}")
+        self.root = root
+        self.codec = codec or _default_codec()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'refs'), exist_ok=True)
+
+    def lookup(self, repo: Optional[str], pr_number: int, head_sha: Optional[str]) -> Optional[DiffRef]:
+        if not (repo and head_sha):
+            return None
+        path = self._ref_path(repo, pr_number, head_sha)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            ref = DiffRef(**json.load(f))
+        if self._object_path(ref.digest, ref.codec) is None:
+            logger.warning(f"Diff object {ref.digest} for PR #{pr_number} is missing; ignoring its ref")
+            return None
+        return ref
+
+    def put(self, diff: PRDiff, repo: Optional[str] = None, head_sha: Optional[str] = None) -> DiffRef:
+        """Store a diff's content (once per distinct content) and, given its head SHA, its ref"""
+        data = diff.diff_content.encode('utf-8')
+        digest = hashlib.sha256(data).hexdigest()
+
+        codec = self.codec
+        existing = self._existing_object(digest)
+        if existing is not None:
+            codec = existing
+        else:
+            path = self._new_object_path(digest, codec)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_atomic(path, _compress(codec, data))
+
+        ref = DiffRef(
+            repo=repo,
+            pr_number=diff.pr_number,
+            head_sha=head_sha,
+            digest=digest,
+            codec=codec,
+            size=len(diff.diff_content),
+            files_changed=list(diff.files_changed)
+        )
+        if repo and head_sha:
+            path = self._ref_path(repo, diff.pr_number, head_sha)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._write_atomic(path, json.dumps(ref._asdict()).encode('utf-8'))
+        return ref
+
+    def open(self, ref: DiffRef) -> StoredDiff:
+        return StoredDiff(self, ref)
+
+    def read(self, ref: DiffRef) -> str:
+        path = self._object_path(ref.digest, ref.codec)
+        if path is None:
+            raise FileNotFoundError(f"Diff object {ref.digest} for PR #{ref.pr_number} is missing from {self.root}")
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            return _decompress(ref.codec, mapped).decode('utf-8')
+
+    def _existing_object(self, digest: str) -> Optional[str]:
+        for codec in CODECS:
+            if self._object_path(digest, codec) is not None:
+                return codec
+        return None
+
+    def _object_path(self, digest: str, codec: str) -> Optional[str]:
+        path = self._new_object_path(digest, codec)
+        return path if os.path.exists(path) else None
+
+    def _new_object_path(self, digest: str, codec: str) -> str:
+        return os.path.join(self.root, 'objects', digest[:2], digest + _EXTENSIONS[codec])
+
+    def _ref_path(self, repo: str, pr_number: int, head_sha: str) -> str:
+        owner, _, name = repo.partition('/')
+        return os.path.join(self.root, 'refs', owner, name, str(pr_number), f"{head_sha}.json")
+
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        # Processes sharing a store may write the same object; the per-process temp file keeps that safe
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import time
+import logging
+from collections import defaultdict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyTracker:
+    """Latencies of the most recent `window` calls"""
+
+    def __init__(self, window: int = 200):
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Hedger:
+    """Hedged requests: a call still running at the tracked `percentile` latency gets a duplicate.
+
+    Whichever attempt succeeds first wins. Latency is tracked separately per
+    key (e.g. per endpoint), and nothing is hedged for a key until it has
+    `min_samples` latencies. Every attempt's latency is tracked, not just the
+    winner's: a loser is recorded when it finishes, or at the time it was
+    cancelled, so the percentile isn't pulled down by hedges that won. Hedges
+    are limited to `budget` of all calls (0.05 allows one duplicate per 20
+    calls, banked up to `max_burst`), so the extra cost stays bounded however
+    slow a backend gets. Only idempotent calls should be hedged.
+
+    Losers are cancelled, except for calls run with `cancellable=False`:
+    cancelling a call that runs in a worker thread (`asyncio.to_thread`, as the
+    LLM SDKs do) only stops waiting for it, so the request keeps running and is
+    billed either way. Those losers are left to finish, counted as `abandoned`.
+    """
+
+    def __init__(self, percentile: float = 0.95, budget: float = 0.05, min_samples: int = 20,
+                 min_delay: float = 0.05, max_burst: float = 10.0, window: int = 200):
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_burst = max_burst
+        self._trackers: Dict[Hashable, LatencyTracker] = defaultdict(lambda: LatencyTracker(window))
+        self._tokens = 0.0
+        self._counts = {'calls': 0, 'hedged': 0, 'hedge_wins': 0, 'abandoned': 0}
+        # Losing attempts left running; referenced so they aren't garbage collected before they finish
+        self._abandoned: Set[asyncio.Task] = set()
+
+    def delay(self, key: Hashable) -> Optional[float]:
+        """How long a call for `key` may run before it is hedged, or None while too few samples exist"""
+        tracker = self._trackers[key]
+        if len(tracker) < self.min_samples:
+            return None
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable[Any]], cancellable: bool = True) -> Any:
+        self._counts['calls'] += 1
+        self._tokens = min(self.max_burst, self._tokens + self.budget)
+
+        started = {}
+        attempts = []
+
+        def start():
+            task = asyncio.ensure_future(call())
+            started[task] = time.monotonic()
+            task.add_done_callback(functools.partial(self._finished, key, started[task]))
+            attempts.append(task)
+            return task
+
+        primary = start()
+        try:
+            delay = self.delay(key)
+            if delay is not None:
+                await asyncio.wait([primary], timeout=delay)
+                if not primary.done() and self._tokens >= 1:
+                    self._tokens -= 1
+                    self._counts['hedged'] += 1
+                    logger.debug(f"Hedging {key} call still running after {delay:.2f}s")
+                    start()
+
+            pending = set(attempts)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.cancelled():
+                        continue
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+                    if task is not primary:
+                        self._counts['hedge_wins'] += 1
+                    return task.result()
+            raise error or asyncio.CancelledError()
+        finally:
+            for task in attempts:
+                if task.done():
+                    continue
+                if cancellable:
+                    # It ran at least this long; a lower bound beats leaving the slow attempt out
+                    self._trackers[key].record(time.monotonic() - started[task])
+                    task.cancel()
+                else:
+                    self._counts['abandoned'] += 1
+                    self._abandoned.add(task)
+                    task.add_done_callback(self._abandoned.discard)
+
+    def _finished(self, key: Hashable, started: float, task: asyncio.Task):
+        # Retrieving the exception also keeps asyncio from warning about an abandoned attempt's failure
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._trackers[key].record(time.monotonic() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self._counts,
+            'hedge_ratio': self._counts['hedged'] / self._counts['calls'] if self._counts['calls'] else 0.0,
+            'delays': {str(key): self.delay(key) for key in self._trackers},
+            'latencies': {
+                str(key): {'samples': len(tracker), 'p95': tracker.percentile(0.95), 'max': tracker.percentile(1.0)}
+                for key, tracker in self._trackers.items()
+            },
+        }
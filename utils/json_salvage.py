@@ -0,0 +1,90 @@
+import json
+import logging
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalJSONExtractor:
+    """Pulls complete JSON objects out of a possibly malformed or truncated stream.
+
+    Text can be fed in chunks (e.g. from a streaming completion). Every object
+    that is an element of an array, such as each classification in `[{...}, ...]`
+    or each issue in `{"issues": [{...}, ...]}`, is returned as soon as its
+    closing brace arrives. Anything that fails to parse, a truncated tail, or
+    text around the JSON (like markdown fences) is skipped.
+    """
+
+    def __init__(self):
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._item_depth = None
+        self._item_chars: List[str] = []
+        self._top_level: List[str] = []
+        self.emitted = 0
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Consume more text and return the objects completed by it"""
+        completed = []
+        for char in chunk:
+            if self._item_depth is not None:
+                self._item_chars.append(char)
+            elif self._stack or char in '{[':
+                self._top_level.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = bool(self._stack)
+            elif char in '{[':
+                if char == '{' and self._item_depth is None and self._stack and self._stack[-1] == '[':
+                    # An object directly inside an array: one result item
+                    self._item_depth = len(self._stack)
+                    self._item_chars = [char]
+                self._stack.append(char)
+            elif char in '}]':
+                if not self._stack:
+                    continue
+                self._stack.pop()
+                if char == '}' and len(self._stack) == self._item_depth:
+                    item = self._parse(''.join(self._item_chars))
+                    if item is not None:
+                        completed.append(item)
+                    self._item_depth, self._item_chars = None, []
+
+        self.emitted += len(completed)
+        return completed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """Finish the stream; a lone top-level object with no array items is returned here"""
+        if self.emitted:
+            return []
+        item = self._parse(''.join(self._top_level))
+        if item is None:
+            return []
+        self.emitted += 1
+        return [item]
+
+    @staticmethod
+    def _parse(text: str):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
+
+
+def salvage_objects(text: str) -> List[Dict[str, Any]]:
+    """Every complete result object in `text`, tolerating malformed or truncated JSON"""
+    extractor = IncrementalJSONExtractor()
+    objects = extractor.feed(text)
+    objects.extend(extractor.close())
+    return objects
@@ -0,0 +1,307 @@
+"""
+Profiling mode (`code-review-evals <command> --profile`).
+
+Each stage runs under a CPU profiler: pyinstrument's sampling profiler when it
+is installed (it attributes time across awaits), cProfile otherwise. At
+every stage boundary the top allocators are taken from tracemalloc. A
+background task measures how late the event loop wakes it, which shows
+synchronous work (JSON parsing, pandas, matplotlib) blocking network I/O.
+GitHub requests and LLM calls are timed with `awaited`, and the slowest are
+kept.
+
+Everything is written to <run-dir>/profile/<timestamp>/:
+
+    summary.txt          per-stage table, slowest awaits, top functions and allocators
+    profile.json         the same data, machine readable
+    <stage>.prof         cProfile stats (open with pstats or snakeviz)
+    <stage>.txt          top functions by cumulative time (or pyinstrument's call tree)
+    <stage>.html         pyinstrument's interactive report, when it is used
+
+Only the event loop's thread is profiled; time spent inside SDK worker
+threads shows up as awaits instead.
+"""
+
+import asyncio
+import cProfile
+import heapq
+import io
+import itertools
+import json
+import os
+import pstats
+import selectors
+import time
+import logging
+import tracemalloc
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROFILERS = ('auto', 'cprofile', 'sampling')
+
+_EVENT_LOOP_FILES = (os.path.dirname(asyncio.__file__), selectors.__file__)
+
+# The profiler of the current run, if any; `awaited` is a no-op without one
+_active: Optional['Profiler'] = None
+
+
+@asynccontextmanager
+async def awaited(label: str):
+    """Time an awaited call for the active profiler's slowest-awaits list"""
+    profiler = _active
+    if profiler is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.record_await(label, time.perf_counter() - started)
+
+
+def _sampling_available() -> bool:
+    try:
+        import pyinstrument  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _short_path(filename: str) -> str:
+    relative = os.path.relpath(filename) if os.path.isabs(filename) else filename
+    return filename if relative.startswith('..') else relative
+
+
+def _mb(size: int) -> float:
+    return size / (1024 * 1024)
+
+
+class Profiler:
+    """Collects per-stage CPU, memory, event-loop lag and await timings for one run"""
+
+    def __init__(self, output_dir: str, top: int = 20, profiler: str = 'auto', lag_interval: float = 0.05):
+        if profiler not in PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler!r}; expected one of {', '.join(PROFILERS)}")
+        if profiler == 'sampling' and not _sampling_available():
+            raise RuntimeError("Sampling profiles need the 'pyinstrument' package")
+        self.sampling = profiler == 'sampling' or (profiler == 'auto' and _sampling_available())
+        self.output_dir = os.path.join(output_dir, datetime.now().strftime('%Y%m%d-%H%M%S'))
+        self.top = top
+        self.lag_interval = lag_interval
+
+        self.stages: List[Dict[str, Any]] = []
+        self._stage: Optional[str] = None
+        self._lags: List[Tuple[Optional[str], float]] = []
+        self._awaits: List[Tuple[float, int, str, Optional[str]]] = []
+        self._await_counter = itertools.count()
+        self._monitor: Optional[asyncio.Task] = None
+        self._tick: Optional[float] = None
+        self._started_tracing = False
+
+    async def __aenter__(self) -> 'Profiler':
+        global _active
+        os.makedirs(self.output_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._monitor = asyncio.ensure_future(self._monitor_loop())
+        await asyncio.sleep(0)
+        _active = self
+        return self
+
+    async def __aexit__(self, *exc_info):
+        global _active
+        _active = None
+        self._monitor.cancel()
+        if self._started_tracing:
+            tracemalloc.stop()
+        self.write()
+
+    @asynccontextmanager
+    async def stage(self, name: str):
+        """Profile everything that runs on the event loop while the block executes"""
+        self._stage = name
+        before = self._memory_snapshot()
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        cpu_profiler = self._start_cpu_profiler()
+        wall_started, cpu_started = time.perf_counter(), time.process_time()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = repr(e)
+            raise
+        finally:
+            wall, cpu = time.perf_counter() - wall_started, time.process_time() - cpu_started
+            self._flush_lag()
+            top_functions = self._stop_cpu_profiler(cpu_profiler, name)
+            after = self._memory_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            self._stage = None
+            self.stages.append({
+                'stage': name,
+                'wall_seconds': wall,
+                'cpu_seconds': cpu,
+                'memory_mb': _mb(current),
+                'peak_memory_mb': _mb(peak),
+                'allocated_mb': _mb(sum(stat.size_diff for stat in after.compare_to(before, 'filename'))),
+                'loop_lag': self._lag_stats(name),
+                'top_functions': top_functions,
+                'top_allocators': [
+                    {'location': str(stat.traceback), 'size_diff_mb': _mb(stat.size_diff), 'count_diff': stat.count_diff}
+                    for stat in after.compare_to(before, 'lineno')[:self.top]
+                ],
+                'error': error,
+            })
+            logger.info(f"Stage {name} took {wall:.2f}s ({cpu:.2f}s CPU), peak memory {_mb(peak):.1f} MB")
+
+    def record_await(self, label: str, seconds: float):
+        entry = (seconds, next(self._await_counter), label, self._stage)
+        if len(self._awaits) < self.top:
+            heapq.heappush(self._awaits, entry)
+        else:
+            heapq.heappushpop(self._awaits, entry)
+
+    def slowest_awaits(self) -> List[Dict[str, Any]]:
+        return [
+            {'label': label, 'stage': stage, 'seconds': seconds}
+            for seconds, _, label, stage in sorted(self._awaits, reverse=True)
+        ]
+
+    def write(self) -> str:
+        """Write the profile bundle; returns the path of its summary"""
+        with open(os.path.join(self.output_dir, 'profile.json'), 'w', encoding='utf-8') as f:
+            json.dump({
+                'profiler': 'pyinstrument' if self.sampling else 'cProfile',
+                'stages': self.stages,
+                'slowest_awaits': self.slowest_awaits(),
+            }, f, indent=2)
+        summary_path = os.path.join(self.output_dir, 'summary.txt')
+        with open(summary_path, 'w', encoding='utf-8') as f:
+            f.write(self.summary())
+        logger.info(f"Profile written to {self.output_dir}")
+        return summary_path
+
+    def summary(self) -> str:
+        lines = [
+            f"{'Stage':<16}{'Wall s':>9}{'CPU s':>9}{'Mem MB':>9}{'Peak MB':>9}{'Alloc MB':>10}"
+            f"{'Lag p95 ms':>12}{'Lag max ms':>12}{'Stalls':>8}",
+            '-' * 94,
+        ]
+        for stage in self.stages:
+            lag = stage['loop_lag']
+            lines.append(
+                f"{stage['stage']:<16}{stage['wall_seconds']:>9.2f}{stage['cpu_seconds']:>9.2f}"
+                f"{stage['memory_mb']:>9.1f}{stage['peak_memory_mb']:>9.1f}{stage['allocated_mb']:>10.1f}"
+                f"{lag['p95_ms']:>12.1f}{lag['max_ms']:>12.1f}{lag['stalls']:>8}"
+                + (f"  failed: {stage['error']}" if stage['error'] else '')
+            )
+        lines.append("\nStalls are event-loop wakeups more than 100 ms late.")
+
+        lines.append("\nSlowest awaited calls:")
+        for entry in self.slowest_awaits():
+            lines.append(f"  {entry['seconds']:>8.2f}s  [{entry['stage']}] {entry['label']}")
+
+        for stage in self.stages:
+            lines.append(f"\n== {stage['stage']} ==")
+            if stage['top_functions']:
+                lines.append("Top functions (cumulative seconds, calls):")
+            else:
+                lines.append(f"Call tree: {stage['stage']}.txt")
+            for function in stage['top_functions']:
+                lines.append(f"  {function['cumulative_seconds']:>8.3f}s  {function['calls']:>8}  {function['function']}")
+            lines.append("Top allocators (MB allocated during the stage):")
+            for allocator in stage['top_allocators']:
+                lines.append(f"  {allocator['size_diff_mb']:>8.2f}  {allocator['location']}")
+        return '\n'.join(lines) + '\n'
+
+    def _start_cpu_profiler(self):
+        if self.sampling:
+            from pyinstrument import Profiler as SamplingProfiler
+            profiler = SamplingProfiler(async_mode='enabled')
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        return profiler
+
+    def _stop_cpu_profiler(self, profiler, name: str) -> List[Dict[str, Any]]:
+        base = os.path.join(self.output_dir, name)
+        if self.sampling:
+            profiler.stop()
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(profiler.output_text(unicode=False, color=False))
+            with open(base + '.html', 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            # The call tree in <stage>.txt replaces the flat list
+            return []
+
+        profiler.disable()
+        profiler.dump_stats(base + '.prof')
+        text = io.StringIO()
+        stats = pstats.Stats(profiler, stream=text)
+        stats.sort_stats('cumulative').print_stats(self.top * 2)
+        with open(base + '.txt', 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+
+        top_functions = []
+        for (filename, line, function), (_, calls, _, cumulative, _) in stats.stats.items():
+            if filename == '~' or filename.startswith('<frozen') or filename.startswith(_EVENT_LOOP_FILES):
+                # Built-ins and the event loop itself are mostly waiting, and the import
+                # machinery repeats the cost of the <module> entries below it
+                continue
+            top_functions.append({
+                'function': f"{_short_path(filename)}:{line}({function})",
+                'calls': calls,
+                'cumulative_seconds': cumulative,
+            })
+        top_functions.sort(key=lambda entry: entry['cumulative_seconds'], reverse=True)
+        return top_functions[:self.top]
+
+    def _memory_snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, cProfile.__file__),
+            tracemalloc.Filter(False, pstats.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+    def _lag_stats(self, stage: str) -> Dict[str, Any]:
+        lags = [lag for lag_stage, lag in self._lags if lag_stage == stage]
+        return {
+            'samples': len(lags),
+            'p50_ms': (_percentile(lags, 0.5) or 0.0) * 1000,
+            'p95_ms': (_percentile(lags, 0.95) or 0.0) * 1000,
+            'max_ms': max(lags, default=0.0) * 1000,
+            'stalls': sum(1 for lag in lags if lag > 0.1),
+        }
+
+    async def _monitor_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            tick = self._tick = loop.time()
+            await asyncio.sleep(self.lag_interval)
+            if self._tick == tick:
+                self._lags.append((self._stage, max(0.0, loop.time() - tick - self.lag_interval)))
+
+    def _flush_lag(self):
+        # A stage that never yields to the loop ends before the monitor wakes up to measure it
+        if self._tick is None:
+            return
+        lag = asyncio.get_running_loop().time() - self._tick - self.lag_interval
+        if lag > 0:
+            self._lags.append((self._stage, lag))
+            self._tick = None
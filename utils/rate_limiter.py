@@ -2,7 +2,9 @@ import asyncio
 import time
 import random
 import logging
-from typing import Callable, Any
+from typing import Callable, Any, Optional
+
+from .profiling import awaited
 
 logger = logging.getLogger(__name__)
 
@@ -33,20 +35,65 @@ class RateLimiter:
                 self.tokens -= 1
 
 
-async def make_api_call_with_backoff(func: Callable, *args, max_retries=5, initial_delay=1) -> Any:
-    """Make API call with exponential backoff retry logic"""
+async def wait_with_timeout(awaitable, timeout: Optional[float]) -> Any:
+    """Like asyncio.wait_for, but never loses the caller's cancellation.
+
+    Before Python 3.12, wait_for returns the result instead of raising
+    CancelledError when the awaitable finishes just as the caller is
+    cancelled, so a cancelled task carries on (e.g. into a full queue).
+    """
+    if timeout is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=timeout)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        raise asyncio.TimeoutError()
+    return task.result()
+
+
+def _is_timeout(e: Exception) -> bool:
+    # The SDKs raise their own deadline errors (e.g. google.api_core's DeadlineExceeded)
+    return isinstance(e, asyncio.TimeoutError) or 'Deadline' in type(e).__name__ or 'Timeout' in type(e).__name__
+
+
+async def make_api_call_with_backoff(func: Callable, *args, max_retries=5, initial_delay=1,
+                                     timeout: Optional[float] = None, max_timeout_retries: int = 1) -> Any:
+    """Make API call with exponential backoff retry logic.
+
+    With `timeout`, each attempt is abandoned after that many seconds. A
+    timed-out attempt is retried at most `max_timeout_retries` times, since
+    each one can cost the full timeout; rate-limited attempts get up to
+    `max_retries`. The worker thread of an abandoned attempt can't be
+    interrupted, so `func` should enforce a similar timeout itself.
+    """
     delay = initial_delay
     last_exception = None
+    timeouts = 0
+    label = getattr(func, '__qualname__', repr(func)).replace('.<locals>', '')
 
     for retry in range(max_retries):
         try:
-            return await asyncio.to_thread(func, *args)
+            call = asyncio.to_thread(func, *args)
+            async with awaited(label):
+                return await wait_with_timeout(call, timeout)
         except Exception as e:
             last_exception = e
 
-            if '429' in str(e):
+            if _is_timeout(e):
+                timeouts += 1
+                if timeouts > max_timeout_retries:
+                    logger.error(f"Call timed out {timeouts} times, giving up")
+                    raise
+            if '429' in str(e) or _is_timeout(e):
                 sleep_time = delay * (2 ** retry) + random.uniform(0, 0.1)
-                logger.warning(f"Rate limit hit, retrying in {sleep_time:.2f} seconds...")
+                reason = "Rate limit hit" if '429' in str(e) else "Call timed out"
+                logger.warning(f"{reason}, retrying in {sleep_time:.2f} seconds...")
                 await asyncio.sleep(sleep_time)
                 continue
             else:
@@ -54,4 +101,3 @@ async def make_api_call_with_backoff(func: Callable, *args, max_retries=5, initi
 
     logger.error(f"Failed after {max_retries} retries. Last error: {last_exception}")
     raise last_exception
-
@@ -0,0 +1,248 @@
+import json
+import os
+import hashlib
+import logging
+from dataclasses import asdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from models import ReviewComment, PRDiff, CommentTable
+from github.api import parse_files_changed
+from utils.dead_letter import DeadLetterQueue
+from utils.diff_store import DiffStore, DiffRef
+
+logger = logging.getLogger(__name__)
+
+
+def _json_default(obj: Any) -> Any:
+    if isinstance(obj, CommentTable):
+        return obj.to_records()
+    return str(obj)
+
+
+class RunStore:
+    """Persistent run directory shared by the CLI stages.
+
+    Layout:
+        prs.json                    PR metadata from the listing
+        diffs/<pr>.json             the PR's diff in the diff store (diffs/<pr>.diff in older runs)
+        diff_store/                 compressed, content-addressed diffs; see DiffStore
+        comments/<pr>.<source>.json comments per PR ('github' bot comments, 'gemini' findings)
+        results.json                categorization metrics and classifications
+        matching.json               per-bot recall/precision against the reference findings
+        similarity_index.npz        TF-IDF vectors of stored comments, reused across runs
+        similarity.json             groups of similar comments
+        failed_prs.json             dead-letter list of PRs whose fetch or diff analysis failed
+        reports/                    rendered reports and charts
+        batch/                      offline batch job files, state and downloaded results
+        stream.jsonl                results emitted while streaming, as they arrive
+        queue.db                    work queue shared by a coordinator and its workers
+        partial_results/<job>.json  categorization results written by individual workers
+    """
+
+    def __init__(self, run_dir: str, diff_store_dir: Optional[str] = None):
+        """`diff_store_dir` may point several run directories at one shared diff store"""
+        self.run_dir = run_dir
+        self.diffs_dir = os.path.join(run_dir, 'diffs')
+        self.comments_dir = os.path.join(run_dir, 'comments')
+        self.reports_dir = os.path.join(run_dir, 'reports')
+        for path in (self.run_dir, self.diffs_dir, self.comments_dir, self.reports_dir):
+            os.makedirs(path, exist_ok=True)
+        self.dead_letter = DeadLetterQueue(os.path.join(run_dir, 'failed_prs.json'))
+        self.diff_store = DiffStore(diff_store_dir or os.path.join(run_dir, 'diff_store'))
+        self._head_shas: Optional[Dict[int, str]] = None
+
+    @property
+    def prs_path(self) -> str:
+        return os.path.join(self.run_dir, 'prs.json')
+
+    @property
+    def results_path(self) -> str:
+        return os.path.join(self.run_dir, 'results.json')
+
+    @property
+    def matching_path(self) -> str:
+        return os.path.join(self.run_dir, 'matching.json')
+
+    def save_matching(self, matching: Dict[str, Any]):
+        self._write_json(self.matching_path, matching)
+
+    def load_matching(self) -> Optional[Dict[str, Any]]:
+        if not os.path.exists(self.matching_path):
+            return None
+        return self._read_json(self.matching_path)
+
+    @property
+    def similarity_index_path(self) -> str:
+        return os.path.join(self.run_dir, 'similarity_index.npz')
+
+    def save_similarity(self, similarity: Dict[str, Any]):
+        self._write_json(os.path.join(self.run_dir, 'similarity.json'), similarity)
+
+    def save_prs(self, prs: List[dict]):
+        keep = ('number', 'title', 'html_url', 'created_at', 'state')
+        records = []
+        for pr in prs:
+            record = {key: pr.get(key) for key in keep}
+            record['head_sha'] = (pr.get('head') or {}).get('sha', pr.get('head_sha'))
+            records.append(record)
+        self._write_json(self.prs_path, records)
+        self._head_shas = None
+
+    def load_prs(self) -> List[dict]:
+        if not os.path.exists(self.prs_path):
+            return []
+        return self._read_json(self.prs_path)
+
+    def head_sha(self, pr_number: int) -> Optional[str]:
+        """The PR's head commit as of the last listing, if known"""
+        if self._head_shas is None:
+            self._head_shas = {pr['number']: pr.get('head_sha') for pr in self.load_prs()}
+        return self._head_shas.get(pr_number)
+
+    def has_diff(self, pr_number: int) -> bool:
+        return os.path.exists(self._diff_ref_path(pr_number)) or os.path.exists(self._diff_path(pr_number))
+
+    def save_diff(self, diff: PRDiff, repo: Optional[str] = None, head_sha: Optional[str] = None):
+        ref = self.diff_store.put(diff, repo, head_sha)
+        self._write_json(self._diff_ref_path(diff.pr_number), ref._asdict())
+
+    def link_diff(self, repo: str, pr_number: int, head_sha: Optional[str]) -> bool:
+        """Use the diff store's copy of a PR head's diff, if it has one, instead of fetching it"""
+        ref = self.diff_store.lookup(repo, pr_number, head_sha)
+        if ref is None:
+            return False
+        self._write_json(self._diff_ref_path(pr_number), ref._asdict())
+        return True
+
+    def load_diff(self, pr_number: int) -> PRDiff:
+        """The PR's diff; its content is only read and decompressed when accessed"""
+        if os.path.exists(self._diff_ref_path(pr_number)):
+            return self.diff_store.open(DiffRef(**self._read_json(self._diff_ref_path(pr_number))))
+
+        with open(self._diff_path(pr_number), 'r', encoding='utf-8') as f:
+            diff_content = f.read()
+        return PRDiff(
+            pr_number=pr_number,
+            diff_content=diff_content,
+            files_changed=parse_files_changed(diff_content)
+        )
+
+    def diff_pr_numbers(self) -> List[int]:
+        return sorted({
+            int(name.split('.')[0]) for name in os.listdir(self.diffs_dir)
+            if name.endswith(('.json', '.diff'))
+        })
+
+    def has_comments(self, pr_number: int, source: str) -> bool:
+        return os.path.exists(self._comments_path(pr_number, source))
+
+    def save_comments(self, pr_number: int, source: str, comments: List[ReviewComment]):
+        self._write_json(self._comments_path(pr_number, source), [asdict(c) for c in comments])
+
+    def load_comments(self, pr_number: int, source: str) -> List[ReviewComment]:
+        return [ReviewComment(**record) for record in self._read_json(self._comments_path(pr_number, source))]
+
+    def iter_comments(self, sources=('github', 'gemini')) -> Iterator[ReviewComment]:
+        """Yield stored comments PR by PR"""
+        pr_numbers = sorted({
+            int(name.split('.')[0]) for name in os.listdir(self.comments_dir) if name.endswith('.json')
+        })
+        for pr_number in pr_numbers:
+            for source in sources:
+                if self.has_comments(pr_number, source):
+                    yield from self.load_comments(pr_number, source)
+
+    def has_results(self) -> bool:
+        return os.path.exists(self.results_path)
+
+    def results_stale(self) -> bool:
+        """True if results are missing or older than any stored comments"""
+        if not self.has_results():
+            return True
+        results_mtime = os.path.getmtime(self.results_path)
+        return any(
+            os.path.getmtime(os.path.join(self.comments_dir, name)) > results_mtime
+            for name in os.listdir(self.comments_dir)
+        )
+
+    def save_results(self, results: Dict[str, Any]):
+        self._write_json(self.results_path, results)
+
+    def load_results(self) -> Optional[Dict[str, Any]]:
+        if not self.has_results():
+            return None
+        results = self._read_json(self.results_path)
+        if 'comments' in results:
+            results['comments'] = CommentTable.from_records(results['comments'])
+        # JSON object keys are strings; restore integer PR numbers
+        results['classifications'] = {
+            bot_name: {int(pr_number): records for pr_number, records in pr_data.items()}
+            for bot_name, pr_data in results.get('classifications', {}).items()
+        }
+        return results
+
+    @property
+    def queue_path(self) -> str:
+        return os.path.join(self.run_dir, 'queue.db')
+
+    def save_partial_results(self, name: str, results: Dict[str, Any]):
+        os.makedirs(self._partial_results_dir, exist_ok=True)
+        self._write_json(os.path.join(self._partial_results_dir, f"{name}.json"), results)
+
+    def iter_partial_results(self, names: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Yield the named partial results; other runs' leftovers in the directory are ignored"""
+        for name in names:
+            path = os.path.join(self._partial_results_dir, f"{name}.json")
+            if os.path.exists(path):
+                yield self._read_json(path)
+            else:
+                logger.warning(f"Partial results {name} are missing from {self._partial_results_dir}")
+
+    def comments_fingerprint(self, pr_numbers: Iterable[int]) -> str:
+        """Digest of which comment files exist for these PRs and their sizes and modification times"""
+        digest = hashlib.sha256()
+        for pr_number in pr_numbers:
+            for source in ('github', 'gemini'):
+                path = self._comments_path(pr_number, source)
+                stat = os.stat(path) if os.path.exists(path) else None
+                digest.update(f"{pr_number}.{source}:{stat and (stat.st_size, stat.st_mtime_ns)};".encode('utf-8'))
+        return digest.hexdigest()
+
+    @property
+    def _partial_results_dir(self) -> str:
+        return os.path.join(self.run_dir, 'partial_results')
+
+    @property
+    def stream_path(self) -> str:
+        return os.path.join(self.run_dir, 'stream.jsonl')
+
+    def append_stream_event(self, event: Dict[str, Any]):
+        """Append one streamed result so progress is visible before a stage finishes"""
+        with open(self.stream_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(event, default=_json_default) + '\n')
+
+    def report_path(self, name: str) -> str:
+        return os.path.join(self.reports_dir, name)
+
+    def _diff_path(self, pr_number: int) -> str:
+        return os.path.join(self.diffs_dir, f"{pr_number}.diff")
+
+    def _diff_ref_path(self, pr_number: int) -> str:
+        return os.path.join(self.diffs_dir, f"{pr_number}.json")
+
+    def _comments_path(self, pr_number: int, source: str) -> str:
+        return os.path.join(self.comments_dir, f"{pr_number}.{source}.json")
+
+    @staticmethod
+    def _write_json(path: str, data: Any):
+        # Write to a temp file first so an interrupted run never leaves a truncated file.
+        # The temp name is per process since workers sharing a run directory may write the same file.
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, default=_json_default)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path: str) -> Any:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
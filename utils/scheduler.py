@@ -0,0 +1,158 @@
+import asyncio
+import time
+import math
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from models import PRDiff, ReviewComment
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ('fifo', 'sjf', 'fair')
+
+# Rough prompt overhead per request and per comment, in tokens
+_REQUEST_OVERHEAD = 500
+_COMMENT_OVERHEAD = 30
+_FILE_OVERHEAD = 50
+
+
+def estimate_diff_cost(diff: PRDiff) -> float:
+    """Approximate LLM tokens needed to analyze a diff"""
+    return _REQUEST_OVERHEAD + diff.size / 4 + _FILE_OVERHEAD * len(diff.files_changed)
+
+
+def estimate_comments_cost(comments: List[ReviewComment]) -> float:
+    """Approximate LLM tokens needed to categorize a batch of comments"""
+    chars = sum(len(c.comment or '') + len(c.chunk or '') for c in comments)
+    return _REQUEST_OVERHEAD + chars / 4 + _COMMENT_OVERHEAD * len(comments)
+
+
+@dataclass
+class _Waiter:
+    cost: float
+    tenant: str
+    start_tag: float
+    finish_tag: float
+    enqueued: float
+    seq: int
+    future: asyncio.Future = field(repr=False)
+
+
+class CostScheduler:
+    """Admits LLM jobs into a fixed number of slots, ordered by estimated cost.
+
+    Policies:
+        fifo  - arrival order
+        sjf   - cheapest job first, with aging so big jobs can't starve
+        fair  - weighted fair queuing across tenants (by default, cost size
+                classes), so small and large jobs each get a share of slots
+
+    Jobs whose cost reaches `oversized_cost` may hold at most
+    `max_oversized_slots` slots at once, leaving the rest for smaller jobs.
+    """
+
+    def __init__(self, slots: int = 4, policy: str = 'sjf', oversized_cost: float = 30000,
+                 max_oversized_slots: int = 1, aging_seconds: float = 60.0,
+                 weights: Optional[Dict[str, float]] = None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy {policy!r}; expected one of {POLICIES}")
+        if slots < 1 or max_oversized_slots < 1:
+            raise ValueError("slots and max_oversized_slots must be at least 1")
+
+        self.slots = slots
+        self.policy = policy
+        self.oversized_cost = oversized_cost
+        self.max_oversized_slots = max_oversized_slots
+        self.aging_seconds = aging_seconds
+        self.weights = weights or {}
+
+        self._waiting: List[_Waiter] = []
+        self._in_flight = 0
+        self._oversized_in_flight = 0
+        self._seq = 0
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._dispatched = 0
+        self._max_wait = 0.0
+
+    async def run(self, cost: float, func: Callable[..., Awaitable[Any]], *args, tenant: Optional[str] = None) -> Any:
+        """Wait for a slot according to the policy, then await func(*args)"""
+        oversized = cost >= self.oversized_cost
+        await self._acquire(cost, tenant or self._size_class(cost))
+        try:
+            return await func(*args)
+        finally:
+            self._release(oversized)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'policy': self.policy,
+            'dispatched': self._dispatched,
+            'waiting': len(self._waiting),
+            'in_flight': self._in_flight,
+            'max_wait_seconds': self._max_wait,
+        }
+
+    async def _acquire(self, cost: float, tenant: str):
+        weight = self.weights.get(tenant, 1.0)
+        start_tag = max(self._virtual_time, self._last_finish.get(tenant, 0.0))
+        finish_tag = start_tag + cost / weight
+        self._last_finish[tenant] = finish_tag
+
+        waiter = _Waiter(cost, tenant, start_tag, finish_tag, time.monotonic(), self._seq,
+                         asyncio.get_running_loop().create_future())
+        self._seq += 1
+        self._waiting.append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter in self._waiting:
+                self._waiting.remove(waiter)
+            elif waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just before cancellation; hand it back
+                self._release(cost >= self.oversized_cost)
+            raise
+
+    def _release(self, oversized: bool):
+        self._in_flight -= 1
+        if oversized:
+            self._oversized_in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        while self._in_flight < self.slots and self._waiting:
+            oversized_full = self._oversized_in_flight >= self.max_oversized_slots
+            eligible = [
+                w for w in self._waiting
+                if not (oversized_full and w.cost >= self.oversized_cost)
+            ]
+            if not eligible:
+                return
+
+            waiter = min(eligible, key=lambda w: self._priority(w, now))
+            self._waiting.remove(waiter)
+
+            self._in_flight += 1
+            if waiter.cost >= self.oversized_cost:
+                self._oversized_in_flight += 1
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            self._dispatched += 1
+            self._max_wait = max(self._max_wait, now - waiter.enqueued)
+            waiter.future.set_result(None)
+
+    def _priority(self, waiter: _Waiter, now: float):
+        if self.policy == 'fifo':
+            return (waiter.seq,)
+        if self.policy == 'fair':
+            return (waiter.finish_tag, waiter.seq)
+        # Shortest job first; a job's effective cost shrinks the longer it waits
+        waited = now - waiter.enqueued
+        return (waiter.cost / (1.0 + waited / self.aging_seconds), waiter.seq)
+
+    @staticmethod
+    def _size_class(cost: float) -> str:
+        return f"size-{int(math.log10(max(cost, 1.0)))}"
@@ -0,0 +1,53 @@
+import asyncio
+import hashlib
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+def prompt_key(*parts: str) -> str:
+    """Stable key for a prompt (and e.g. the model it is sent to)"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one in-flight call.
+
+    The first caller for a key starts the call; callers arriving while it is
+    still running await the same result (or exception) instead of issuing
+    their own. Nothing is cached once the call finishes.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        task = self._in_flight.get(key)
+        if task is None:
+            self.calls += 1
+            task = asyncio.ensure_future(func(*args))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.coalesced += 1
+            logger.debug(f"Joining in-flight call {str(key)[:12]}")
+
+        # Shielded so one caller being cancelled doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def stats(self) -> Dict[str, int]:
+        return {'calls': self.calls, 'coalesced': self.coalesced}
+
+    def _finished(self, key: Hashable, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every caller was cancelled
+            task.exception()
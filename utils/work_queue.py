@@ -0,0 +1,197 @@
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+import logging
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING, LEASED, DONE, FAILED = 'pending', 'leased', 'done', 'failed'
+
+_SCHEMA = (
+    """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    lease_owner TEXT,
+    lease_token TEXT,
+    lease_expires REAL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)""",
+    "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, kind)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+)
+
+
+@dataclass
+class Lease:
+    job_id: str
+    kind: str
+    payload: Dict[str, Any]
+    token: str
+    attempts: int
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """Durable job queue in a SQLite file, shared by a coordinator and any number of workers.
+
+    Jobs are enqueued under caller-chosen IDs, so enqueueing the same job twice
+    is a no-op. Workers lease a job for a limited time and must complete it
+    (or renew the lease) before it expires; otherwise another worker can lease
+    it again, up to max_attempts. Every lease carries a fresh token, and only
+    the current holder's completion is accepted, so a worker that stalled past
+    its lease can't overwrite the outcome of the retry.
+    """
+
+    def __init__(self, path: str, timeout: float = 30.0):
+        self.path = path
+        self.timeout = timeout
+        with self._transaction() as db:
+            for statement in _SCHEMA:
+                db.execute(statement)
+
+    def enqueue(self, job_id: str, kind: str, payload: Dict[str, Any], max_attempts: int = 3) -> bool:
+        """Add a job unless one with this ID already exists; returns whether it was added"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO jobs (id, kind, payload, max_attempts, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload), max_attempts, now, now)
+            )
+            return cursor.rowcount == 1
+
+    def lease(self, worker_id: str, kinds: Optional[Iterable[str]] = None, lease_seconds: float = 300.0) -> Optional[Lease]:
+        """Claim the oldest available job (pending, or leased with an expired lease)"""
+        now = time.time()
+        kind_filter, params = "", [now]
+        if kinds:
+            kinds = list(kinds)
+            kind_filter = f" AND kind IN ({', '.join('?' for _ in kinds)})"
+            params.extend(kinds)
+
+        with self._transaction() as db:
+            # Expired leases that used up their attempts will never be retried
+            db.execute(
+                "UPDATE jobs SET status = ?, error = COALESCE(error, 'lease expired'), lease_token = NULL, updated_at = ? "
+                "WHERE status = ? AND lease_expires < ? AND attempts >= max_attempts",
+                (FAILED, now, LEASED, now)
+            )
+            row = db.execute(
+                "SELECT id, kind, payload, attempts FROM jobs "
+                "WHERE (status = 'pending' OR (status = 'leased' AND lease_expires < ?))" + kind_filter +
+                " ORDER BY created_at, id LIMIT 1",
+                params
+            ).fetchone()
+            if row is None:
+                return None
+
+            job_id, kind, payload, attempts = row
+            token = uuid.uuid4().hex
+            db.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, lease_owner = ?, lease_token = ?, "
+                "lease_expires = ?, updated_at = ? WHERE id = ?",
+                (LEASED, worker_id, token, now + lease_seconds, now, job_id)
+            )
+
+        if attempts:
+            logger.info(f"Retrying job {job_id} (attempt {attempts + 1})")
+        return Lease(job_id, kind, json.loads(payload), token, attempts + 1)
+
+    def renew(self, lease: Lease, lease_seconds: float = 300.0) -> bool:
+        """Extend a lease that is still held; returns False if it was lost"""
+        now = time.time()
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ? WHERE id = ? AND lease_token = ? AND status = ?",
+                (now + lease_seconds, now, lease.job_id, lease.token, LEASED)
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, lease: Lease) -> bool:
+        """Mark a leased job done; returns False if the lease was no longer held"""
+        return self._finish(lease, DONE, None)
+
+    def fail(self, lease: Lease, error: str, retryable: bool = True) -> bool:
+        """Release a job after an error, to be retried unless it is out of attempts"""
+        return self._finish(lease, PENDING if retryable else FAILED, error[:1000])
+
+    def set_closed(self, closed: bool):
+        """Mark whether more jobs may still be enqueued"""
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('closed', ?)", (json.dumps(closed),))
+
+    def is_closed(self) -> bool:
+        with self._transaction() as db:
+            row = db.execute("SELECT value FROM meta WHERE key = 'closed'").fetchone()
+        return bool(row and json.loads(row[0]))
+
+    def counts(self, kinds: Optional[Iterable[str]] = None) -> Dict[str, int]:
+        query, params = "SELECT status, COUNT(*) FROM jobs", []
+        if kinds:
+            kinds = list(kinds)
+            query += f" WHERE kind IN ({', '.join('?' for _ in kinds)})"
+            params = kinds
+        with self._transaction() as db:
+            counts = dict(db.execute(query + " GROUP BY status", params).fetchall())
+        return {status: counts.get(status, 0) for status in (PENDING, LEASED, DONE, FAILED)}
+
+    def jobs(self, status: Optional[str] = None, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        query, params = "SELECT id, kind, payload, status, attempts, error FROM jobs WHERE 1 = 1", []
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        with self._transaction() as db:
+            rows = db.execute(query + " ORDER BY created_at, id", params).fetchall()
+        return [
+            {'id': job_id, 'kind': kind, 'payload': json.loads(payload), 'status': status,
+             'attempts': attempts, 'error': error}
+            for job_id, kind, payload, status, attempts, error in rows
+        ]
+
+    def _finish(self, lease: Lease, status: str, error: Optional[str]) -> bool:
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET status = CASE WHEN ? = 'pending' AND attempts >= max_attempts THEN 'failed' ELSE ? END, "
+                "error = ?, lease_token = NULL, lease_expires = NULL, updated_at = ? "
+                "WHERE id = ? AND lease_token = ? AND status = ?",
+                (status, status, error, time.time(), lease.job_id, lease.token, LEASED)
+            )
+            accepted = cursor.rowcount == 1
+        if not accepted:
+            logger.warning(f"Lease on job {lease.job_id} was lost before it finished; discarding its outcome")
+        return accepted
+
+    @contextmanager
+    def _transaction(self):
+        # A connection per operation keeps the queue safe to use from threads and processes.
+        # BEGIN IMMEDIATE takes the write lock up front so two workers can't lease the same job.
+        db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                yield db
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+        finally:
+            db.close()
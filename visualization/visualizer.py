@@ -1,98 +1,243 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import seaborn as sns
-import numpy as np
+import csv
+import json
+import os
+import hashlib
+import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Callable
 from collections import defaultdict
 
+logger = logging.getLogger(__name__)
+
+# Bump when a chart or report layout changes so outputs from older code are redrawn
+RENDER_VERSION = 1
+PREVIEW_DPI = 72
+# Input hash of every output written to a directory, by file name
+MANIFEST_NAME = '.report_hashes.json'
+
+CATEGORY_METRICS = ['critical_bug_ratio', 'nitpick_ratio', 'other_ratio']
+CATEGORY_LABELS = ['Critical Bugs', 'Nitpicks', 'Other']
+CATEGORY_COLORS = ['#ff6b6b', '#4ecdc4', '#45b7d1']
+
+
 class ResultsVisualizer:
+    """Charts and reports for categorization results.
+
+    Every output is skipped when the file exists and was last written from
+    the same inputs (tracked in a manifest next to it) unless `force` is set;
+    the write methods return whether they wrote anything. Charts are drawn
+    with the object-oriented matplotlib API on one reused figure per chart,
+    which pyplot never sees, so rendering reports for many repos in one
+    process doesn't accumulate open figures.
+    """
+
+    _figures: Dict[str, Any] = {}
+
     @staticmethod
-    def create_impact_distribution_chart(metrics: Dict[str, Dict[str, float]], output_file: str):
+    def create_impact_distribution_chart(metrics: Dict[str, Dict[str, float]], output_file: str,
+                                         dpi: int = 300, force: bool = False) -> bool:
         """Create a stacked bar chart showing comment category distribution by bot"""
-        data = []
-        for bot, scores in metrics.items():
-            data.append({
-                'Bot': bot,
-                'Critical Bugs': scores['critical_bug_ratio'],
-                'Nitpicks': scores['nitpick_ratio'],
-                'Other': scores['other_ratio']
-            })
-
-        df = pd.DataFrame(data)
-
-        plt.figure(figsize=(12, 6))
-        ax = df.plot(
-            x='Bot',
-            y=['Critical Bugs', 'Nitpicks', 'Other'],
-            kind='bar',
-            stacked=True,
-            color=['#ff6b6b', '#4ecdc4', '#45b7d1']
+        return ResultsVisualizer._write_if_changed(
+            output_file, {'metrics': metrics, 'dpi': dpi}, force,
+            lambda: ResultsVisualizer._draw_impact_distribution(metrics, output_file, dpi)
         )
 
-        plt.title('Comment Category Distribution by Code Review Bot', pad=20, fontsize=14)
-        plt.xlabel('Bot', fontsize=12)
-        plt.ylabel('Ratio of Comments', fontsize=12)
-        plt.legend(title='Category', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=10)
-        plt.grid(axis='y', linestyle='--', alpha=0.7)
+    @staticmethod
+    def create_bot_comparison_chart(metrics: Dict[str, Dict[str, float]], output_file: str,
+                                    dpi: int = 300, force: bool = False) -> bool:
+        """Create a radar chart comparing different aspects of bot performance"""
+        return ResultsVisualizer._write_if_changed(
+            output_file, {'metrics': metrics, 'dpi': dpi}, force,
+            lambda: ResultsVisualizer._draw_bot_comparison(metrics, output_file, dpi)
+        )
+
+    @staticmethod
+    def _draw_impact_distribution(metrics: Dict[str, Dict[str, float]], output_file: str, dpi: int):
+        import numpy as np
 
-        # Add percentage labels
-        for c in ax.containers:
-            ax.bar_label(c, fmt='%.1f%%', label_type='center')
+        bots = list(metrics.keys())
+        positions = np.arange(len(bots))
+        bottom = np.zeros(len(bots))
+
+        fig = ResultsVisualizer._figure('impact_distribution', (12, 6))
+        try:
+            ax = fig.add_subplot()
+            for label, metric, color in zip(CATEGORY_LABELS, CATEGORY_METRICS, CATEGORY_COLORS):
+                values = np.array([metrics[bot][metric] for bot in bots], dtype=float)
+                bars = ax.bar(positions, values, width=0.5, bottom=bottom, color=color, label=label)
+                # Add percentage labels
+                ax.bar_label(bars, labels=[f'{value:.1%}' for value in values], label_type='center')
+                bottom += values
 
-        plt.tight_layout()
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
-        plt.close()
+            ax.set_xticks(positions)
+            ax.set_xticklabels(bots, rotation=90)
+            ax.set_title('Comment Category Distribution by Code Review Bot', pad=20, fontsize=14)
+            ax.set_xlabel('Bot', fontsize=12)
+            ax.set_ylabel('Ratio of Comments', fontsize=12)
+            ax.legend(title='Category', bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=10)
+            ax.grid(axis='y', linestyle='--', alpha=0.7)
+
+            fig.tight_layout()
+            fig.savefig(output_file, dpi=dpi, bbox_inches='tight')
+        finally:
+            fig.clear()
 
     @staticmethod
-    def create_bot_comparison_chart(metrics: Dict[str, Dict[str, float]], output_file: str):
-        """Create a radar chart comparing different aspects of bot performance"""
-        bots = list(metrics.keys())
-        metrics_list = ['critical_bug_ratio', 'nitpick_ratio', 'other_ratio']
-        
-        angles = np.linspace(0, 2*np.pi, len(metrics_list), endpoint=False)
+    def _draw_bot_comparison(metrics: Dict[str, Dict[str, float]], output_file: str, dpi: int):
+        import numpy as np
+
+        angles = np.linspace(0, 2*np.pi, len(CATEGORY_METRICS), endpoint=False)
         angles = np.concatenate((angles, [angles[0]]))
-        
-        fig, ax = plt.subplots(figsize=(10, 10), subplot_kw=dict(projection='polar'))
-        
-        for idx, bot in enumerate(bots):
-            values = [metrics[bot][m] for m in metrics_list]
-            values = np.concatenate((values, [values[0]]))
-            
-            ax.plot(angles, values, 'o-', linewidth=2, label=bot)
-            ax.fill(angles, values, alpha=0.25)
-        
-        ax.set_xticks(angles[:-1])
-        ax.set_xticklabels(['Critical Bugs', 'Nitpicks', 'Other'])
-        
-        plt.title('Bot Performance Comparison', pad=20, fontsize=14)
-        plt.legend(loc='upper right', bbox_to_anchor=(0.1, 0.1))
-        
-        plt.tight_layout()
-        plt.savefig(output_file, dpi=300, bbox_inches='tight')
-        plt.close()
+
+        fig = ResultsVisualizer._figure('bot_comparison', (10, 10))
+        try:
+            ax = fig.add_subplot(projection='polar')
+            for bot, scores in metrics.items():
+                values = [scores[m] for m in CATEGORY_METRICS]
+                values = np.concatenate((values, [values[0]]))
+
+                ax.plot(angles, values, 'o-', linewidth=2, label=bot)
+                ax.fill(angles, values, alpha=0.25)
+
+            ax.set_xticks(angles[:-1])
+            ax.set_xticklabels(CATEGORY_LABELS)
+            ax.set_title('Bot Performance Comparison', pad=20, fontsize=14)
+            ax.legend(loc='upper right', bbox_to_anchor=(0.1, 0.1))
+
+            fig.tight_layout()
+            fig.savefig(output_file, dpi=dpi, bbox_inches='tight')
+        finally:
+            fig.clear()
+
+    @staticmethod
+    def _figure(name: str, figsize):
+        """The reusable figure for a chart, emptied and ready to draw on"""
+        figure = ResultsVisualizer._figures.get(name)
+        if figure is None:
+            from matplotlib.figure import Figure
+            from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+            figure = Figure(figsize=figsize)
+            FigureCanvasAgg(figure)
+            ResultsVisualizer._figures[name] = figure
+        figure.clear()
+        return figure
 
     @staticmethod
-    def save_metrics_report(metrics: Dict[str, Dict[str, float]], output_file: str):
+    def save_metrics_report(metrics: Dict[str, Dict[str, float]], output_file: str, force: bool = False) -> bool:
         """Generate basic metrics report"""
-        with open(output_file, 'w') as f:
-            ResultsVisualizer._write_report_header(f)
-            ResultsVisualizer._write_overall_stats(f, metrics)
-            ResultsVisualizer._write_per_bot_analysis(f, metrics)
-            ResultsVisualizer._write_summary_table(f, metrics)
+        def write():
+            with open(output_file, 'w') as f:
+                ResultsVisualizer._write_report_header(f)
+                ResultsVisualizer._write_overall_stats(f, metrics)
+                ResultsVisualizer._write_per_bot_analysis(f, metrics)
+                ResultsVisualizer._write_summary_table(f, metrics)
+
+        return ResultsVisualizer._write_if_changed(output_file, metrics, force, write)
 
     @staticmethod
-    def save_detailed_report(analysis_results: Dict[str, Any], output_file: str):
+    def save_detailed_report(analysis_results: Dict[str, Any], output_file: str, force: bool = False) -> bool:
         """Generate detailed report including per-comment analysis"""
         metrics = analysis_results['metrics']
         classifications = analysis_results['classifications']
-        
-        with open(output_file, 'w') as f:
-            ResultsVisualizer._write_report_header(f)
-            ResultsVisualizer._write_overall_stats(f, metrics)
-            ResultsVisualizer._write_per_bot_analysis(f, metrics)
-            ResultsVisualizer._write_detailed_classifications(f, classifications)
-            ResultsVisualizer._write_summary_table(f, metrics)
+
+        def write():
+            with open(output_file, 'w') as f:
+                ResultsVisualizer._write_report_header(f)
+                ResultsVisualizer._write_overall_stats(f, metrics)
+                ResultsVisualizer._write_per_bot_analysis(f, metrics)
+                ResultsVisualizer._write_detailed_classifications(
+                    f, classifications, analysis_results.get('comments')
+                )
+                ResultsVisualizer._write_summary_table(f, metrics)
+                if 'sampling' in analysis_results:
+                    ResultsVisualizer._write_sampling_estimates(f, analysis_results['sampling'])
+                if 'pre_classification' in analysis_results:
+                    ResultsVisualizer._write_pre_classification_stats(f, analysis_results['pre_classification'])
+                if 'matching' in analysis_results:
+                    ResultsVisualizer._write_matching_stats(f, analysis_results['matching'])
+
+        return ResultsVisualizer._write_if_changed(output_file, analysis_results, force, write)
+
+    @staticmethod
+    def save_json_report(analysis_results: Dict[str, Any], output_file: str, force: bool = False) -> bool:
+        """Dump metrics and classifications as JSON"""
+        def write():
+            with open(output_file, 'w') as f:
+                json.dump(analysis_results, f, indent=2, default=ResultsVisualizer._json_default)
+
+        return ResultsVisualizer._write_if_changed(output_file, analysis_results, force, write)
+
+    @staticmethod
+    def save_csv_report(analysis_results: Dict[str, Any], output_file: str, force: bool = False) -> bool:
+        """Write one CSV row per classified comment"""
+        fields = ['bot_name', 'pr_number', 'comment_index', 'file_name', 'line_nums', 'category', 'reasoning', 'comment']
+        comment_table = analysis_results.get('comments')
+
+        def write():
+            with open(output_file, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=fields, extrasaction='ignore')
+                writer.writeheader()
+                for bot_name, pr_data in analysis_results['classifications'].items():
+                    for pr_number, comments in pr_data.items():
+                        for record in comments:
+                            comment = ResultsVisualizer._resolve_record(record, comment_table)
+                            writer.writerow({**comment, 'bot_name': bot_name, 'pr_number': pr_number})
+
+        inputs = {'classifications': analysis_results['classifications'], 'comments': comment_table}
+        return ResultsVisualizer._write_if_changed(output_file, inputs, force, write)
+
+    @staticmethod
+    def _write_if_changed(output_file: str, inputs: Any, force: bool, write: Callable[[], None]) -> bool:
+        """Call `write` unless output_file exists and was last written from the same inputs"""
+        digest = hashlib.sha256(
+            json.dumps([RENDER_VERSION, inputs], default=ResultsVisualizer._json_default).encode('utf-8')
+        ).hexdigest()
+        manifest_path = os.path.join(os.path.dirname(output_file) or '.', MANIFEST_NAME)
+        name = os.path.basename(output_file)
+
+        if not force and os.path.exists(output_file) and \
+                ResultsVisualizer._read_manifest(manifest_path).get(name) == digest:
+            logger.debug(f"Skipping {output_file}: inputs unchanged")
+            return False
+
+        write()
+        # Re-read so entries written meanwhile for other outputs in the directory are kept
+        manifest = ResultsVisualizer._read_manifest(manifest_path)
+        manifest[name] = digest
+        tmp_path = f"{manifest_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, manifest_path)
+        return True
+
+    @staticmethod
+    def _read_manifest(manifest_path: str) -> Dict[str, str]:
+        try:
+            with open(manifest_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _resolve_record(record: Dict[str, Any], comment_table) -> Dict[str, Any]:
+        """Expand a classification record that references its comment by ID"""
+        if 'comment_id' not in record or comment_table is None:
+            return record
+        comment = comment_table[record['comment_id']]
+        return {
+            **record,
+            'file_name': comment.file_name,
+            'line_nums': comment.line_nums,
+            'comment': comment.comment,
+            'code_chunk': comment.chunk
+        }
+
+    @staticmethod
+    def _json_default(obj):
+        if hasattr(obj, 'to_records'):
+            return obj.to_records()
+        return str(obj)
 
     @staticmethod
     def _write_report_header(f):
@@ -138,7 +283,7 @@ class ResultsVisualizer:
             f.write(f"- Other Comments: {other_count}\n\n")
 
     @staticmethod
-    def _write_detailed_classifications(f, classifications):
+    def _write_detailed_classifications(f, classifications, comment_table=None):
         f.write("\nDetailed Classifications\n")
         f.write("=" * 80 + "\n")
         
@@ -152,7 +297,8 @@ class ResultsVisualizer:
                 
                 # Group comments by category
                 grouped_comments = defaultdict(list)
-                for comment in comments:
+                for record in comments:
+                    comment = ResultsVisualizer._resolve_record(record, comment_table)
                     grouped_comments[comment['category']].append(comment)
                 
                 for category in ['CRITICAL_BUG', 'NITPICK', 'OTHER']:
@@ -189,3 +335,58 @@ class ResultsVisualizer:
 
         f.write("\nNote: Percentages may not sum to 100% due to rounding\n")
 
+    @staticmethod
+    def _write_pre_classification_stats(f, stats):
+        f.write("\nLocal Pre-Classification\n")
+        f.write("=" * 80 + "\n")
+        f.write(f"Labeled locally: {stats['pre_classified']} ({stats['skip_ratio']:.1%})\n")
+        f.write(f"Forwarded to LLM: {stats['forwarded']}\n")
+        f.write(f"Audited against LLM: {stats['audited']}\n")
+
+        if stats['agreement']:
+            f.write(f"\n{'Rule':<25} {'Agree':<10} {'Total':<10} {'Rate':<10}\n")
+            f.write("-" * 55 + "\n")
+            for rule, counts in stats['agreement'].items():
+                rate = f"{counts['rate']:.0%}" if counts['rate'] is not None else "n/a"
+                f.write(f"{rule:<25} {counts['agree']:<10} {counts['total']:<10} {rate:<10}\n")
+
+    @staticmethod
+    def _write_sampling_estimates(f, estimates):
+        f.write("\nSampled Estimates with Confidence Intervals\n")
+        f.write("=" * 80 + "\n")
+        f.write(f"{'Bot Name':<20} {'Sampled':<16} {'Critical':<20} {'Nitpicks':<20} {'Other':<20}\n")
+        f.write("-" * 96 + "\n")
+
+        for bot, estimate in estimates.items():
+            sampled = f"{estimate['sampled']}/{estimate['population']}"
+            intervals = [
+                f"{e['estimate']:.0%} [{e['ci_low']:.0%}-{e['ci_high']:.0%}]"
+                for e in (estimate['critical_bug_ratio'], estimate['nitpick_ratio'], estimate['other_ratio'])
+            ]
+            f.write(f"{bot:<20} {sampled:<16} {intervals[0]:<20} {intervals[1]:<20} {intervals[2]:<20}\n")
+
+        f.write("\nNote: Ratios above are estimated from a stratified sample of comments\n")
+
+    @staticmethod
+    def _write_matching_stats(f, matching):
+        f.write(f"\nAgreement with {matching['reference']} Findings ({matching['reference_findings']} findings)\n")
+        f.write("=" * 80 + "\n")
+        f.write(f"{'Bot Name':<20} {'Comments':<10} {'Matched':<10} {'Precision':<10} {'Recall':<10} {'Recall*':<10}\n")
+        f.write("-" * 70 + "\n")
+        for bot, scores in matching['bots'].items():
+            f.write(
+                f"{bot:<20} {scores['comments']:<10} {scores['matched_comments']:<10} "
+                f"{scores['precision']:<10.1%} {scores['recall']:<10.1%} {scores['recall_on_reviewed_prs']:<10.1%}\n"
+            )
+        f.write("\n* Recall counting only findings on PRs the bot commented on\n")
+
+        pairs = [
+            (first, second, overlap)
+            for first, others in matching['overlap'].items()
+            for second, overlap in others.items()
+        ]
+        if pairs:
+            f.write(f"\n{'Bots':<41} {'Both caught':<12} {'Jaccard':<10}\n")
+            f.write("-" * 63 + "\n")
+            for first, second, overlap in pairs:
+                f.write(f"{first + ' / ' + second:<41} {overlap['both']:<12} {overlap['jaccard']:<10.1%}\n")